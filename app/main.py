@@ -1,8 +1,13 @@
 """main application entry point."""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.middleware.cache_middleware import ResponseCacheMiddleware
 from app.middleware.logging_middleware import LoggingMiddleware
 from app.routers import (
     bioentity,
@@ -17,6 +22,75 @@ from app.routers import (
     slimmer,
     users_and_groups,
 )
+from app.utils.cache_utils import (
+    get_facet_cache,
+    get_idmapping_cache,
+    get_response_cache,
+    get_term_cache,
+    run_periodically,
+)
+from app.utils.closure_utils import load_closure_index
+from app.utils.http_utils import close_async_clients, get_async_client, single_flight_stats
+from app.utils.ontology_utils import refresh_ontology_subsets, sync_ontology_release
+from app.utils.prefix_utils import get_converter, get_prefix_list
+from app.utils.settings import (
+    get_closure_index_config,
+    get_release_check_interval,
+    get_stats_log_interval,
+    get_subsets_refresh_interval,
+)
+
+logger = logging.getLogger()
+
+
+async def sync_release():
+    """Check for a new ontology release, rebuilding the closure index if it changed."""
+    index_config = get_closure_index_config()
+    if await sync_ontology_release() and index_config["enabled"] and index_config["rebuild_on_release"]:
+        await load_closure_index()
+
+
+async def log_stats():
+    """Log the upstream request counters and the in-process cache counters of this worker."""
+    logger.info("Upstream requests: %s", single_flight_stats())
+    for name, cache in [
+        ("Term", get_term_cache()),
+        ("Facet", get_facet_cache()),
+        ("Identifier mapping", get_idmapping_cache()),
+        ("Response", get_response_cache()),
+    ]:
+        logger.info("%s cache: %s", name, cache.stats())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open the pooled upstream clients, build the prefix converter and start the background tasks on startup.
+
+    The release is checked before serving, as the shared cache outlives restarts and may hold the results of the
+    previous release.
+    """
+    get_async_client("solr_url")
+    get_async_client("sparql_url")
+    await get_converter()
+    get_prefix_list()
+    try:
+        await sync_release()
+    except Exception:
+        logger.exception("Could not check the ontology release at startup")
+    background_tasks = [
+        asyncio.create_task(run_periodically(get_release_check_interval(), sync_release)),
+        asyncio.create_task(run_periodically(get_subsets_refresh_interval(), refresh_ontology_subsets)),
+        asyncio.create_task(run_periodically(get_stats_log_interval(), log_stats)),
+    ]
+    if get_closure_index_config()["enabled"]:
+        # the ontology endpoints use GOlr until the index is loaded
+        background_tasks.append(asyncio.create_task(load_closure_index()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await close_async_clients()
+
 
 app = FastAPI(
     title="GO API",
@@ -28,6 +102,7 @@ app = FastAPI(
         "email": "help@geneontology.org",
     },
     license_info={"name": "BSD3"},
+    lifespan=lifespan,
 )
 app.include_router(ontology.router)
 app.include_router(bioentity.router)
@@ -41,6 +116,8 @@ app.include_router(search.router)
 app.include_router(publications.router)
 app.include_router(users_and_groups.router)
 
+# Response cache, inside the logging middleware so that cache hits are logged too
+app.add_middleware(ResponseCacheMiddleware)
 # Logging
 app.add_middleware(LoggingMiddleware)
 # CORS
@@ -50,6 +127,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # the cursor of the next page of the bioentity endpoints, and the headers of the response cache
+    expose_headers=["X-Next-Cursor", "ETag", "X-Cache"],
 )
 
 if __name__ == "__main__":
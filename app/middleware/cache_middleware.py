@@ -0,0 +1,208 @@
+"""Middleware to cache the responses of the routes that are stable between data releases."""
+import asyncio
+import gzip
+import hashlib
+import logging
+from urllib.parse import urlencode
+
+from fastapi import Request
+from starlette.datastructures import Headers
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+from app.utils.cache_utils import get_response_cache
+from app.utils.settings import get_cache_config
+
+logger = logging.getLogger()
+
+# the attribute of an endpoint holding its cache policy, see cache_response
+CACHE_POLICY_ATTRIBUTE = "cache_policy"
+# responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+# the response headers kept in the cache
+CACHED_HEADERS = ("content-type",)
+
+
+def cache_response(max_age: int = None):
+    """
+    Mark a route as cacheable by the response cache middleware.
+
+    Only the 200 responses of GET requests are cached, keyed by path and query parameters; use it on routes whose
+    responses only depend on those and on the data release.
+
+    :param max_age: The number of seconds the response is cached (by the API and by clients), if not the ttl of
+        the responses cache in conf/config.yaml.
+    :return: The decorator, to put under the route decorator.
+    """
+
+    def decorate(endpoint):
+        setattr(endpoint, CACHE_POLICY_ATTRIBUTE, {"max_age": max_age})
+        return endpoint
+
+    return decorate
+
+
+class CachedResponse:
+
+    """A cached response body, with its gzip variant and their ETags."""
+
+    def __init__(self, body: bytes, headers, max_age: int):
+        """Digest and compress a response body."""
+        self.body = body
+        self.headers = headers
+        self.max_age = max_age
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.etag = '"{}"'.format(digest)
+        # the gzip variant is another representation, so it has a strong ETag of its own
+        self.gzip_etag = '"{}-gz"'.format(digest)
+        self.gzip_body = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_SIZE else None
+
+    def __sizeof__(self):
+        """Return the size of the response, for the byte limit of the cache."""
+        return object.__sizeof__(self) + len(self.body) + len(self.gzip_body or b"")
+
+    @staticmethod
+    def matches(if_none_match: str, etag: str):
+        """Return whether an If-None-Match header matches an ETag, with the weak comparison of RFC 9110."""
+        etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in etags or etag in etags
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+
+    """
+    Middleware answering the GET requests of the cacheable routes from the response cache.
+
+    Expired responses are still served for the max_stale seconds of the cache, while a background request to the
+    app recomputes them (stale-while-revalidate), so that a slow or failing upstream does not slow these routes
+    down.
+    """
+
+    def __init__(self, app):
+        """Create the middleware, with no revalidation running."""
+        super().__init__(app)
+        # the revalidation task of each stale key, so that a key is revalidated once at a time
+        self._revalidations = {}
+
+    async def dispatch(self, request: Request, call_next):
+        """
+        Answer a request from the response cache, or cache its response if its route is cacheable.
+
+        :param request: The request.
+        :param call_next: The next call.
+        :return: The response; 304 if the If-None-Match header of the request has the ETag of the response.
+        """
+        if request.method != "GET":
+            return await call_next(request)
+
+        key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+        entry = get_response_cache().get_with_age(key)
+        if entry is not None:
+            cached, age, stale = entry
+            if stale:
+                self.revalidate(key, request.scope)
+            return cached_response(request, cached, "STALE" if stale else "HIT", age)
+
+        response = await call_next(request)
+        policy = getattr(request.scope.get("endpoint"), CACHE_POLICY_ATTRIBUTE, None)
+        if policy is None or response.status_code != 200 or "content-encoding" in response.headers:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        return cached_response(request, store(key, policy, body, response.headers), "MISS")
+
+    def revalidate(self, key: str, scope):
+        """
+        Recompute the response of a stale key in the background, unless it is already being recomputed.
+
+        :param key: The key of the response.
+        :param scope: The ASGI scope of a request for the key.
+        """
+        task = self._revalidations.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            # a shallow copy, as the router adds the route to the scope
+            task = asyncio.ensure_future(self._revalidate(key, dict(scope)))
+            self._revalidations[key] = task
+            task.add_done_callback(lambda done: self._revalidated(key, done))
+
+    def _revalidated(self, key: str, task):
+        if self._revalidations.get(key) is task:
+            del self._revalidations[key]
+
+    async def _revalidate(self, key: str, scope):
+        """Send a request to the app, and cache its response if it succeeded; the stale response is kept if not."""
+        start = {}
+        body = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception as e:
+            logger.warning("Error while revalidating %s: %s", key, e)
+            return
+        headers = Headers(raw=start.get("headers", []))
+        policy = getattr(scope.get("endpoint"), CACHE_POLICY_ATTRIBUTE, None)
+        if policy is None or start.get("status") != 200 or "content-encoding" in headers:
+            logger.warning("Revalidating %s returned %s, serving the stale response", key, start.get("status"))
+            return
+        store(key, policy, b"".join(body), headers)
+
+
+def store(key: str, policy, body: bytes, headers):
+    """
+    Cache a response.
+
+    :param key: The key of the response.
+    :param policy: The cache policy of its route, see cache_response.
+    :param body: The body of the response.
+    :param headers: The headers of the response.
+    :return: The cached response.
+    :rtype: CachedResponse
+    """
+    max_age = policy["max_age"] if policy["max_age"] is not None else get_cache_config("responses")["ttl"]
+    cached = CachedResponse(body, {name: headers[name] for name in CACHED_HEADERS if name in headers}, max_age)
+    get_response_cache().set(key, cached, ttl=max_age)
+    return cached
+
+
+def cached_response(request: Request, cached: CachedResponse, status: str, age: float = None):
+    """
+    Build the response of a request from a cached response.
+
+    :param request: The request.
+    :param cached: The cached response.
+    :param status: HIT, STALE or MISS, for the X-Cache header.
+    :param age: The number of seconds since the response was computed, for the Age header; None if it was just
+        computed.
+    :return: A 304 response if the client has the response already, else the response, gzipped if the client
+        accepts it.
+    """
+    gzipped = cached.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", "")
+    etag = cached.gzip_etag if gzipped else cached.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age={}, stale-while-revalidate={}".format(
+            cached.max_age, int(get_response_cache().max_stale)
+        ),
+        "Vary": "Accept-Encoding",
+        "X-Cache": status,
+    }
+    if age is not None:
+        headers["Age"] = str(int(age))
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and cached.matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    headers.update(cached.headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(cached.gzip_body, headers=headers)
+    return Response(cached.body, headers=headers)
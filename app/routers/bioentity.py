@@ -1,13 +1,30 @@
 """bioentity router."""
 import logging
+import re
 from enum import Enum
 from typing import List
+from urllib.parse import quote
 
-from fastapi import APIRouter, Path, Query
+import httpx
+from fastapi import APIRouter, HTTPException, Path, Query, Response
+from fastapi.responses import StreamingResponse
 from ontobio.config import get_config
 from ontobio.golr.golr_associations import search_associations
-
-from app.utils.golr_utils import gu_run_solr_text_on
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.association_utils import search_associations_by_subject, search_associations_page
+from app.utils.cache_utils import get_facet_cache
+from app.utils.export_utils import EXPORT_MEDIA_TYPES, stream_export
+from app.utils.golr_utils import (
+    decode_cursor,
+    encode_cursor,
+    gu_run_solr_text_on,
+    gu_run_solr_text_page_on,
+    gu_run_solr_text_pivot_on,
+    iterate_solr_on,
+)
+from app.utils.idmapping_utils import genes_to_uniprot
 from app.utils.settings import ESOLR, ESOLRDoc, get_user_agent
 
 from .slimmer import gene_to_uniprot_from_mygene
@@ -24,6 +41,39 @@ TYPE_PUBLICATION = "publication"
 
 categories = [TYPE_GENE, TYPE_PUBLICATION, TYPE_PATHWAY, TYPE_GOTERM]
 USER_AGENT = get_user_agent()
+# the response header with the cursor of the next page, see parse_cursor
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+CURSOR_DESCRIPTION = (
+    "Cursor for deep pagination: * for the first page, then the " + NEXT_CURSOR_HEADER + " response header of the "
+    "previous page, which is missing after the last page. start is ignored when a cursor is given."
+)
+# maximum number of results of a page walked with a cursor
+MAX_CURSOR_ROWS = 1000
+# maximum number of genes of a multi-gene annotation request
+MAX_BATCH_GENES = 1000
+# the annotation fields of the exports, in column order
+EXPORT_FIELDS = [
+    "bioentity",
+    "bioentity_label",
+    "bioentity_name",
+    "type",
+    "taxon",
+    "taxon_label",
+    "qualifier",
+    "annotation_class",
+    "annotation_class_label",
+    "aspect",
+    "evidence_type",
+    "evidence_with",
+    "reference",
+    "annotation_extension_class",
+    "assigned_by",
+    "date",
+]
+# number of annotations fetched per GOlr request by the exports
+EXPORT_PAGE_SIZE = 1000
+# the characters replaced in the file names of the exports, so that they can be quoted in a header
+UNSAFE_FILENAME_CHARACTERS = re.compile(r"[^A-Za-z0-9._-]")
 
 logger = logging.getLogger()
 
@@ -43,11 +93,67 @@ class RelationshipType(str, Enum):
     INVOLVED_IN_REGULATION_OF = INVOLVED_IN_REGULATION_OF
 
 
+class ExportFormat(str, Enum):
+
+    """Format of the annotation exports."""
+
+    ndjson = "ndjson"
+    tsv = "tsv"
+
+
 router = APIRouter()
 
 
+class GeneFunctionRequest(BaseModel):
+
+    """Body of a multi-gene annotation request."""
+
+    gene: List[str]
+    slim: List[str] = None
+
+
+def parse_cursor(cursor: str, rows: int):
+    """
+    Decode the cursor of a request.
+
+    :param cursor: The cursor, * for the first page.
+    :param rows: The number of results per page, at most MAX_CURSOR_ROWS.
+    :return: The state of the cursor, with its solr cursorMark in "mark".
+    :raises HTTPException: If the cursor is invalid, or the pages are too large.
+    """
+    if rows > MAX_CURSOR_ROWS:
+        raise HTTPException(status_code=400, detail="rows must be at most {} with a cursor".format(MAX_CURSOR_ROWS))
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+def set_next_cursor(response: Response, next_cursor_mark: str, **state):
+    """Set the cursor of the next page, if any, in the response headers."""
+    if next_cursor_mark is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_cursor_mark, **state)
+
+
+async def fetch_page(page, name: str):
+    """
+    Wait for a page of GOlr results, reporting an unavailable GOlr as a 502.
+
+    :param page: The awaitable returning the page, e.g. a search_associations_page call.
+    :param name: What the page is about, for the logs.
+    :return: The result of page.
+    :raises HTTPException: If the GOlr request failed.
+    """
+    try:
+        return await page
+    except httpx.HTTPError as e:
+        logger.error("Error while fetching a page of %s: %s", name, e)
+        raise HTTPException(status_code=502, detail="GOlr request failed: {}".format(e)) from e
+
+
 @router.get("/api/bioentity/{id}", tags=["bioentity"], description="Get bio-entities (genes) by their identifiers.")
 async def get_bioentity_by_id(
+    response: Response,
     id: str = Path(
         ...,
         description="The CURIE of the gene to be retrieved. (e.g. ZFIN:ZDB-GENE-990415-44)",
@@ -55,6 +161,7 @@ async def get_bioentity_by_id(
     ),
     start: int = Query(0, description="The starting index for pagination."),
     rows: int = Query(100, description="The number of results per page."),
+    cursor: str = Query(None, description=CURSOR_DESCRIPTION),
 ):
     """
     Get bio-entities (genes) by their identifiers.
@@ -64,6 +171,7 @@ async def get_bioentity_by_id(
     :param id: The CURIE identifier of the bioentity to be retrieved. (required)
     :param start: The starting index for pagination.
     :param rows: The number of results per page.
+    :param cursor: The cursor of the page, for deep pagination instead of start.
 
     :return: A dictionary containing the bioentity information retrieved from the database.
              The dictionary will contain fields such as 'id', 'bioentity_name', 'synonym', 'taxon',
@@ -93,9 +201,25 @@ async def get_bioentity_by_id(
     query_filters = "bioentity%5E2"
     logger.info(id)
 
+    if cursor is not None:
+        bioentity, next_cursor_mark = await fetch_page(
+            gu_run_solr_text_page_on(
+                ESOLR.GOLR,
+                ESOLRDoc.BIOENTITY,
+                id,
+                query_filters,
+                fields,
+                "&defType=edismax&rows=" + str(rows),
+                parse_cursor(cursor, rows)["mark"],
+            ),
+            id,
+        )
+        set_next_cursor(response, next_cursor_mark)
+        return bioentity
+
     optionals = "&defType=edismax&start=" + str(start) + "&rows=" + str(rows)
     # id here is passed to solr q parameter, query_filters go to the boost, fields are what's returned
-    bioentity = gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.BIOENTITY, id, query_filters, fields, optionals, False)
+    bioentity = await gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.BIOENTITY, id, query_filters, fields, optionals, False)
     return bioentity
 
 
@@ -105,6 +229,7 @@ async def get_bioentity_by_id(
     description="Get gene or gene product information via a GO term id, e.g. GO:0044598.",
 )
 async def get_annotations_by_goterm_id(
+    response: Response,
     id: str = Path(
         ...,
         description="The CURIE of the GO term to be used for annotation retrieval. (e.g. GO:0044598)",
@@ -113,6 +238,7 @@ async def get_annotations_by_goterm_id(
     evidence: List[str] = Query(None),
     start: int = Query(0, description="The starting index for pagination."),
     rows: int = Query(100, description="The number of results per page."),
+    cursor: str = Query(None, description=CURSOR_DESCRIPTION),
 ):
     """
     Returns annotations using the provided GO term.
@@ -124,6 +250,7 @@ async def get_annotations_by_goterm_id(
     :param evidence: List of evidence codes to filter the results.
     :param start: The starting index for pagination.
     :param rows: The number of results per page.
+    :param cursor: The cursor of the page, for deep pagination instead of start.
 
     :return: A dictionary containing the annotation information retrieved from the database.
              The dictionary will contain fields such as 'date', 'assigned_by', 'bioentity_label',
@@ -168,8 +295,24 @@ async def get_annotations_by_goterm_id(
         evidence = evidence[:-1]
         evidence += ")"
 
+    if cursor is not None:
+        data, next_cursor_mark = await fetch_page(
+            gu_run_solr_text_page_on(
+                ESOLR.GOLR,
+                ESOLRDoc.ANNOTATION,
+                id,
+                query_filters,
+                fields,
+                "&defType=edismax&rows=" + str(rows) + evidence,
+                parse_cursor(cursor, rows)["mark"],
+            ),
+            id,
+        )
+        set_next_cursor(response, next_cursor_mark)
+        return data
+
     optionals = "&defType=edismax&start=" + str(start) + "&rows=" + str(rows) + evidence
-    data = gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ANNOTATION, id, query_filters, fields, optionals, False)
+    data = await gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ANNOTATION, id, query_filters, fields, optionals, False)
 
     return data
 
@@ -180,6 +323,7 @@ async def get_annotations_by_goterm_id(
     description="Returns genes annotated to the provided GO Term. e.g. GO:0044598",
 )
 async def get_genes_by_goterm_id(
+    response: Response,
     id: str = Path(
         ...,
         description="The CURIE of the GO term to be used for gene retrieval. (e.g. GO:0044598)",
@@ -201,6 +345,7 @@ async def get_genes_by_goterm_id(
     ),
     start: int = Query(0, description="The starting index for pagination."),
     rows: int = Query(100, description="The number of results per page."),
+    cursor: str = Query(None, description=CURSOR_DESCRIPTION),
 ):
     """
     Returns genes annotated to the provided GO Term.
@@ -216,6 +361,7 @@ async def get_genes_by_goterm_id(
     :param slim: Map objects up slim to a higher-level category. Value can be an ontology class ID or subset ID.
     :param start: The starting index for pagination.
     :param rows: The number of results per page.
+    :param cursor: The cursor of the page, for deep pagination instead of start.
 
     :return: A dictionary containing the gene annotation information retrieved from the database.
              The dictionary will contain fields such as 'date', 'assigned_by', 'bioentity_label',
@@ -226,9 +372,9 @@ async def get_genes_by_goterm_id(
     """
     if rows is None:
         rows = 100000
-    association_return = {}
+    search = {}
     if relationship_type == ACTS_UPSTREAM_OF_OR_WITHIN:
-        association_return = search_associations(
+        search = dict(
             subject_category="gene",
             use_compact_associations=True,
             object_category="function",
@@ -246,7 +392,7 @@ async def get_genes_by_goterm_id(
     elif relationship_type == INVOLVED_IN_REGULATION_OF:
         # Temporary fix until https://github.com/geneontology/amigo/pull/469
         # and https://github.com/owlcollab/owltools/issues/241 are resolved
-        association_return = search_associations(
+        search = dict(
             subject_category="gene",
             object_category="function",
             fq={
@@ -263,7 +409,7 @@ async def get_genes_by_goterm_id(
             rows=rows,
         )
     elif relationship_type == INVOLVED_IN:
-        association_return = search_associations(
+        search = dict(
             subject_category="gene",
             object_category="function",
             subject=id,
@@ -273,6 +419,15 @@ async def get_genes_by_goterm_id(
             url=ESOLR.GOLR,
             rows=rows,
         )
+    if not search:
+        return {"associations": None}
+    if cursor is not None:
+        association_return, next_cursor_mark = await fetch_page(
+            search_associations_page(parse_cursor(cursor, rows)["mark"], **search), id
+        )
+        set_next_cursor(response, next_cursor_mark)
+    else:
+        association_return = await run_in_threadpool(search_associations, **search)
     return {"associations": association_return.get("associations")}
 
 
@@ -294,6 +449,11 @@ async def get_taxon_by_goterm_id(
     ),
     start: int = Query(0, description="The starting index for pagination."),
     rows: int = Query(100, description="The number of results per page."),
+    facet: bool = Query(
+        False,
+        description="Return the number of annotations of each taxon, counted by GOlr over all the annotations, "
+        "as a {taxon: {label, count}} map (start and rows are ignored)",
+    ),
 ):
     """
     Returns taxon information for genes annotated to the provided GO term.
@@ -306,9 +466,11 @@ async def get_taxon_by_goterm_id(
                      Example: ['ECO:0000501', 'ZFIN:ZDB-PUB-060503-2'].
     :param start: The starting index for pagination.
     :param rows: The number of results per page.
+    :param facet: Whether to return the annotation counts of each taxon instead of a page of annotations.
 
     :return: A dictionary containing the taxon information for genes annotated to the provided GO term.
              The dictionary will contain fields such as 'taxon' and 'taxon_label' associated with the genes.
+             With facet, a dictionary of taxon CURIE -> {label, count}, the most annotated taxa first.
     """
     if rows is None:
         rows = 100000
@@ -340,18 +502,54 @@ async def get_taxon_by_goterm_id(
         taxon_restrictions = taxon_restrictions[:-1]
         taxon_restrictions += ")"
 
+    if facet:
+        return await get_taxon_counts(id, query_filters, "&defType=edismax" + evidence + taxon_restrictions)
+
     optionals = "&defType=edismax&start=" + str(start) + "&rows=" + str(rows) + evidence + taxon_restrictions
-    data = gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ANNOTATION, id, query_filters, fields, optionals, False)
+    data = await gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ANNOTATION, id, query_filters, fields, optionals, False)
 
     return data
 
 
+async def get_taxon_counts(id: str, query_filters: str, optionals: str):
+    """
+    Count the annotations of each taxon with a GOlr facet pivot, from the facet cache when possible.
+
+    :param id: The GO term, the query of the text search.
+    :param query_filters: The qf parameters of the text search.
+    :param optionals: The other parameters of the text search, i.e. its filters.
+    :return: A dictionary of taxon CURIE -> {label, count}, by decreasing count.
+    :raises HTTPException: If the GOlr request failed.
+    """
+    cache = get_facet_cache()
+    key = ("taxons", id, optionals)
+    taxon_counts = cache.get(key)
+    if taxon_counts is None:
+        try:
+            pivots = await gu_run_solr_text_pivot_on(
+                ESOLR.GOLR, ESOLRDoc.ANNOTATION, id, query_filters, optionals, "taxon,taxon_label"
+            )
+        except httpx.HTTPError as e:
+            logger.error("Error while counting the annotations of %s by taxon: %s", id, e)
+            raise HTTPException(status_code=502, detail="GOlr request failed: {}".format(e)) from e
+        taxon_counts = {
+            pivot["value"]: {
+                "label": pivot["pivot"][0]["value"] if pivot.get("pivot") else None,
+                "count": pivot["count"],
+            }
+            for pivot in sorted(pivots, key=lambda pivot: (-pivot["count"], pivot["value"]))
+        }
+        cache.set(key, taxon_counts)
+    return taxon_counts
+
+
 @router.get(
     "/api/bioentity/gene/{id}/function",
     tags=["bioentity"],
     description="Returns GO terms associated with a gene, e.g. ZFIN:ZDB-GENE-050417-357",
 )
 async def get_annotations_by_gene_id(
+    response: Response,
     id: str = Path(
         ...,
         description="The CURIE identifier of the gene for which GO term associations are retrieved."
@@ -364,6 +562,7 @@ async def get_annotations_by_gene_id(
     ),
     start: int = Query(0, description="The starting index for pagination."),
     rows: int = Query(100, description="The number of results per page."),
+    cursor: str = Query(None, description=CURSOR_DESCRIPTION),
 ):
     """
     Returns GO terms associated with a gene.
@@ -375,6 +574,7 @@ async def get_annotations_by_gene_id(
     :param slim: Map objects up slim to a higher-level category. Value can be an ontology class ID or subset ID.
     :param start: The starting index for pagination.
     :param rows: The number of results per page.
+    :param cursor: The cursor of the page, for deep pagination instead of start.
 
     :return: A dictionary containing the GO term associations for the provided gene.
              The dictionary will contain fields such as 'numFound' and 'associations' associated with the gene.
@@ -400,7 +600,25 @@ async def get_annotations_by_gene_id(
     if id.startswith("MGI:MGI:"):
         id = id.replace("MGI:MGI:", "MGI:")
 
-    assocs = search_associations(
+    if cursor is not None:
+        state = parse_cursor(cursor, rows)
+        # the UniProtKB proteins the query fell back to are kept in the cursor of the next pages
+        subjects = state.get("subjects", [id])
+        search = dict(object_category="function", user_agent=USER_AGENT, url=ESOLR.GOLR, rows=rows, slim=slim)
+        assocs, next_cursor_mark = await fetch_page(
+            search_associations_page(state["mark"], subjects=subjects, **search), id
+        )
+        if state["mark"] == "*" and "subjects" not in state and len(assocs["associations"]) == 0:
+            subjects = await gene_to_uniprot_from_mygene(id)
+            if subjects:
+                assocs, next_cursor_mark = await fetch_page(
+                    search_associations_page("*", subjects=subjects, **search), id
+                )
+        set_next_cursor(response, next_cursor_mark, **({"subjects": subjects} if subjects != [id] else {}))
+        return {"associations": assocs.get("associations")}
+
+    assocs = await run_in_threadpool(
+        search_associations,
         object_category="function",
         subject_category="gene",
         subject=id,
@@ -419,22 +637,138 @@ async def get_annotations_by_gene_id(
         # sources: https://github.com/biolink/biolink-api/issues/66
         # https://github.com/monarch-initiative/dipper/issues/461
         # prots = scigraph.gene_to_uniprot_proteins(id)
-        prots = gene_to_uniprot_from_mygene(id)
-        for prot in prots:
-            pr_assocs = search_associations(
+        prots = await gene_to_uniprot_from_mygene(id)
+        if prots:
+            # a single query over all the proteins, so that each annotation comes once, numFound is their combined
+            # count and start and rows page through all of them
+            assocs = await run_in_threadpool(
+                search_associations,
                 object_category="function",
-                subject=prot,
+                subjects=list(dict.fromkeys(prots)),
                 user_agent=USER_AGENT,
                 url=ESOLR.GOLR,
                 start=start,
                 rows=rows,
                 slim=slim,
             )
-            num_found = pr_assocs.get("numFound")
-            if num_found > 0:
-                num_found = num_found + pr_assocs.get("numFound")
-            assocs["numFound"] = num_found
-            for asc in pr_assocs["associations"]:
-                logger.info(asc)
-                assocs["associations"].append(asc)
     return {"associations": assocs.get("associations")}
+
+
+@router.post(
+    "/api/bioentity/gene/function",
+    tags=["bioentity"],
+    description="Returns the GO terms associated with each of a list of genes, keyed by gene. "
+    "Takes the same gene identifiers as /api/bioentity/gene/{id}/function, up to " + str(MAX_BATCH_GENES) + ".",
+)
+async def get_annotations_by_gene_ids(body: GeneFunctionRequest):
+    """
+    Returns the GO terms associated with each of a list of genes.
+
+    The genes are queried together, with a few GOlr queries on chunks of genes; the genes without associations
+    then fall back to their UniProtKB proteins, also queried together.
+
+    :param body: The genes, and optionally the slim to map the GO terms up to.
+    :return: A dictionary of gene -> {"associations"}, in the order of the genes; every association of each gene is
+        returned.
+    """
+    if len(body.gene) > MAX_BATCH_GENES:
+        raise HTTPException(status_code=400, detail="At most {} genes per request".format(MAX_BATCH_GENES))
+
+    search = dict(object_category="function", user_agent=USER_AGENT, url=ESOLR.GOLR, slim=body.slim)
+    associations = await search_associations_by_subject(body.gene, **search)
+
+    # as in get_annotations_by_gene_id, GO annotates some genes through their UniProtKB proteins
+    prots = await genes_to_uniprot([gene for gene, assocs in associations.items() if not assocs])
+    prot_associations = await search_associations_by_subject(
+        [prot for gene_prots in prots.values() for prot in gene_prots], **search
+    )
+    for gene, gene_prots in prots.items():
+        associations[gene] = [assoc for prot in gene_prots for assoc in prot_associations[prot]]
+    return {gene: {"associations": assocs} for gene, assocs in associations.items()}
+
+
+@router.get(
+    "/api/bioentity/function/{id}/export",
+    tags=["bioentity"],
+    description="Export every annotation to a GO term or its is_a/part_of descendants, e.g. GO:0044598, "
+    "streamed as NDJSON or TSV.",
+)
+async def export_annotations_by_goterm_id(
+    id: str = Path(
+        ...,
+        description="The CURIE of the GO term to export the annotations of. (e.g. GO:0044598)",
+        example="GO:0044598",
+    ),
+    evidence: List[str] = Query(None, description="Evidence codes (ECO CURIEs) to filter the annotations by"),
+    format: ExportFormat = Query(ExportFormat.ndjson, description="ndjson or tsv"),
+):
+    """
+    Export every annotation to a GO term or its is_a/part_of descendants.
+
+    :param id: The CURIE of the GO term. (required)
+    :param evidence: Evidence codes to filter the annotations by.
+    :param format: ndjson (one JSON object per annotation) or tsv (with a header row).
+    :return: The annotations, streamed from GOlr page by page.
+    """
+    filters = "&fq=isa_partof_closure:" + quote('"{}"'.format(id), safe="")
+    if evidence:
+        filters += "&fq=evidence_closure:" + quote("({})".format(" OR ".join('"{}"'.format(e) for e in evidence)))
+    return await export_annotations(filters, format, id)
+
+
+@router.get(
+    "/api/bioentity/gene/{id}/function/export",
+    tags=["bioentity"],
+    description="Export every GO annotation of a gene, e.g. ZFIN:ZDB-GENE-050417-357, streamed as NDJSON or TSV.",
+)
+async def export_annotations_by_gene_id(
+    id: str = Path(
+        ...,
+        description="The CURIE of the gene to export the annotations of. (e.g. ZFIN:ZDB-GENE-050417-357)",
+        example="ZFIN:ZDB-GENE-050417-357",
+    ),
+    format: ExportFormat = Query(ExportFormat.ndjson, description="ndjson or tsv"),
+):
+    """
+    Export every GO annotation of a gene.
+
+    :param id: The CURIE of the gene, as in GOlr; MGI genes can be given as MGI:nnnn. (required)
+    :param format: ndjson (one JSON object per annotation) or tsv (with a header row).
+    :return: The annotations, streamed from GOlr page by page.
+    """
+    # special case MGI, sigh
+    if id.startswith("MGI:") and not id.startswith("MGI:MGI:"):
+        id = id.replace("MGI:", "MGI:MGI:")
+    return await export_annotations("&fq=bioentity:" + quote('"{}"'.format(id), safe=""), format, id)
+
+
+async def export_annotations(filters: str, format: ExportFormat, name: str):
+    """
+    Stream the annotations matching GOlr filters, walking them with a cursor so that memory use is bounded.
+
+    The first page is fetched before the response starts, so that an unavailable GOlr is reported as a 502.
+
+    :param filters: The GOlr filter queries, e.g. '&fq=bioentity:"ZFIN:ZDB-GENE-050417-357"'.
+    :param format: The format of the export.
+    :param name: The name of the exported file, without extension.
+    :return: The streaming response.
+    """
+    docs = iterate_solr_on(ESOLR.GOLR, ESOLRDoc.ANNOTATION, ",".join(EXPORT_FIELDS), EXPORT_PAGE_SIZE, filters)
+    chunks = stream_export(docs, EXPORT_FIELDS, format.value)
+    try:
+        first_chunk = await anext(chunks, "")
+    except httpx.HTTPError as e:
+        logger.error("Error while exporting annotations of %s: %s", name, e)
+        raise HTTPException(status_code=502, detail="GOlr request failed: {}".format(e)) from e
+
+    async def body():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+    filename = "{}_annotations.{}".format(UNSAFE_FILENAME_CHARACTERS.sub("_", name), format.value)
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[format.value],
+        headers={"Content-Disposition": 'attachment; filename="{}"'.format(filename)},
+    )
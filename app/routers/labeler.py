@@ -4,6 +4,7 @@ from typing import List
 
 from fastapi import APIRouter, Query
 
+from app.middleware.cache_middleware import cache_response
 from app.utils.ontology_utils import batch_fetch_labels
 from app.utils.settings import get_user_agent
 
@@ -16,9 +17,14 @@ logger = logging.getLogger()
 @router.get(
     "/api/ontol/labeler", tags=["ontol/labeler"], description="Fetches a map from IDs to labels e.g. GO:0003677."
 )
+@cache_response()
 async def expand_curie(
     id: List[str] = Query(..., description="IDs to fetch labels for.", example=["GO:0003677", "GO:0008150"])
 ):
-    """Fetches a map from IDs to labels e.g. GO:0003677."""
+    """
+    Fetches a map from IDs to labels e.g. GO:0003677.
+
+    The map follows the order of the requested IDs; IDs that are unknown or have no label map to null.
+    """
     logger.info("fetching labels for IDs")
-    return batch_fetch_labels(id)
+    return await batch_fetch_labels(id)
@@ -3,13 +3,15 @@
 import logging
 from typing import List
 
+import orjson
 import requests
 from fastapi import APIRouter, Path, Query
-from oaklib.implementations.sparql.sparql_implementation import SparqlImplementation
-from oaklib.resource import OntologyResource
+from starlette.concurrency import run_in_threadpool
 
+from app.middleware.cache_middleware import cache_response
 from app.utils.settings import get_sparql_endpoint, get_user_agent
-from app.utils.sparql_utils import transform_array
+from app.utils.shared_cache import shared_cache_key, shared_get, shared_set
+from app.utils.sparql_utils import run_sparql_on, transform_array
 
 USER_AGENT = get_user_agent()
 SPARQL_ENDPOINT = get_sparql_endpoint()
@@ -24,6 +26,7 @@ logger = logging.getLogger()
     deprecated=True,
     description="Returns metadata of GO-CAM models, e.g. 59a6110e00000067.",
 )
+@cache_response(max_age=3600)
 async def get_gocam_models(
     start: int = Query(None, description="start"),
     size: int = Query(None, description="Number of models to look for"),
@@ -43,9 +46,6 @@ async def get_gocam_models(
         start = 0
         size = last
 
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-
     # support how the model endpoint currently works, better to have one param that controlled user group or pmid
     # since this is effectively is an OR at the moment.
     by_param = ""
@@ -256,12 +256,13 @@ async def get_gocam_models(
         query += "\nLIMIT " + str(size)
     if start:
         query += "\nOFFSET " + str(start)
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     results = transform_array(results, ["orcids", "names", "groupids", "groupnames"])
     return results
 
 
 @router.get("/api/models/go", tags=["models"], description="Returns go term details based on a GO-CAM model ID.")
+@cache_response(max_age=3600)
 async def get_goterms_by_model_id(
     gocams: List[str] = Query(
         None,
@@ -277,8 +278,6 @@ async def get_goterms_by_model_id(
             stripped_ids.append(model_id)
         else:
             stripped_ids.append(model_id)
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     gocam = ""
     if stripped_ids:
         for model in stripped_ids:
@@ -347,7 +346,7 @@ async def get_goterms_by_model_id(
 		ORDER BY DESC(?gocam)
         """
 
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     summary_gocam = ""
     collated = {}
     collated_results = []
@@ -378,6 +377,7 @@ async def get_goterms_by_model_id(
 
 
 @router.get("/api/models/gp", tags=["models"], description="Returns gene product details based on a GO-CAM model ID.")
+@cache_response(max_age=3600)
 async def get_geneproducts_by_model_id(
     gocams: List[str] = Query(
         None,
@@ -398,8 +398,6 @@ async def get_geneproducts_by_model_id(
             stripped_ids.append(model_id)
         else:
             stripped_ids.append(model_id)
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     gocam = ""
     if stripped_ids:
         for model in stripped_ids:
@@ -459,12 +457,13 @@ async def get_geneproducts_by_model_id(
         }
         GROUP BY ?gocam
         """
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     results = transform_array(results, ["gpids", "gpnames"])
     return results
 
 
 @router.get("/api/models/pmid", tags=["models"], description="Returns PMID details based on a GO CAM ID.")
+@cache_response(max_age=3600)
 async def get_pmid_by_model_id(
     gocams: List[str] = Query(
         None,
@@ -481,8 +480,6 @@ async def get_pmid_by_model_id(
         else:
             stripped_ids.append(model_id)
     gocam = ""
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     if stripped_ids:
         for model in stripped_ids:
             if gocam == "":
@@ -526,7 +523,7 @@ async def get_pmid_by_model_id(
         }
         GROUP BY ?gocam
         """
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     for result in results:
         collated = {"gocam": result["gocam"].get("value"), "sources": result["sources"].get("value")}
@@ -537,6 +534,7 @@ async def get_pmid_by_model_id(
 @router.get(
     "/api/go-cam/{id}", tags=["models"], description="Returns model details based on a GO-CAM model ID in JSON format."
 )
+@cache_response(max_age=3600)
 async def get_model_details_by_model_id_json(
     id: str = Path(
         ...,
@@ -559,12 +557,31 @@ async def get_model_details_by_model_id_json(
     print("id is:", id)
 
     path_to_s3 = "https://go-public.s3.amazonaws.com/files/go-cam/%s.json" % replaced_id
-    response = requests.get(path_to_s3, timeout=30, headers={"User-Agent": USER_AGENT})
-    response.raise_for_status()  # This will raise an HTTPError if the HTTP request returned an unsuccessful status code
-    return response.json()
+    # the download and the shared cache block, so they run in the thread pool
+    return orjson.loads(await run_in_threadpool(fetch_model_file, path_to_s3))
+
+
+def fetch_model_file(path_to_s3: str):
+    """
+    Download a GO-CAM model file from S3, unless the shared cache has it.
+
+    :param path_to_s3: The URL of the model file.
+    :return: The content of the file.
+    :rtype: bytes
+    """
+    key = shared_cache_key("s3", path_to_s3)
+    content = shared_get("s3", key)
+    if content is None:
+        response = requests.get(path_to_s3, timeout=30, headers={"User-Agent": USER_AGENT})
+        # This will raise an HTTPError if the HTTP request returned an unsuccessful status code
+        response.raise_for_status()
+        content = response.content
+        shared_set("s3", key, content)
+    return content
 
 
 @router.get("/api/models/{id}", tags=["models"], description="Returns model details based on a GO-CAM model ID.")
+@cache_response(max_age=3600)
 async def get_term_details_by_model_id(
     id: str = Path(
         ...,
@@ -576,8 +593,6 @@ async def get_term_details_by_model_id(
     if id.startswith("gomodel:"):
         id = id.replace("gomodel:", "")
 
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = (
         """
         PREFIX metago: <http://model.geneontology.org/>
@@ -592,7 +607,7 @@ async def get_term_details_by_model_id(
     """
         % id
     )
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     for result in results:
         collated = {
@@ -605,6 +620,7 @@ async def get_term_details_by_model_id(
 
 
 @router.get("/api/taxon/{taxon}/models", tags=["models"], description="Returns model details based on a NCBI Taxon ID.")
+@cache_response(max_age=3600)
 async def get_term_details_by_taxon_id(
     taxon: str = Path(
         ...,
@@ -613,8 +629,6 @@ async def get_term_details_by_taxon_id(
     )
 ):
     """Returns model details based on a NCBI Taxon ID."""
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     final_taxon = "http://purl.obolibrary.org/obo/"
     if taxon.startswith("NCBITaxon:"):
         new_taxon = taxon.replace("NCBITaxon:", "NCBITaxon_")
@@ -646,7 +660,7 @@ async def get_term_details_by_taxon_id(
     """
         % final_taxon
     )
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     for result in results:
         collated = {"gocam": result["gocam"].get("value")}
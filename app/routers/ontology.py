@@ -1,18 +1,19 @@
 """Ontology-related endpoints."""
+import asyncio
 import json
 import logging
 from enum import Enum
 
 from curies import Converter
-from fastapi import APIRouter, Path, Query
-from oaklib.implementations.sparql.sparql_implementation import SparqlImplementation
-from oaklib.resource import OntologyResource
+from fastapi import APIRouter, Depends, Path, Query
 
 import app.utils.ontology_utils as ontology_utils
+from app.middleware.cache_middleware import cache_response
+from app.utils.closure_utils import get_closure_index
 from app.utils.golr_utils import gu_run_solr_text_on, run_solr_on
-from app.utils.prefix_utils import get_prefixes
-from app.utils.settings import ESOLR, ESOLRDoc, get_sparql_endpoint, get_user_agent
-from app.utils.sparql_utils import transform, transform_array
+from app.utils.prefix_utils import get_converter
+from app.utils.settings import ESOLR, ESOLRDoc, get_user_agent
+from app.utils.sparql_utils import run_sparql_on, transform, transform_array
 
 logger = logging.getLogger()
 
@@ -29,27 +30,25 @@ class GraphType(str, Enum):
 
 
 @router.get("/api/ontology/term/{id}", tags=["ontology"])
+@cache_response()
 async def get_term_metadata_by_id(
     id: str = Path(
         ..., description="The ID of the term to extract the metadata from, e.g. GO:0003677", example="GO:0003677"
     ),
+    converter: Converter = Depends(get_converter),
 ):
     """Returns metadata of an ontology term, e.g. GO:0003677."""
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-    query = ontology_utils.create_go_summary_sparql(id)
-    results = si._sparql_query(query)
+    results = await ontology_utils.fetch_go_summary(id)
     transformed_result = transform(
         results[0],
         ["synonyms", "relatedSynonyms", "alternativeIds", "xrefs", "subsets"],
     )
-    cmaps = get_prefixes("go")
-    converter = Converter.from_prefix_map(cmaps, strict=False)
     transformed_result["goid"] = converter.compress(transformed_result["goid"])
     return transformed_result
 
 
 @router.get("/api/ontology/term/{id}/graph", tags=["ontology"])
+@cache_response()
 async def get_term_graph_by_id(
     id: str = Path(
         ..., description="The ID of the term to extract the graph from,  e.g. GO:0003677", example="GO:0003677"
@@ -59,7 +58,7 @@ async def get_term_graph_by_id(
     """Returns graph of an ontology term, e.g. GO:0003677."""
     graph_type = graph_type + "_json"  # GOLR field names
 
-    data = run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, id, graph_type)
+    data = await run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, id, graph_type)
     # step required as these graphs are made into strings in the json
     data[graph_type] = json.loads(data[graph_type])
 
@@ -71,6 +70,7 @@ async def get_term_graph_by_id(
     tags=["ontology"],
     description="Extract a subgraph from an ontology term. e.g. GO:0003677 using the relationships is_a and part_of.",
 )
+@cache_response()
 async def get_subgraph_by_term_id(
     id: str = Path(
         ..., description="The ID of the term to extract the subgraph from,  e.g. GO:0003677", example="GO:0003677"
@@ -88,12 +88,19 @@ async def get_subgraph_by_term_id(
     """
     if rows is None:
         rows = 100000
+    closure_index = get_closure_index()
+    if closure_index is not None and id in closure_index:
+        descendents = closure_index.descendants(id)[start : start + rows]
+        return {
+            "descendents": [{"id": child} for child in descendents],
+            "ancestors": [{"id": parent} for parent in closure_index.ancestors(id)],
+        }
     query_filters = ""
     golr_field_to_search = "isa_partof_closure"
     where_statement = "*:*&fq=" + golr_field_to_search + ":" + '"' + id + '"'
     fields = "id,annotation_class_label,isa_partof_closure,isa_partof_closure_label"
     optionals = "&defType=edismax&start=" + str(start) + "&rows=" + str(rows)
-    descendent_data = gu_run_solr_text_on(
+    descendent_data = await gu_run_solr_text_on(
         ESOLR.GOLR, ESOLRDoc.ONTOLOGY, where_statement, query_filters, fields, optionals, False
     )
 
@@ -107,7 +114,7 @@ async def get_subgraph_by_term_id(
 
     golr_field_to_search = "id"
     where_statement = "*:*&fq=" + golr_field_to_search + ":" + '"' + id + '"'
-    ancestor_data = gu_run_solr_text_on(
+    ancestor_data = await gu_run_solr_text_on(
         ESOLR.GOLR, ESOLRDoc.ONTOLOGY, where_statement, query_filters, fields, optionals, False
     )
     ancestors = []
@@ -123,6 +130,7 @@ async def get_subgraph_by_term_id(
     tags=["ontology"],
     description="Returns the ancestor ontology terms shared by two ontology terms. ",
 )
+@cache_response()
 async def get_ancestors_shared_by_two_terms(
     subject: str = Path(..., description="Identifier of a GO term, e.g. GO:0006259", example="GO:0006259"),
     object: str = Path(..., description="Identifier of a GO term, e.g. GO:0046483", example="GO:0046483"),
@@ -133,24 +141,7 @@ async def get_ancestors_shared_by_two_terms(
     :param subject: 'CURIE identifier of a GO term, e.g. GO:0006259'
     :param object: 'CURIE identifier of a GO term, e.g. GO:0046483'
     """
-    fields = "isa_partof_closure,isa_partof_closure_label"
-
-    subres = run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, subject, fields)
-    objres = run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, object, fields)
-
-    logger.info("SUBJECT: ", subres)
-    logger.info("OBJECT: ", objres)
-
-    shared = []
-    shared_labels = []
-    for i in range(0, len(subres["isa_partof_closure"])):
-        sub = subres["isa_partof_closure"][i]
-        found = False
-        if sub in objres["isa_partof_closure"]:
-            found = True
-        if found:
-            shared.append(sub)
-            shared_labels.append(subres["isa_partof_closure_label"][i])
+    shared, shared_labels = await fetch_shared_ancestors(subject, object)
     return {"goids": shared, "gonames: ": shared_labels}
 
 
@@ -159,6 +150,7 @@ async def get_ancestors_shared_by_two_terms(
     tags=["ontology"],
     description="Returns the ancestor ontology terms shared by two ontology terms. ",
 )
+@cache_response()
 async def get_ancestors_shared_between_two_terms(
     subject: str = Path(..., description="Identifier of a GO term, e.g. GO:0006259", example="GO:0006259"),
     object: str = Path(..., description="Identifier of a GO term, e.g. GO:0046483", example="GO:0046483"),
@@ -171,36 +163,32 @@ async def get_ancestors_shared_between_two_terms(
     :param object: 'CURIE identifier of a GO term, e.g. GO:0046483'
     :param relation: 'relation between two terms' can only be one of two values: shared or closest
     """
-    fields = "isa_partof_closure,isa_partof_closure_label"
     logger.info(relation)
     if relation == "shared" or relation is None:
-        subres = run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, subject, fields)
-        objres = run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, object, fields)
-
-        logger.info("SUBJECT: ", subres)
-        logger.info("OBJECT: ", objres)
-
-        shared = []
-        shared_labels = []
-
-        for i in range(0, len(subres["isa_partof_closure"])):
-            sub = subres["isa_partof_closure"][i]
-            found = False
-            if sub in objres["isa_partof_closure"]:
-                found = True
-            if found:
-                shared.append(sub)
-                shared_labels.append(subres["isa_partof_closure_label"][i])
-
+        shared, shared_labels = await fetch_shared_ancestors(subject, object)
         result = {"shared": shared, "shared_labels": shared_labels}
         return result
 
     else:
+        closure_index = get_closure_index()
+        if (
+            closure_index is not None
+            and closure_index.has_edges
+            and subject in closure_index
+            and object in closure_index
+        ):
+            # sharedPartOf keeps the answer of GOlr below: every part_of neighbour of the object
+            return {
+                "sharedIsA": closure_index.shared_neighbours(subject, object, "is_a"),
+                "sharedPartOf": closure_index.direct_neighbours(object, "BFO:0000050"),
+            }
         logger.info("got here")
         fields = "neighborhood_graph_json"
         # https://golr.geneontology.org/solr/select?q=*:*&fq=document_category:%22ontology_class%22&fq=id:%22GO:0006259%22&fl=neighborhood_graph_json&wt=json&indent=on
-        subres = run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, subject, fields)
-        objres = run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, object, fields)
+        subres, objres = await asyncio.gather(
+            run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, subject, fields),
+            run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, object, fields),
+        )
 
         logger.info("SUBJECT: ", subres)
         logger.info("OBJECT: ", objres)
@@ -252,11 +240,43 @@ async def get_ancestors_shared_between_two_terms(
         return result
 
 
+async def fetch_shared_ancestors(subject: str, object: str):
+    """
+    Return the is_a/part_of ancestors shared by two terms, from the closure index if it has both terms, else GOlr.
+
+    :param subject: CURIE identifier of a GO term, e.g. GO:0006259
+    :param object: CURIE identifier of a GO term, e.g. GO:0046483
+    :return: The shared ancestor CURIEs and their labels, in the order of the ancestors of subject.
+    """
+    closure_index = get_closure_index()
+    if closure_index is not None and subject in closure_index and object in closure_index:
+        return closure_index.shared_ancestors(subject, object)
+
+    fields = "isa_partof_closure,isa_partof_closure_label"
+    subres, objres = await asyncio.gather(
+        run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, subject, fields),
+        run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, object, fields),
+    )
+
+    logger.info("SUBJECT: ", subres)
+    logger.info("OBJECT: ", objres)
+
+    object_closure = set(objres["isa_partof_closure"])
+    shared = []
+    shared_labels = []
+    for sub, label in zip(subres["isa_partof_closure"], subres["isa_partof_closure_label"], strict=False):
+        if sub in object_closure:
+            shared.append(sub)
+            shared_labels.append(label)
+    return shared, shared_labels
+
+
 @router.get(
     "/api/go/{id}",
     tags=["ontology"],
     description="Returns GO-CAM model identifiers for a given GO term ID, e.g. GO:0008150",
 )
+@cache_response()
 async def get_go_term_detail_by_go_id(
     id: str = Path(..., description="A GO-Term CURIE (e.g. GO:0005885, GO:0097136)", example="GO:0008150")
 ):
@@ -267,10 +287,7 @@ async def get_go_term_detail_by_go_id(
     please note, this endpoint was migrated from the GO-CAM service api and may not be
     supported in its current form in the future.
     """
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-    query = ontology_utils.create_go_summary_sparql(id)
-    results = si._sparql_query(query)
+    results = await ontology_utils.fetch_go_summary(id)
     return transform(
         results[0],
         ["synonyms", "relatedSynonyms", "alternativeIds", "xrefs", "subsets"],
@@ -282,8 +299,10 @@ async def get_go_term_detail_by_go_id(
     tags=["ontology"],
     description="Returns parent and children relationships for a given GO ID, e.g. GO:0005885",
 )
+@cache_response()
 async def get_go_hierarchy_go_id(
-    id: str = Path(..., description="A GO-Term ID, e.g. GO:0097136", example="GO:0008150")
+    id: str = Path(..., description="A GO-Term ID, e.g. GO:0097136", example="GO:0008150"),
+    converter: Converter = Depends(get_converter),
 ):
     """
     Returns parent and children relationships for a given GO ID.
@@ -292,10 +311,6 @@ async def get_go_hierarchy_go_id(
     please note, this endpoint was migrated from the GO-CAM service api and may not be
     supported in its current form in the future.
     """
-    cmaps = get_prefixes("go")
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-    converter = Converter.from_prefix_map(cmaps, strict=False)
     id = converter.expand(id)
 
     query = (
@@ -322,7 +337,7 @@ async def get_go_hierarchy_go_id(
     """
         % id
     )
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     collated = {}
     for result in results:
@@ -338,8 +353,10 @@ async def get_go_hierarchy_go_id(
     tags=["ontology"],
     description="Returns GO-CAM model identifiers for a given GO term ID, e.g. GO:0008150",
 )
+@cache_response(max_age=3600)
 async def get_gocam_models_by_go_id(
-    id: str = Path(..., description="A GO-Term ID(e.g. GO:0097136 ...)", example="GO:0097136")
+    id: str = Path(..., description="A GO-Term ID(e.g. GO:0097136 ...)", example="GO:0097136"),
+    converter: Converter = Depends(get_converter),
 ):
     """
     Returns GO-CAM model identifiers for a given GO term ID.
@@ -347,10 +364,6 @@ async def get_gocam_models_by_go_id(
     :param id: A GO-Term ID(e.g. GO:0005885, GO:0097136 ...)
     :return: GO-CAM model identifiers for a given GO term ID.
     """
-    cmaps = get_prefixes("go")
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-    converter = Converter.from_prefix_map(cmaps, strict=False)
     id = converter.expand(id)
     query = (
         """
@@ -369,5 +382,5 @@ async def get_gocam_models_by_go_id(
     """
         % id
     )
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     return transform_array(results)
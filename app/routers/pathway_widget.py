@@ -2,13 +2,12 @@
 import logging
 
 from curies import Converter
-from fastapi import APIRouter, Path, Query
-from oaklib.implementations.sparql.sparql_implementation import SparqlImplementation
-from oaklib.resource import OntologyResource
+from fastapi import APIRouter, Depends, Path, Query
 
-from app.utils.prefix_utils import get_prefixes
+from app.middleware.cache_middleware import cache_response
+from app.utils.prefix_utils import get_converter
 from app.utils.settings import get_sparql_endpoint, get_user_agent
-from app.utils.sparql_utils import transform_array
+from app.utils.sparql_utils import run_sparql_on, transform_array
 
 logger = logging.getLogger()
 
@@ -23,6 +22,7 @@ router = APIRouter()
     description="Returns GO-CAM models associated with a given Gene Product identifier. "
     "(e.g. MGI:3588192, ZFIN:ZDB-GENE-000403-1).",
 )
+@cache_response(max_age=3600)
 async def get_gocams_by_geneproduct_id(
     id: str = Path(..., description="The CURIE of the gene product, e.g. MGI:3588192", example="MGI:3588192"),
     causalmf: int = Query(
@@ -32,6 +32,7 @@ async def get_gocams_by_geneproduct_id(
         "by at least two consecutive causal relation edges.  One of these functions is enabled_by "
         "this input gene",
     ),
+    converter: Converter = Depends(get_converter),
 ):
     """
     Returns GO-CAM models associated with a given Gene Product identifier.
@@ -41,10 +42,6 @@ async def get_gocams_by_geneproduct_id(
     if id.startswith("MGI:MGI:"):
         id = id.replace("MGI:MGI:", "MGI:")
 
-    cmaps = get_prefixes("go")
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-    converter = Converter.from_prefix_map(cmaps, strict=False)
     id = converter.expand(id)
     print("in the method")
     print(id)
@@ -162,5 +159,5 @@ async def get_gocams_by_geneproduct_id(
     """
             % id
         )
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     return transform_array(results)
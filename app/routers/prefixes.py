@@ -1,15 +1,31 @@
 """Module contains the API endpoints for handling prefixes and expansions."""
+import codecs
+import json
 import logging
 
 from curies import Converter
-from fastapi import APIRouter, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
 
-from app.utils.prefix_utils import get_prefixes
+from app.utils.prefix_utils import contract_uri, expand_identifier, get_converter, get_prefix_list
 
 logger = logging.getLogger()
 
 router = APIRouter()
 
+# number of results written to the response at once by the batch endpoints
+BATCH_WRITE_SIZE = 1000
+
+BATCH_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": {"type": "string"}}},
+            "text/plain": {"schema": {"type": "string", "description": "one identifier per line"}},
+        },
+    }
+}
+
 
 @router.get(
     "/api/identifier/prefixes",
@@ -18,10 +34,7 @@ router = APIRouter()
 )
 async def get_all_prefixes():
     """Returns a list of all prefixes in the GO namespace."""
-    all_prefixes = []
-    for k, _v in get_prefixes("go").items():
-        all_prefixes.append(k)
-    return all_prefixes
+    return get_prefix_list()
 
 
 @router.get(
@@ -30,7 +43,10 @@ async def get_all_prefixes():
     description="Enter a CURIE of the identified resource to expand to full URI format.  "
     "e.g. MGI:3588192, MGI:MGI:3588192",
 )
-async def get_expand_curie(id: str = Path(..., description="identifier in CURIE format of the resource to expand")):
+async def get_expand_curie(
+    id: str = Path(..., description="identifier in CURIE format of the resource to expand"),
+    converter: Converter = Depends(get_converter),
+):
     """
     Enter a CURIE of the identified resource to expand to full URI format.
 
@@ -39,10 +55,6 @@ async def get_expand_curie(id: str = Path(..., description="identifier in CURIE
     if id.startswith("MGI:MGI:"):
         id = id.replace("MGI:MGI:", "MGI:")
 
-    cmaps = get_prefixes("go")
-    # have to set strict to "False" to allow for WB and WormBase as prefixes that
-    # map to the same expanded URI prefix
-    converter = Converter.from_prefix_map(cmaps, strict=False)
     return converter.expand(id)
 
 
@@ -52,12 +64,98 @@ async def get_expand_curie(id: str = Path(..., description="identifier in CURIE
     description="Enter a full URI of the identified resource to contract to CURIE format, "
     "e.g. 'http://purl.obolibrary.org/obo/GO_0008150'.",
 )
-async def get_contract_uri(uri: str = Query(..., description="URI of the resource to contract")):
+async def get_contract_uri(
+    uri: str = Query(..., description="URI of the resource to contract"),
+    converter: Converter = Depends(get_converter),
+):
     """
     Enter a full URI of the identified resource to contract to CURIE format.
 
     e.g. http://purl.obolibrary.org/obo/GO_0008150.
     """
-    cmaps = get_prefixes("go")
-    converter = Converter.from_prefix_map(cmaps, strict=False)
     return converter.compress(uri)
+
+
+@router.post(
+    "/api/identifier/prefixes/expand",
+    tags=["identifier/prefixes"],
+    description="Expand a batch of CURIEs to full URIs. The body is a JSON array of CURIEs or one CURIE per line; "
+    "the response is NDJSON with one {id, uri, error} object per CURIE, in request order.",
+    openapi_extra=BATCH_REQUEST_BODY,
+)
+async def post_expand_curies(request: Request, converter: Converter = Depends(get_converter)):
+    """
+    Expand a batch of CURIEs to full URIs.
+
+    e.g. ["MGI:3588192", "MGI:MGI:3588192", "ZFIN:ZDB-GENE-000403-1"].
+    Identifiers that can not be expanded have a null uri and an error message; they do not fail the batch.
+    """
+    identifiers = await read_identifiers(request)
+    return StreamingResponse(
+        stream_ndjson(expand_identifier(converter, id) for id in identifiers),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post(
+    "/api/identifier/prefixes/contract/",
+    tags=["identifier/prefixes"],
+    description="Contract a batch of full URIs to CURIEs. The body is a JSON array of URIs or one URI per line; "
+    "the response is NDJSON with one {uri, id, error} object per URI, in request order.",
+    openapi_extra=BATCH_REQUEST_BODY,
+)
+async def post_contract_uris(request: Request, converter: Converter = Depends(get_converter)):
+    """
+    Contract a batch of full URIs to CURIEs.
+
+    e.g. ["http://purl.obolibrary.org/obo/GO_0008150"].
+    URIs that can not be contracted have a null id and an error message; they do not fail the batch.
+    """
+    uris = await read_identifiers(request)
+    return StreamingResponse(
+        stream_ndjson(contract_uri(converter, uri) for uri in uris),
+        media_type="application/x-ndjson",
+    )
+
+
+async def read_identifiers(request: Request):
+    """
+    Read the identifiers of a batch request.
+
+    A JSON body must be an array of strings; any other body is decoded line by line as it is received, one identifier
+    per line. The body is read before the response starts, as the streaming response listens for disconnects on the
+    same channel.
+
+    :param request: The batch request.
+    :return: The list of identifiers.
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            identifiers = json.loads(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail="Invalid JSON body: {}".format(e)) from e
+        if not isinstance(identifiers, list) or not all(isinstance(id, str) for id in identifiers):
+            raise HTTPException(status_code=422, detail="The JSON body must be an array of strings")
+    else:
+        identifiers = []
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        buffer = ""
+        async for chunk in request.stream():
+            *lines, buffer = (buffer + decoder.decode(chunk)).split("\n")
+            identifiers.extend(line.rstrip("\r") for line in lines)
+        buffer += decoder.decode(b"", final=True)
+        if buffer.strip():
+            identifiers.append(buffer.rstrip("\r"))
+    return identifiers
+
+
+async def stream_ndjson(results):
+    """Serialize results as NDJSON, writing BATCH_WRITE_SIZE lines at a time."""
+    lines = []
+    for result in results:
+        lines.append(json.dumps(result))
+        if len(lines) == BATCH_WRITE_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
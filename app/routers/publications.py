@@ -1,10 +1,10 @@
 """Publication-related endpoints."""
 
 from fastapi import APIRouter, Path
-from oaklib.implementations.sparql.sparql_implementation import SparqlImplementation
-from oaklib.resource import OntologyResource
 
-from app.utils.settings import get_sparql_endpoint, get_user_agent
+from app.middleware.cache_middleware import cache_response
+from app.utils.settings import get_user_agent
+from app.utils.sparql_utils import run_sparql_on
 
 USER_AGENT = get_user_agent()
 router = APIRouter()
@@ -15,13 +15,11 @@ router = APIRouter()
     tags=["publications"],
     description="Returns models for a given publication identifier (PMID).",
 )
+@cache_response(max_age=3600)
 async def get_model_details_by_pmid(
     id: str = Path(..., description="A publication identifier (PMID)" " (e.g. 15314168 or 26954676)")
 ):
     """Returns models for a given publication identifier (PMID)."""
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-
     query = (
         """
         PREFIX metago: <http://model.geneontology.org/>
@@ -40,7 +38,7 @@ async def get_model_details_by_pmid(
         }
     """
     )
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     collated = {}
     for result in results:
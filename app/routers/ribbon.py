@@ -1,18 +1,19 @@
 """Ribbon router."""
 
+import asyncio
 import logging
 from typing import List
 
 from fastapi import APIRouter, Path, Query
-from oaklib.implementations.sparql.sparql_implementation import SparqlImplementation
-from oaklib.resource import OntologyResource
 
 import app.utils.ontology_utils as ontology_utils
+import app.utils.ribbon_utils as ribbon_utils
+from app.middleware.cache_middleware import cache_response
 from app.utils.golr_utils import gu_run_solr_text_on
-from app.utils.settings import ESOLR, ESOLRDoc, get_sparql_endpoint, get_user_agent
-from app.utils.sparql_utils import transform_array
-
-from .slimmer import gene_to_uniprot_from_mygene
+from app.utils.http_utils import gather_bounded
+from app.utils.idmapping_utils import genes_to_uniprot
+from app.utils.settings import ESOLR, ESOLRDoc, get_http_client_config, get_user_agent
+from app.utils.sparql_utils import run_sparql_on, transform_array
 
 logger = logging.getLogger()
 
@@ -27,16 +28,15 @@ aspect_map = {"P": "GO:0008150", "F": "GO:0003674", "C": "GO:0005575"}
     tags=["ontology"],
     description="Returns subsets (slims) associated to an ontology term. (e.g. GO:0003677)",
 )
+@cache_response()
 async def get_subsets_by_term(
     id: str = Path(
         ..., description="The ID of the term to extract the subsets from, e.g. GO:0003677", example="GO:0003677"
     )
 ):
     """Returns subsets (slims) associated to an ontology term."""
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = ontology_utils.get_go_subsets_sparql_query(id)
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     results = transform_array(results, [])
     return results
 
@@ -46,11 +46,12 @@ async def get_subsets_by_term(
     tags=["ontology"],
     description="Returns a subset (slim) by its id which is usually a name. (e.g. goslim_agr)",
 )
+@cache_response()
 async def get_subset_by_id(
     id: str = Path(..., description="Name of the subset to map GO terms (e.g. goslim_agr)", example="goslim_agr")
 ):
     """Returns a subset (slim) by its id which is usually a name."""
-    result = ontology_utils.get_ontology_subsets_by_id(id=id)
+    result = await ontology_utils.get_ontology_subsets_by_id(id=id)
     return result
 
 
@@ -59,6 +60,7 @@ async def get_subset_by_id(
     tags=["ontology"],
     description="Fetch the summary of annotations for a given gene or set of genes.",
 )
+@cache_response()
 async def get_ribbon_results(
     subset: str = Query(None, description="Name of the subset to map GO terms (e.g. goslim_agr)", example="goslim_agr"),
     subject: List[str] = Query(
@@ -87,7 +89,7 @@ async def get_ribbon_results(
             subject.append(sub)
 
     # Step 1: create the categories
-    categories = ontology_utils.get_ontology_subsets_by_id(subset)
+    categories = await ontology_utils.get_ontology_subsets_by_id(subset)
     # in categories
     for category in categories:
         category["groups"] = category["terms"]
@@ -136,9 +138,12 @@ async def get_ribbon_results(
     slimmer_subjects = []
     mapped_ids = {}
     reverse_mapped_ids = {}
+    uniprot_ids = await genes_to_uniprot(
+        [s for s in subject_ids if "HGNC:" in s or "NCBIGene:" in s or "ENSEMBL:" in s]
+    )
     for s in subject_ids:
         if "HGNC:" in s or "NCBIGene:" in s or "ENSEMBL:" in s:
-            prots = gene_to_uniprot_from_mygene(s)
+            prots = uniprot_ids[s]
             if len(prots) > 0:
                 mapped_ids[s] = prots[0]
                 reverse_mapped_ids[prots[0]] = s
@@ -157,142 +162,42 @@ async def get_ribbon_results(
             subject_ids.remove(subject_id)
 
     # because of the MGI:MGI
-    mod_ids = []
+    mod_ids = list(subject_ids)
+
+    # the annotations of every subject and the entity details are fetched concurrently
+    fq = "&rows=100000"
+    if ecodes:
+        fq += '&fq=evidence_type:("' + '" "'.join(ecodes) + '")'
+    elif exclude_IBA:
+        fq += "&fq=!evidence_type:IBA"
+    if exclude_PB:
+        fq += '&fq=!annotation_class:"GO:0005515"'
+    fields = "annotation_class,evidence_type,regulates_closure,aspect"
+    annotation_queries = [
+        gu_run_solr_text_on(
+            ESOLR.GOLR, ESOLRDoc.ANNOTATION, "*:*", "", fields, '&fq=bioentity:"' + subject_id + '"' + fq, False
+        )
+        for subject_id in subject_ids
+    ]
+    details_fq = '&fq=bioentity:("' + '" or "'.join(mod_ids) + '")&rows=100000'
+    details_fields = "bioentity,bioentity_label,taxon,taxon_label"
+    annotations, data = await asyncio.gather(
+        gather_bounded(annotation_queries, get_http_client_config("solr_url")["max_concurrent_queries"]),
+        gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.BIOENTITY, "*:*", "", details_fields, details_fq, False),
+    )
 
     subjects = []
-    for subject_id in subject_ids:
+    for subject_id, subject_annotations in zip(subject_ids, annotations, strict=True):
         entity = {
             "id": subject_id,
             "groups": {},
             "nb_classes": 0,
             "nb_annotations": 0,
-            "terms": set(),
         }
-
-        mod_ids.append(subject_id)
-
-        q = "*:*"
-        qf = ""
-        fq = '&fq=bioentity:"' + subject_id + '"&rows=100000'
-        fields = "annotation_class,evidence_type,regulates_closure,aspect"
-        if ecodes:
-            fq += '&fq=evidence_type:("' + '" "'.join(ecodes) + '")'
-        elif exclude_IBA:
-            fq += "&fq=!evidence_type:IBA"
-        if exclude_PB:
-            fq += '&fq=!annotation_class:"GO:0005515"'
-        data = gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ANNOTATION, q, qf, fields, fq, False)
-
-        # compute number of terms and annotations
-        for annot in data:
-            aspect = ontology_utils.aspect_map[annot["aspect"]]
-            found = False
-
-            for cat in categories:
-                for gp in cat["groups"]:
-                    group = gp["id"]
-
-                    if gp["type"] == "Other":
-                        continue
-
-                    # only allow annotated terms belonging to the same category if cross_aspect
-                    if cross_aspect or cat["id"] == aspect:
-                        # is this annotation part of the current group, based on the regulates_closure ?
-                        if group in annot["regulates_closure"]:
-                            found = True
-                            break
-            if found:
-                entity["terms"].add(annot["annotation_class"])
-                entity["nb_annotations"] += 1
-
-        for cat in categories:
-            for gp in cat["groups"]:
-                group = gp["id"]
-
-                if gp["type"] == "Other":
-                    continue
-
-                for annot in data:
-                    aspect = ontology_utils.aspect_map[annot["aspect"]]
-
-                    # only allow annotated terms belonging to the same category if cross_aspect
-                    if cross_aspect or cat["id"] == aspect:
-                        # is this annotation part of the current group, based on the regulates_closure ?
-                        if group in annot["regulates_closure"]:
-                            # if the group has not been met yet, create it
-                            if group not in entity["groups"]:
-                                entity["groups"][group] = {}
-                                entity["groups"][group]["ALL"] = {
-                                    "terms": set(),
-                                    "nb_classes": 0,
-                                    "nb_annotations": 0,
-                                }
-
-                            # if the subgroup has not been met yet, create it
-                            if annot["evidence_type"] not in entity["groups"][group]:
-                                entity["groups"][group][annot["evidence_type"]] = {
-                                    "terms": set(),
-                                    "nb_classes": 0,
-                                    "nb_annotations": 0,
-                                }
-
-                            # for each annotation, add the term and increment the nb of annotations
-                            entity["groups"][group][annot["evidence_type"]]["terms"].add(annot["annotation_class"])
-                            entity["groups"][group][annot["evidence_type"]]["nb_annotations"] += 1
-                            entity["groups"][group]["ALL"]["terms"].add(annot["annotation_class"])
-                            entity["groups"][group]["ALL"]["nb_annotations"] += 1
-
-            terms = ontology_utils.get_category_terms(cat)
-            terms = [term["id"] for term in terms]
-
-            other = {"ALL": {"terms": set(), "nb_classes": 0, "nb_annotations": 0}}
-
-            for annot in data:
-                aspect = ontology_utils.aspect_map[annot["aspect"]]
-
-                # only allow annotated terms belonging to the same category if cross_aspect
-                if cross_aspect or cat["id"] == aspect:
-                    found = False
-                    for term in terms:
-                        if term in annot["regulates_closure"]:
-                            found = True
-                            break
-
-                    if not found:
-                        other["ALL"]["nb_annotations"] += 1
-                        other["ALL"]["terms"].add(annot["annotation_class"])
-                        if annot["evidence_type"] not in other:
-                            other[annot["evidence_type"]] = {
-                                "terms": set(),
-                                "nb_classes": 0,
-                                "nb_annotations": 0,
-                            }
-                        other[annot["evidence_type"]]["nb_annotations"] += 1
-                        other[annot["evidence_type"]]["terms"].add(annot["annotation_class"])
-
-            entity["groups"][cat["id"] + "-other"] = other
-
-        # compute the number of classes for each group that have subgroup (annotations)
-        for group in entity["groups"]:
-            for subgroup in entity["groups"][group]:
-                entity["groups"][group][subgroup]["nb_classes"] = len(entity["groups"][group][subgroup]["terms"])
-                if "-other" not in group:
-                    del entity["groups"][group][subgroup]["terms"]
-                else:
-                    entity["groups"][group][subgroup]["terms"] = list(entity["groups"][group][subgroup]["terms"])
-
-        entity["nb_classes"] = len(entity["terms"])
-        del entity["terms"]
-
+        entity.update(ribbon_utils.aggregate_ribbon_annotations(categories, subject_annotations, cross_aspect))
         subjects.append(entity)
 
     # fill out the entity details
-    q = "*:*"
-    qf = ""
-    fq = '&fq=bioentity:("' + '" or "'.join(mod_ids) + '")&rows=100000'
-    fields = "bioentity,bioentity_label,taxon,taxon_label"
-    data = gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.BIOENTITY, q, qf, fields, fq, False)
-
     for entity in subjects:
         for entity_detail in data:
             subject_id = entity_detail["bioentity"]
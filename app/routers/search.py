@@ -1,9 +1,12 @@
 """search router."""
 import logging
 from enum import Enum
+from typing import List
+from urllib.parse import quote
 
 from fastapi import APIRouter, Path, Query
 
+from app.utils.autocomplete_index import get_autocomplete_index_connection, highlight, search_index
 from app.utils.golr_utils import gu_run_solr_text_on
 from app.utils.settings import ESOLR, ESOLRDoc, get_user_agent
 
@@ -34,6 +37,7 @@ async def autocomplete_term(
         None,
         description="The category of items to retrieve, can be 'gene' or 'term'",
     ),
+    taxon: List[str] = Query(None, description="NCBITaxon CURIEs of the bioentities to retrieve, e.g. NCBITaxon:9606"),
 ):
     """
     Returns a list of matching concepts or entities over annotation classes and bio-entities.
@@ -46,12 +50,20 @@ async def autocomplete_term(
     :type rows: int, optional
     :param category: The category of items to retrieve, can be 'gene' or 'term'.
     :type category: AutocompleteCategory, optional
+    :param taxon: The taxa of the bioentities to retrieve.
+    :type taxon: List[str], optional
 
     :return: A dictionary containing the list of matching concepts or entities.
     :rtype: dict
     """
     if rows is None:
         rows = 100000
+
+    connection = get_autocomplete_index_connection()
+    if connection is not None:
+        matches = search_index(connection, term, category.value if category else None, taxon, start, rows)
+        return {"docs": [autocomplete_result(match, term) for match in matches]}
+
     # dictates the fields to return
     fields = "id,bioentity_label,bioentity_name,taxon,taxon_label,document_category"
 
@@ -72,7 +84,9 @@ async def autocomplete_term(
         category = ESOLRDoc.ANNOTATION
 
     optionals = "&defType=edismax&start=" + str(start) + "&rows=" + str(rows)
-    data = gu_run_solr_text_on(ESOLR.GOLR, category, term + "*", query_fields, fields, optionals, True)
+    if taxon:
+        optionals += "&fq=taxon:" + quote("({})".format(" OR ".join('"{}"'.format(t) for t in taxon)))
+    data = await gu_run_solr_text_on(ESOLR.GOLR, category, term + "*", query_fields, fields, optionals, True)
     docs = []
 
     for item in data:
@@ -97,3 +111,25 @@ async def autocomplete_term(
 
     result = {"docs": docs}
     return result
+
+
+def autocomplete_result(match, term: str):
+    """
+    Format a match of the local autocomplete index as the GOlr autocomplete results.
+
+    :param match: The match, see autocomplete_index.search_index.
+    :param term: The typed text.
+    :return: The autocomplete result, highlighted in the field of the match.
+    """
+    highlighting = {match["field"]: [highlight(match["value"], term)]}
+    return {
+        "id": match["id"],
+        "label": match["label"],
+        "category": match["category"],
+        "taxon": match["taxon"],
+        "taxon_label": match["taxon_label"],
+        "name": match["name"] if match["category"] == "gene" else match["id"],
+        "highlight": highlighting,
+        "match": highlighting,
+        "has_highlight": True,
+    }
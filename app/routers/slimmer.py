@@ -1,19 +1,30 @@
 """slimmer router."""
+import asyncio
+import json
 import logging
 from enum import Enum
 from typing import List
 
-from biothings_client import get_client
+import httpx
 from fastapi import APIRouter, Query
-from ontobio.golr.golr_associations import map2slim
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 
-from app.utils.settings import ESOLR, get_user_agent
+from app.middleware.cache_middleware import cache_response
+from app.utils.http_utils import gather_bounded
+from app.utils.idmapping_utils import genes_to_uniprot, uniprot_to_genes
+from app.utils.settings import get_http_client_config, get_user_agent
+from app.utils.slimmer_utils import map2slim
 
 INVOLVED_IN = "involved_in"
 ACTS_UPSTREAM_OF_OR_WITHIN = "acts_upstream_of_or_within"
 FUNCTION_CATEGORY = "function"
 ANATOMY_CATEGORY = "anatomy"
 USER_AGENT = get_user_agent()
+# genes identified by these prefixes are annotated through their UniProtKB proteins
+HUMAN_GENE_PREFIXES = ("HGNC:", "NCBIGene:", "ENSEMBL:")
+# number of subjects of a bulk request whose identifiers are mapped together
+BULK_CHUNK_SIZE = 50
 
 router = APIRouter()
 logger = logging.getLogger()
@@ -27,11 +38,22 @@ class RelationshipType(str, Enum):
     involved_in = INVOLVED_IN
 
 
+class SlimmerRequest(BaseModel):
+
+    """Body of a bulk slimmer request."""
+
+    subject: List[str]
+    slim: List[str]
+    relationship_type: RelationshipType = RelationshipType.acts_upstream_of_or_within
+    exclude_automatic_assertions: bool = False
+
+
 @router.get(
     "/api/bioentityset/slimmer/function",
     tags=["bioentityset/slimmer"],
     description="For a given gene(s), summarize its annotations over a defined set of slim.",
 )
+@cache_response()
 async def slimmer_function(
     relationship_type: RelationshipType = Query(default=RelationshipType.acts_upstream_of_or_within),
     subject: List[str] = Query(
@@ -52,105 +74,164 @@ async def slimmer_function(
     # Note that GO currently uses UniProt as primary ID
     # for some sources: https://github.com/biolink/biolink-api/issues/66
 
-    slimmer_subjects = []
-    for s in subject:
-        if "HGNC:" in s or "NCBIGene:" in s or "ENSEMBL:" in s:
-            prots = gene_to_uniprot_from_mygene(s)
-            if len(prots) == 0:
-                prots = [s]
-            slimmer_subjects += prots
-        elif "MGI:MGI:" in s:
-            slimmer_subjects.append(s.replace("MGI:MGI:", "MGI:"))
-        elif "WormBase:" in s:
-            slimmer_subjects.append(s.replace("WormBase:", "WB:"))
-        else:
-            slimmer_subjects.append(s)
-
-    results = map2slim(
-        subjects=slimmer_subjects,
-        slim=slim,
-        object_category="function",
-        user_agent=USER_AGENT,
-        url=ESOLR.GOLR,
+    uniprot_ids = await genes_to_uniprot([s for s in subject if is_human_gene(s)])
+    slimmer_subjects = [slimmer_subject for s in subject for slimmer_subject in get_slimmer_subjects(s, uniprot_ids)]
+
+    # the annotations of each subject are fetched once and mapped to the slim locally
+    results = await map2slim(
+        slimmer_subjects,
+        slim,
         relationship_type=relationship_type.value,
         exclude_automatic_assertions=exclude_automatic_assertions,
-        # rows=-1 sets row limit to 100000 (max_rows set in GolrQuery) and also iterates
-        # through results via GolrQuery method.
         rows=rows,
         start=start,
     )
+    await map_human_proteins_to_genes(results)
+    return results
+
+
+@router.post(
+    "/api/bioentityset/slimmer/function",
+    tags=["bioentityset/slimmer"],
+    description="For a large set of genes, summarize their annotations over a defined set of slim. The response is "
+    "NDJSON with one {subject, results, error} object per subject, in request order, where results are the "
+    "slimmer results of the subject.",
+)
+async def post_slimmer_function(body: SlimmerRequest):
+    """
+    For a large set of genes, summarize their annotations over a defined set of slim.
+
+    Subjects are slimmed concurrently, and streamed back as soon as the subjects before them are done.
+    A subject that can not be slimmed has an error message; it does not fail the batch.
+    """
+    return StreamingResponse(
+        stream_slimmer_results(
+            body.subject, body.slim, body.relationship_type.value, body.exclude_automatic_assertions
+        ),
+        media_type="application/x-ndjson",
+    )
+
 
-    # To the fullest extent possible return HGNC ids
-    checked = {}
+def is_human_gene(subject: str):
+    """Return whether a subject is a human gene, annotated through its UniProtKB proteins."""
+    return any(prefix in subject for prefix in HUMAN_GENE_PREFIXES)
+
+
+def get_slimmer_subjects(subject: str, uniprot_ids):
+    """
+    Return the GOlr subjects of a requested subject.
+
+    :param subject: The requested subject, e.g. HGNC:10848 or MGI:MGI:3588192.
+    :param uniprot_ids: The UniProtKB proteins of the human genes, see genes_to_uniprot.
+    :return: The list of subjects to slim.
+    """
+    if is_human_gene(subject):
+        return uniprot_ids[subject] or [subject]
+    elif "MGI:MGI:" in subject:
+        return [subject.replace("MGI:MGI:", "MGI:")]
+    elif "WormBase:" in subject:
+        return [subject.replace("WormBase:", "WB:")]
+    return [subject]
+
+
+async def map_human_proteins_to_genes(results):
+    """To the fullest extent possible, replace the human UniProtKB subjects of slimmer results with HGNC ids."""
+    human_proteins = [
+        association["subject"]["id"]
+        for result in results
+        for association in result["assocs"]
+        if association["subject"]["taxon"]["id"] == "NCBITaxon:9606"
+        and association["subject"]["id"].startswith("UniProtKB:")
+    ]
+    genes = await uniprot_to_genes(human_proteins)
     for result in results:
         for association in result["assocs"]:
-            taxon = association["subject"]["taxon"]["id"]
-            protein_id = association["subject"]["id"]
-            if taxon == "NCBITaxon:9606" and protein_id.startswith("UniProtKB:"):
-                if protein_id not in checked:
-                    genes = uniprot_to_gene_from_mygene(protein_id)
-                    for gene in genes:
-                        if gene.startswith("HGNC"):
-                            association["subject"]["id"] = gene
-                            checked[protein_id] = gene
-                else:
-                    association["subject"]["id"] = checked[protein_id]
+            gene = genes.get(association["subject"]["id"])
+            if gene is not None and association["subject"]["taxon"]["id"] == "NCBITaxon:9606":
+                association["subject"]["id"] = gene
 
-    return results
 
+async def stream_slimmer_results(subjects, slim, relationship_type: str, exclude_automatic_assertions: bool):
+    """
+    Slim subjects chunk by chunk and serialize them as NDJSON, one subject per line.
 
-def gene_to_uniprot_from_mygene(id: str):
-    """Query MyGeneInfo with a gene and get its corresponding UniProt ID."""
-    uniprot_ids = []
-    mg = get_client("gene")
-    if id.startswith("NCBIGene:"):
-        # MyGeneInfo uses 'entrezgene' prefix instead of 'NCBIGene'
-        id = id.replace("NCBIGene", "entrezgene")
-    try:
-        results = mg.query(id, fields="uniprot")
-        logger.info("results from mygene for %s: %s", id, results["hits"])
-        if results["hits"]:
-            for hit in results["hits"]:
-                if "uniprot" not in hit:
-                    continue
-                if "Swiss-Prot" in hit["uniprot"]:
-                    uniprot_id = hit["uniprot"]["Swiss-Prot"]
-                    if isinstance(uniprot_id, str):
-                        if not uniprot_id.startswith("UniProtKB"):
-                            uniprot_id = "UniProtKB:{}".format(uniprot_id)
-                        uniprot_ids.append(uniprot_id)
-                    else:
-                        for x in uniprot_id:
-                            if not x.startswith("UniProtKB"):
-                                x = "UniProtKB:{}".format(x)
-                            uniprot_ids.append(x)
-                else:
-                    trembl_ids = hit["uniprot"]["TrEMBL"]
-                    for x in trembl_ids:
-                        if not x.startswith("UniProtKB"):
-                            x = "UniProtKB:{}".format(x)
-                        uniprot_ids.append(x)
-    except ConnectionError:
-        logging.error("ConnectionError while querying MyGeneInfo with {}".format(id))
-
-    return uniprot_ids
-
-
-def uniprot_to_gene_from_mygene(id: str):
-    """Query MyGeneInfo with a UniProtKB id and get its corresponding HGNC gene."""
-    gene_id = None
-    if id.startswith("UniProtKB"):
-        id = id.split(":", 1)[1]
+    The next chunk is slimmed while the current one is written, and only these two chunks are held in memory.
 
-    mg = get_client("gene")
+    :param subjects: The requested subjects.
+    :param slim: The GO term CURIEs of the slim.
+    :param relationship_type: acts_upstream_of_or_within or involved_in.
+    :param exclude_automatic_assertions: Whether to skip the IEA annotations.
+    :return: An async iterator over the NDJSON lines.
+    """
+    chunks = [subjects[i : i + BULK_CHUNK_SIZE] for i in range(0, len(subjects), BULK_CHUNK_SIZE)]
+    pending = None
+    try:
+        for i, chunk in enumerate(chunks):
+            current = pending or asyncio.ensure_future(
+                slim_subjects(chunk, slim, relationship_type, exclude_automatic_assertions)
+            )
+            pending = None
+            if i + 1 < len(chunks):
+                pending = asyncio.ensure_future(
+                    slim_subjects(chunks[i + 1], slim, relationship_type, exclude_automatic_assertions)
+                )
+            for line in await current:
+                yield json.dumps(line) + "\n"
+    finally:
+        # the client went away
+        if pending is not None:
+            pending.cancel()
+
+
+async def slim_subjects(subjects, slim, relationship_type: str, exclude_automatic_assertions: bool):
+    """
+    Slim each of a list of subjects, at most solr_url.max_concurrent_queries at a time.
+
+    A failure is reported in the error of the subjects it affects, so that the stream goes on with the next ones.
+
+    :return: A list of {"subject", "results", "error"} dictionaries, in the order of subjects.
+    """
+    try:
+        uniprot_ids = await genes_to_uniprot([s for s in subjects if is_human_gene(s)])
+    except Exception as e:
+        logger.exception("Error while mapping the genes of %s to UniProtKB", subjects)
+        return [
+            {"subject": subject, "results": [], "error": "Gene mapping failed: {}".format(e)} for subject in subjects
+        ]
+
+    async def slim_subject(subject):
+        try:
+            results = await map2slim(
+                get_slimmer_subjects(subject, uniprot_ids),
+                slim,
+                relationship_type=relationship_type,
+                exclude_automatic_assertions=exclude_automatic_assertions,
+            )
+        except httpx.HTTPError as e:
+            logger.error("Error while slimming %s: %s", subject, e)
+            return {"subject": subject, "results": [], "error": "GOlr request failed: {}".format(e)}
+        except Exception as e:
+            logger.exception("Error while slimming %s", subject)
+            return {"subject": subject, "results": [], "error": "Slimming failed: {}".format(e)}
+        return {"subject": subject, "results": results, "error": None}
+
+    lines = await gather_bounded(
+        [slim_subject(subject) for subject in subjects], get_http_client_config("solr_url")["max_concurrent_queries"]
+    )
     try:
-        results = mg.query(id, fields="HGNC")
-        if results["hits"]:
-            hit = results["hits"][0]
-            gene_id = hit["HGNC"]
-            if not gene_id.startswith("HGNC"):
-                gene_id = "HGNC:{}".format(gene_id)
-    except ConnectionError:
-        logging.error("ConnectionError while querying MyGeneInfo with {}".format(id))
-
-    return [gene_id]
+        await map_human_proteins_to_genes([result for line in lines for result in line["results"]])
+    except Exception as e:
+        logger.exception("Error while mapping the proteins slimmed for %s to genes", subjects)
+        error = "Protein mapping failed: {}".format(e)
+        return [{"subject": line["subject"], "results": [], "error": line["error"] or error} for line in lines]
+    return lines
+
+
+async def gene_to_uniprot_from_mygene(id: str):
+    """Query MyGeneInfo with a gene and get its corresponding UniProt ID."""
+    return (await genes_to_uniprot([id]))[id]
+
+
+async def uniprot_to_gene_from_mygene(id: str):
+    """Query MyGeneInfo with a UniProtKB id and get its corresponding HGNC gene."""
+    return [(await uniprot_to_genes([id]))[id]]
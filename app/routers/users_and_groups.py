@@ -2,11 +2,9 @@
 import logging
 
 from fastapi import APIRouter, Path
-from oaklib.implementations.sparql.sparql_implementation import SparqlImplementation
-from oaklib.resource import OntologyResource
 
-from app.utils.settings import get_sparql_endpoint, get_user_agent
-from app.utils.sparql_utils import transform_array
+from app.utils.settings import get_user_agent
+from app.utils.sparql_utils import run_sparql_on, transform_array
 
 logger = logging.getLogger()
 
@@ -23,8 +21,6 @@ async def get_users():
     please note, this endpoint was migrated from the GO-CAM service api and may not be
     supported in its current form in the future.
     """
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = """
         PREFIX metago: <http://model.geneontology.org/>
         PREFIX dc: <http://purl.org/dc/elements/1.1/>
@@ -48,7 +44,7 @@ async def get_users():
         }
         GROUP BY ?orcid ?name
         """
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     results = transform_array(results, ["organizations", "affiliations"])
     return results
 
@@ -63,8 +59,6 @@ async def get_user_by_orcid(
 ):
     """Returns model details based on a GO-CAM model ID."""
     mod_orcid = f'"http://orcid.org/{orcid}"^^xsd:string'
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = (
         """
 
@@ -148,7 +142,7 @@ async def get_user_by_orcid(
     )
     collated_results = []
     collated = {}
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     for result in results:
         collated["organizations"] = result["organizations"].get("value")
         collated["affiliations"] = result["affiliations"].get("value")
@@ -173,8 +167,6 @@ async def get_models_by_orcid(
 ):
     """Returns model details based on an orcid."""
     mod_orcid = f'"http://orcid.org/{orcid}"^^xsd:string'
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = (
         """
         PREFIX metago: <http://model.geneontology.org/>
@@ -223,7 +215,7 @@ async def get_models_by_orcid(
         % mod_orcid
     )
 
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     collated = {}
     for result in results:
@@ -245,8 +237,6 @@ async def get_gp_models_by_orcid(
 ):
     """Returns GP model details based on a orcid."""
     mod_orcid = f'"http://orcid.org/{orcid}"^^xsd:string'
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = (
         """
         PREFIX metago: <http://model.geneontology.org/>
@@ -296,7 +286,7 @@ async def get_gp_models_by_orcid(
         % mod_orcid
     )
 
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     collated = {}
     for result in results:
@@ -316,8 +306,6 @@ async def get_groups():
     please note, this endpoint was migrated from the GO-CAM service api and may not be
     supported in its current form in the future.
     """
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = """
         PREFIX metago: <http://model.geneontology.org/>
         PREFIX dc: <http://purl.org/dc/elements/1.1/>
@@ -335,7 +323,7 @@ async def get_groups():
             }
             GROUP BY ?url ?name
         """
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     return results
 
 
@@ -352,8 +340,6 @@ async def get_group_metadata_by_name(
     please note, this endpoint was migrated from the GO-CAM service api and may not be
     supported in its current form in the future.
     """
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
     query = (
         """
          PREFIX metago: <http://model.geneontology.org/>
@@ -394,7 +380,7 @@ async def get_group_metadata_by_name(
 
         """
     )
-    results = si._sparql_query(query)
+    results = await run_sparql_on(query)
     collated_results = []
     collated = {}
     for result in results:
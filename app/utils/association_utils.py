@@ -0,0 +1,104 @@
+"""association search utilities."""
+import logging
+
+from ontobio.golr.golr_query import GolrAssociationQuery
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.http_utils import decode_json, fetch, gather_bounded
+from app.utils.settings import ESOLR, get_http_client_config
+
+logger = logging.getLogger()
+# number of subjects filtered on by one GOlr query of search_associations_by_subject
+SUBJECTS_PER_QUERY = 100
+# number of documents fetched per GOlr request when all the associations are fetched
+GOLR_PAGE_SIZE = 1000
+
+
+async def search_associations_page(cursor_mark: str = "*", **kwargs):
+    """
+    Run an ontobio association search for one page, walked with a solr cursor instead of start offsets.
+
+    The query is built by ontobio, with the same arguments as ontobio's search_associations, and its documents are
+    translated by ontobio, so the page has the same format as the result of search_associations.
+
+    :param cursor_mark: The solr cursorMark of the page, * for the first page.
+    :param kwargs: The arguments of search_associations, e.g. subject, object_category and rows; start is ignored.
+    :return: The page (numFound and associations or compact_associations), and the cursorMark of the next page
+        (None after the last page).
+    """
+    query = GolrAssociationQuery(**kwargs)
+    params = query.solr_params()
+    params.pop("start", None)
+    # the facets of the whole result are not part of a page
+    params.update({"facet": "off", "sort": "id asc", "cursorMark": cursor_mark, "wt": "json"})
+
+    # POSTed, as the filters on long lists of subjects do not fit in a URL
+    response = await fetch("solr_url", "POST", ESOLR.GOLR.value + "select", data=params)
+    response.raise_for_status()
+    results = decode_json(response)
+    page = await run_in_threadpool(_translate_page, query, results["response"]["docs"])
+    page["numFound"] = results["response"]["numFound"]
+    next_cursor_mark = results.get("nextCursorMark")
+    return page, next_cursor_mark if next_cursor_mark != cursor_mark else None
+
+
+async def search_associations_by_subject(subjects, **kwargs):
+    """
+    Fetch every association of many subjects, with one query per SUBJECTS_PER_QUERY subjects.
+
+    The queries run concurrently, at most solr_url.max_concurrent_queries at a time, and each one is walked with a
+    solr cursor.
+
+    :param subjects: The subjects, e.g. ZFIN:ZDB-GENE-980526-388, MGI:3588192 or UniProtKB:P12345.
+    :param kwargs: The other arguments of search_associations, e.g. object_category and slim; rows and start are
+        ignored.
+    :return: A dictionary of subject -> associations, in the order of subjects; the subjects of the associations
+        have the canonical form of the identifiers (e.g. MGI:3588192 for MGI:MGI:3588192).
+    """
+    subjects = list(dict.fromkeys(subjects))
+    kwargs.pop("start", None)
+    kwargs["rows"] = GOLR_PAGE_SIZE
+    chunks = [subjects[i : i + SUBJECTS_PER_QUERY] for i in range(0, len(subjects), SUBJECTS_PER_QUERY)]
+    pages = await gather_bounded(
+        [_search_all_associations(chunk, **kwargs) for chunk in chunks],
+        get_http_client_config("solr_url")["max_concurrent_queries"],
+    )
+
+    associations = {}
+    for page in pages:
+        for association in page:
+            associations.setdefault(association["subject"]["id"], []).append(association)
+    canonical = GolrAssociationQuery().make_canonical_identifier
+    return {subject: associations.get(canonical(subject), []) for subject in subjects}
+
+
+async def _search_all_associations(subjects, **kwargs):
+    """Fetch every association of a list of subjects, page by page."""
+    associations = []
+    cursor_mark = "*"
+    while cursor_mark is not None:
+        page, cursor_mark = await search_associations_page(cursor_mark, subjects=subjects, **kwargs)
+        associations.extend(page["associations"])
+    return associations
+
+
+def _translate_page(query, docs):
+    """Translate the documents of a page as GolrAssociationQuery.exec does."""
+    page = {}
+    if query.use_compact_associations:
+        page["compact_associations"] = query.translate_docs_compact(
+            docs,
+            field_mapping=query.field_mapping,
+            slim=query.slim,
+            invert_subject_object=query.invert_subject_object,
+            map_identifiers=query.map_identifiers,
+        )
+    else:
+        page["associations"] = query.translate_docs(
+            docs, field_mapping=query.field_mapping, map_identifiers=query.map_identifiers
+        )
+        if query.slim:
+            for association in page["associations"]:
+                association["slim"] = [x for x in association["object_closure"] if x in query.slim]
+                del association["object_closure"]
+    return page
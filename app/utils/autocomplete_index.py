@@ -0,0 +1,272 @@
+"""
+on-disk prefix index of GO terms and bioentities for entity autocomplete, built from a GOlr dump.
+
+Build it with:
+
+    python -m app.utils.autocomplete_index autocomplete.db
+
+and set autocomplete.database in conf/config.yaml to the path of the index.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+
+from app.utils.golr_utils import iterate_solr_on
+from app.utils.idmapping_index import open_index
+from app.utils.settings import ESOLR, ESOLRDoc, get_autocomplete_database
+
+logger = logging.getLogger()
+
+autocomplete_database = None
+
+# the weights of the matched fields, as the qf boosts of the GOlr autocomplete query
+FIELD_WEIGHTS = {"id": 2.0, "label": 1.0, "name": 1.0, "synonym": 0.5}
+# the weight lost per word before the matched one, so that "hedgehog" ranks "hedgehog" above "sonic hedgehog"
+POSITION_PENALTY = 0.1
+TERM_FIELDS = "id,annotation_class_label,synonym"
+BIOENTITY_FIELDS = "id,bioentity_label,bioentity_name,synonym,taxon,taxon_label"
+INSERT_BATCH_SIZE = 10000
+# greater than any UTF-8 continuation of a key, so that [prefix, prefix + KEY_END) holds the keys starting with prefix
+KEY_END = "\U0010ffff"
+# the best match of each entity with a key in a range, the filters of the entities being formatted in
+SEARCH_QUERY = (
+    "SELECT e.id, e.category, e.label, e.name, e.taxon, e.taxon_label, k.field, k.value, MAX(k.score) AS score"
+    " FROM prefix k JOIN entity e ON e.rowid = k.entity WHERE k.key >= ? AND k.key < ?{} GROUP BY k.entity"
+    " ORDER BY score DESC, length(k.value), e.id LIMIT ? OFFSET ?"
+)
+# prefixes matching more keys than this are too costly to rank per query: their best matches are ranked at build time
+FREQUENT_PREFIX_KEYS = 500
+# the number of best matches of a frequent prefix kept per category and taxon
+TOP_PREFIX_ROWS = 100
+TOP_SEARCH_QUERY = (
+    "SELECT e.id, e.category, e.label, e.name, e.taxon, e.taxon_label, k.field, k.value, k.score"
+    " FROM top_prefix k JOIN entity e ON e.rowid = k.entity WHERE k.key = ?{}"
+    " ORDER BY k.score DESC, length(k.value), e.id LIMIT ? OFFSET ?"
+)
+# the prefixes one character longer than the frequent ones of the previous length, that are frequent too
+FREQUENT_PREFIX_QUERY = (
+    "INSERT INTO frequent SELECT substr(k.key, 1, ?) FROM parent p JOIN prefix k ON k.key >= p.key AND k.key < p.key"
+    " || ? WHERE length(k.key) >= ? GROUP BY 1 HAVING count(*) > ?"
+)
+# the best match of each entity per frequent prefix, among the TOP_PREFIX_ROWS best of its category and taxon
+TOP_PREFIX_QUERY = (
+    "INSERT INTO top_prefix SELECT key, entity, field, value, score FROM ("
+    " SELECT *, ROW_NUMBER() OVER (PARTITION BY key, category, taxon ORDER BY score DESC, length(value), id) AS rank"
+    " FROM ("
+    "  SELECT f.key, e.category, e.taxon, e.id, k.entity, k.field, k.value, MAX(k.score) AS score"
+    "  FROM frequent f JOIN prefix k ON k.key >= f.key AND k.key < f.key || ? JOIN entity e ON e.rowid = k.entity"
+    "  GROUP BY f.key, k.entity"
+    " )"
+    ") WHERE rank <= ?"
+)
+SEARCH_COLUMNS = ["id", "category", "label", "name", "taxon", "taxon_label", "field", "value"]
+
+
+def get_autocomplete_index_connection():
+    """
+    Get the connection to the local autocomplete index, opening it on first use.
+
+    It is opened memory-mapped, so that the workers of a server share its pages.
+
+    :return: The connection, or None if no index is configured.
+    :rtype: sqlite3.Connection
+    """
+    global autocomplete_database
+    if autocomplete_database is None and get_autocomplete_database():
+        logger.info("Opening the autocomplete index %s", get_autocomplete_database())
+        autocomplete_database = open_index(get_autocomplete_database())
+    return autocomplete_database
+
+
+def normalize(text: str):
+    """Lowercase a text and collapse its whitespace, as the keys of the index."""
+    return " ".join(text.lower().split())
+
+
+def search_index(connection, prefix: str, category: str = None, taxon=None, start: int = 0, rows: int = 100):
+    """
+    Look up the entities with a word starting with a prefix.
+
+    Entities are ranked by the weight of their best matching field, lowered by the position of the matched word
+    in it, then by the length of the field value. Prefixes matching more than FREQUENT_PREFIX_KEYS keys only
+    match the TOP_PREFIX_ROWS best entities of each category and taxon.
+
+    :param connection: The connection to the index, see idmapping_index.open_index.
+    :param prefix: The typed text, e.g. "sonic hed"; it can span several words.
+    :param category: gene or term, or None for both.
+    :param taxon: The NCBITaxon CURIEs the entities must belong to, or None; GO terms have no taxon.
+    :param start: The number of matching entities to skip.
+    :param rows: The maximum number of entities to return.
+    :return: A list of dictionaries with the id, category, label, name, taxon and taxon_label of the entities, and
+        the field and value their best match is in.
+    """
+    key = normalize(prefix.rstrip("*"))
+    if not key:
+        return []
+    frequent = connection.execute("SELECT 1 FROM top_prefix WHERE key = ? LIMIT 1", (key,)).fetchone() is not None
+    filters, parameters = "", [key] if frequent else [key, key + KEY_END]
+    if category is not None:
+        filters += " AND e.category = ?"
+        parameters.append(category)
+    if taxon:
+        filters += " AND e.taxon IN ({})".format(",".join("?" * len(taxon)))
+        parameters.extend(taxon)
+    query = TOP_SEARCH_QUERY if frequent else SEARCH_QUERY
+    results = connection.execute(query.format(filters), (*parameters, rows, start))
+    return [dict(zip(SEARCH_COLUMNS, row[:-1], strict=True)) for row in results]
+
+
+def highlight(value: str, prefix: str):
+    """
+    Emphasize the words of a value matched by a prefix, as solr highlights the matches of a term* query.
+
+    :param value: The matched field value, e.g. "Sonic hedgehog".
+    :param prefix: The typed text, e.g. "hed".
+    :return: The value with the matched words in <em> tags, e.g. "Sonic <em>hedgehog</em>".
+    """
+    words = normalize(prefix.rstrip("*")).split()
+    if not words:
+        return value
+    # the matched words, the last one being a prefix
+    pattern = r"\s+".join([re.escape(word) + r"\b" for word in words[:-1]] + [re.escape(words[-1]) + r"\S*"])
+    return re.sub(r"(?i)(?<!\S)(" + pattern + ")", r"<em>\1</em>", value, count=1)
+
+
+def entity_keys(fields):
+    """
+    Return the keys of an entity: every field value starting at each of its words, weighted by field and position.
+
+    :param fields: A list of (field, value) pairs, field being a key of FIELD_WEIGHTS.
+    :return: An iterator over (key, field, value, score) tuples.
+    """
+    for field, value in fields:
+        words = normalize(value).split()
+        for position in range(len(words)):
+            yield " ".join(words[position:]), field, value, FIELD_WEIGHTS[field] - POSITION_PENALTY * position
+
+
+def term_entity(doc):
+    """Turn a GOlr ontology_class document into an index entity."""
+    fields = [("id", doc["id"]), ("label", doc.get("annotation_class_label"))]
+    fields += [("synonym", synonym) for synonym in doc.get("synonym") or []]
+    return {"id": doc["id"], "category": "term", "label": doc.get("annotation_class_label"), "fields": fields}
+
+
+def bioentity_entity(doc):
+    """Turn a GOlr bioentity document into an index entity."""
+    fields = [("id", doc["id"]), ("label", doc.get("bioentity_label")), ("name", doc.get("bioentity_name"))]
+    fields += [("synonym", synonym) for synonym in doc.get("synonym") or []]
+    return {
+        "id": doc["id"].replace("MGI:MGI:", "MGI:"),
+        "category": "gene",
+        "label": doc.get("bioentity_label"),
+        "name": doc.get("bioentity_name"),
+        "taxon": doc.get("taxon"),
+        "taxon_label": doc.get("taxon_label"),
+        "fields": fields,
+    }
+
+
+async def build_index(output: str, entities):
+    """
+    Build an autocomplete index.
+
+    The index is written next to the output and moved into place once complete, so a server can keep reading
+    the previous one in the meantime.
+
+    :param output: The path of the index.
+    :param entities: An async iterator over the entities, dictionaries with id, category, label, name, taxon,
+        taxon_label and fields, a list of (field, value) pairs to match, see term_entity and bioentity_entity.
+    :return: The number of entities in the index.
+    """
+    building = output + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+    connection = sqlite3.connect(building)
+    connection.execute(
+        "CREATE TABLE entity (id TEXT NOT NULL, category TEXT NOT NULL, label TEXT, name TEXT, taxon TEXT,"
+        " taxon_label TEXT)"
+    )
+    connection.execute(
+        "CREATE TABLE prefix (key TEXT NOT NULL, entity INTEGER NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL,"
+        " score REAL NOT NULL, PRIMARY KEY (key, entity, field, value)) WITHOUT ROWID"
+    )
+    connection.execute(
+        "CREATE TABLE top_prefix (key TEXT NOT NULL, entity INTEGER NOT NULL, field TEXT NOT NULL,"
+        " value TEXT NOT NULL, score REAL NOT NULL)"
+    )
+    count = 0
+    keys = []
+    async for entity in entities:
+        cursor = connection.execute(
+            "INSERT INTO entity VALUES (?, ?, ?, ?, ?, ?)",
+            [entity.get(column) for column in ["id", "category", "label", "name", "taxon", "taxon_label"]],
+        )
+        fields = [(field, value) for field, value in entity["fields"] if value]
+        keys.extend((key, cursor.lastrowid, field, value, score) for key, field, value, score in entity_keys(fields))
+        count += 1
+        if len(keys) >= INSERT_BATCH_SIZE:
+            connection.executemany("INSERT OR IGNORE INTO prefix VALUES (?, ?, ?, ?, ?)", keys)
+            keys = []
+    connection.executemany("INSERT OR IGNORE INTO prefix VALUES (?, ?, ?, ?, ?)", keys)
+    rank_frequent_prefixes(connection)
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+    os.replace(building, output)
+    return count
+
+
+def rank_frequent_prefixes(connection):
+    """
+    Rank the best matches of the frequent prefixes, one prefix length after the other.
+
+    Only the keys starting with a frequent prefix of the previous length are counted, as the prefixes of the others
+    can not be frequent.
+
+    :param connection: The connection to the index being built.
+    """
+    connection.execute("CREATE TEMP TABLE parent (key TEXT PRIMARY KEY)")
+    connection.execute("CREATE TEMP TABLE frequent (key TEXT PRIMARY KEY)")
+    connection.execute("INSERT INTO parent VALUES ('')")
+    length = 1
+    while True:
+        connection.execute(FREQUENT_PREFIX_QUERY, (length, KEY_END, length, FREQUENT_PREFIX_KEYS))
+        if connection.execute("SELECT 1 FROM frequent LIMIT 1").fetchone() is None:
+            break
+        connection.execute(TOP_PREFIX_QUERY, (KEY_END, TOP_PREFIX_ROWS))
+        connection.execute("DELETE FROM parent")
+        connection.execute("INSERT INTO parent SELECT key FROM frequent")
+        connection.execute("DELETE FROM frequent")
+        length += 1
+    connection.execute("CREATE INDEX top_prefix_key ON top_prefix (key)")
+
+
+async def golr_entities():
+    """
+    Dump the GO terms and the bioentities of GOlr, with solr cursors.
+
+    :return: An async iterator over the entities, see build_index.
+    """
+    async for doc in iterate_solr_on(
+        ESOLR.GOLR, ESOLRDoc.ONTOLOGY, TERM_FIELDS, filters='&fq=idspace:"GO"&fq=-is_obsolete:true'
+    ):
+        yield term_entity(doc)
+    async for doc in iterate_solr_on(ESOLR.GOLR, ESOLRDoc.BIOENTITY, BIOENTITY_FIELDS):
+        yield bioentity_entity(doc)
+
+
+def main():
+    """Build an autocomplete index from the command line."""
+    parser = argparse.ArgumentParser(description="Build the entity autocomplete index from the configured GOlr.")
+    parser.add_argument("output", help="path of the index, e.g. autocomplete.db")
+    args = parser.parse_args()
+    count = asyncio.run(build_index(args.output, golr_entities()))
+    print("Wrote {} entities to {}".format(count, args.output))
+
+
+if __name__ == "__main__":
+    main()
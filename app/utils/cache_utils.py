@@ -0,0 +1,229 @@
+"""in-process caches for upstream results."""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from app.utils.settings import get_cache_config
+
+logger = logging.getLogger()
+
+term_cache = None
+idmapping_cache = None
+facet_cache = None
+response_cache = None
+
+
+class TTLCache:
+
+    """
+    A bounded LRU cache whose entries expire after a time-to-live.
+
+    The cache holds at most max_entries entries and roughly max_bytes bytes of values; the least recently used
+    entries are evicted first. Entries are tagged with the release they were computed for, so the whole cache can
+    be dropped when a new release is published. Expired entries are kept for max_stale more seconds, for
+    get_with_age to serve them while they are recomputed.
+
+    :param max_entries: The maximum number of entries.
+    :param max_bytes: The (estimated) maximum size of the cached values, in bytes.
+    :param ttl: The number of seconds an entry stays valid.
+    :param max_stale: The number of seconds an expired entry can still be served by get_with_age.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float, max_stale: float = 0):
+        """Create an empty cache."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.release = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of entries, including expired ones that were not evicted yet."""
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Return the cached value of a key.
+
+        :param key: The key, e.g. a CURIE.
+        :param default: The value returned when the key is missing or expired.
+        :return: The cached value, or default.
+        """
+        entry = self.get_with_age(key, max_stale=0)
+        return default if entry is None else entry[0]
+
+    def get_with_age(self, key, max_stale: float = None):
+        """
+        Return the cached value of a key, even if it expired less than max_stale seconds ago.
+
+        :param key: The key, e.g. a CURIE.
+        :param max_stale: The number of seconds an expired value can still be returned, if not the max_stale of the
+            cache.
+        :return: A tuple of the value, its age in seconds and whether it expired, or None if the key is missing or
+            expired more than max_stale seconds ago.
+        :rtype: tuple
+        """
+        max_stale = self.max_stale if max_stale is None else max_stale
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + max_stale <= now:
+                if entry is not None and entry[0] + self.max_stale <= now:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            stale = entry[0] <= now
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return entry[2], now - entry[3], stale
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Cache a value, evicting the least recently used entries if the cache is full.
+
+        :param key: The key, e.g. a CURIE.
+        :param value: The value to cache.
+        :param ttl: The number of seconds this entry stays valid, if not the TTL of the cache.
+        """
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            now = time.monotonic()
+            self._entries[key] = (now + (self.ttl if ttl is None else ttl), size, value, now)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def set_release(self, release: str):
+        """
+        Record the release the cached values belong to, dropping every entry if it changed.
+
+        :param release: The release version, e.g. an ontology version IRI.
+        :return: True if the cache was invalidated.
+        :rtype: bool
+        """
+        if release == self.release:
+            return False
+        logger.info("Release changed from %s to %s, invalidating %s entries", self.release, release, len(self))
+        invalidated = self.release is not None
+        self.release = release
+        if invalidated:
+            self.invalidate()
+        return invalidated
+
+    def stats(self):
+        """Return the size and the hit/miss counters of the cache."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "release": self.release,
+        }
+
+    def _remove(self, key):
+        _expires_at, size, _value, _stored_at = self._entries.pop(key)
+        self._bytes -= size
+
+
+def _sizeof(value):
+    """Estimate the memory used by a (JSON-like) value."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_sizeof(v) for v in value)
+    return size
+
+
+def get_term_cache():
+    """
+    Get the cache of term labels and term metadata, creating it on first use.
+
+    :return: The term cache.
+    :rtype: TTLCache
+    """
+    global term_cache
+    if term_cache is None:
+        config = get_cache_config("terms")
+        term_cache = TTLCache(config["max_entries"], config["max_bytes"], config["ttl"])
+    return term_cache
+
+
+def get_idmapping_cache():
+    """
+    Get the cache of gene and protein identifier mappings, creating it on first use.
+
+    :return: The identifier mapping cache.
+    :rtype: TTLCache
+    """
+    global idmapping_cache
+    if idmapping_cache is None:
+        config = get_cache_config("idmapping")
+        idmapping_cache = TTLCache(config["max_entries"], config["max_bytes"], config["ttl"])
+    return idmapping_cache
+
+
+def get_facet_cache():
+    """
+    Get the cache of GOlr facet counts, creating it on first use.
+
+    :return: The facet cache.
+    :rtype: TTLCache
+    """
+    global facet_cache
+    if facet_cache is None:
+        config = get_cache_config("facets")
+        facet_cache = TTLCache(config["max_entries"], config["max_bytes"], config["ttl"])
+    return facet_cache
+
+
+def get_response_cache():
+    """
+    Get the cache of the responses of the cacheable routes, creating it on first use.
+
+    :return: The response cache.
+    :rtype: TTLCache
+    """
+    global response_cache
+    if response_cache is None:
+        config = get_cache_config("responses")
+        response_cache = TTLCache(config["max_entries"], config["max_bytes"], config["ttl"], config["max_stale"])
+    return response_cache
+
+
+async def run_periodically(interval: float, coroutine_function):
+    """
+    Await coroutine_function every interval seconds until cancelled, logging (and surviving) its errors.
+
+    :param interval: The number of seconds between two runs.
+    :param coroutine_function: The coroutine function to run.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await coroutine_function()
+        except Exception:
+            logger.exception("Periodic task %s failed", coroutine_function.__name__)
@@ -0,0 +1,302 @@
+"""in-memory is_a/part_of closure index of the ontology."""
+import json
+import logging
+from array import array
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.golr_utils import iterate_solr_on
+from app.utils.settings import ESOLR, ESOLRDoc, get_closure_index_config, get_user_agent
+
+logger = logging.getLogger()
+
+OBO_PREFIX = "http://purl.obolibrary.org/obo/"
+# the direct relations kept by the index; their position is the predicate code stored in the edge arrays
+PREDICATES = ("is_a", "BFO:0000050")
+GOLR_FIELDS = "id,annotation_class_label,isa_partof_closure,isa_partof_closure_label"
+GOLR_PAGE_SIZE = 2000
+
+closure_index = None
+
+
+class OntologyClosureIndex:
+
+    """
+    The is_a/part_of closure of an ontology, held as integer term ids in flat arrays.
+
+    Terms are numbered in the order they are added. The (reflexive) closure of term t is
+    closure[closure_offsets[t]:closure_offsets[t + 1]], the same list as the GOlr isa_partof_closure field;
+    the descendants and the direct is_a/part_of neighbours of a term are stored the same way.
+    Indexes built from a GOlr dump have no direct edges (has_edges is False).
+    """
+
+    def __init__(self):
+        """Create an empty index."""
+        self.ids = []
+        self.labels = []
+        self.index = {}
+        self.has_edges = False
+        self.closure_offsets = array("I", [0])
+        self.closure = array("I")
+        self.descendant_offsets = array("I", [0])
+        self.descendant_terms = array("I")
+        self.neighbour_offsets = array("I", [0])
+        self.neighbours = array("I")
+        self.neighbour_predicates = array("B")
+
+    def __len__(self):
+        """Return the number of terms."""
+        return len(self.ids)
+
+    def __contains__(self, id):
+        """Return whether a term has a closure in the index."""
+        return id in self.index
+
+    @classmethod
+    def from_golr_docs(cls, docs):
+        """
+        Build an index from GOlr ontology_class documents.
+
+        :param docs: The documents, with the id, annotation_class_label, isa_partof_closure and
+            isa_partof_closure_label fields.
+        :return: The index, without direct edges.
+        :rtype: OntologyClosureIndex
+        """
+        index = cls()
+        closures = {}
+        for doc in docs:
+            term = index._add_term(doc["id"], doc.get("annotation_class_label"))
+            labels = doc.get("isa_partof_closure_label") or []
+            closures[term] = [
+                index._add_term(ancestor, labels[i] if i < len(labels) else None)
+                for i, ancestor in enumerate(doc.get("isa_partof_closure") or [doc["id"]])
+            ]
+        index._set_closures(closures)
+        return index
+
+    @classmethod
+    def from_obographs(cls, graph_document):
+        """
+        Build an index from an obographs JSON document, e.g. http://purl.obolibrary.org/obo/go.json.
+
+        :param graph_document: The parsed obographs document; the is_a and part_of edges of its first graph are used.
+        :return: The index, with direct edges.
+        :rtype: OntologyClosureIndex
+        """
+        index = cls()
+        graph = graph_document["graphs"][0]
+        for node in graph.get("nodes", []):
+            if node.get("type") == "CLASS":
+                index._add_term(_curie(node["id"]), node.get("lbl"))
+        edges = []
+        parents = [[] for _ in index.ids]
+        for edge in graph.get("edges", []):
+            predicate = _curie(edge["pred"])
+            if predicate not in PREDICATES:
+                continue
+            sub = index._add_term(_curie(edge["sub"]), None)
+            obj = index._add_term(_curie(edge["obj"]), None)
+            parents.extend([] for _ in range(len(index.ids) - len(parents)))
+            parents[sub].append(obj)
+            edges.append((sub, PREDICATES.index(predicate), obj))
+        index._set_closures(_transitive_closures(parents))
+        index._set_edges(edges)
+        return index
+
+    def label(self, id):
+        """Return the label of a term, or None."""
+        return self.labels[self.index[id]]
+
+    def ancestors(self, id):
+        """
+        Return the is_a/part_of ancestors of a term, including the term itself.
+
+        :param id: The CURIE of the term, e.g. GO:0003677.
+        :return: The ancestor CURIEs, in the order of the GOlr isa_partof_closure field.
+        """
+        return [self.ids[t] for t in self._closure(self.index[id])]
+
+    def descendants(self, id):
+        """
+        Return the is_a/part_of descendants of a term, excluding the term itself.
+
+        :param id: The CURIE of the term, e.g. GO:0003677.
+        :return: The descendant CURIEs.
+        """
+        term = self.index[id]
+        return [
+            self.ids[t]
+            for t in self.descendant_terms[self.descendant_offsets[term] : self.descendant_offsets[term + 1]]
+        ]
+
+    def shared_ancestors(self, subject, object):
+        """
+        Return the is_a/part_of ancestors two terms have in common.
+
+        :param subject: The CURIE of the first term, e.g. GO:0006259.
+        :param object: The CURIE of the second term, e.g. GO:0046483.
+        :return: The shared ancestor CURIEs and their labels, in the order of the ancestors of subject.
+        """
+        object_closure = set(self._closure(self.index[object]))
+        shared = [t for t in self._closure(self.index[subject]) if t in object_closure]
+        return [self.ids[t] for t in shared], [self.labels[t] for t in shared]
+
+    def shared_neighbours(self, subject, object, predicate):
+        """
+        Return the terms directly related (as parent or child) to both terms by a predicate.
+
+        :param subject: The CURIE of the first term, e.g. GO:0006259.
+        :param object: The CURIE of the second term, e.g. GO:0046483.
+        :param predicate: is_a or BFO:0000050.
+        :return: The CURIEs of the shared neighbours.
+        """
+        code = PREDICATES.index(predicate)
+        object_neighbours = set(self._neighbours(self.index[object], code))
+        return [
+            self.ids[t] for t in dict.fromkeys(self._neighbours(self.index[subject], code)) if t in object_neighbours
+        ]
+
+    def direct_neighbours(self, id, predicate):
+        """
+        Return the terms directly related (as parent or child) to a term by a predicate.
+
+        :param id: The CURIE of the term, e.g. GO:0046483.
+        :param predicate: is_a or BFO:0000050.
+        :return: The CURIEs of the neighbours.
+        """
+        return [self.ids[t] for t in dict.fromkeys(self._neighbours(self.index[id], PREDICATES.index(predicate)))]
+
+    def _closure(self, term):
+        return self.closure[self.closure_offsets[term] : self.closure_offsets[term + 1]]
+
+    def _neighbours(self, term, code):
+        start, end = self.neighbour_offsets[term], self.neighbour_offsets[term + 1]
+        return [
+            t
+            for t, c in zip(self.neighbours[start:end], self.neighbour_predicates[start:end], strict=True)
+            if c == code
+        ]
+
+    def _add_term(self, id, label):
+        term = self.index.get(id)
+        if term is None:
+            term = self.index[id] = len(self.ids)
+            self.ids.append(id)
+            self.labels.append(label)
+        elif label is not None and self.labels[term] is None:
+            self.labels[term] = label
+        return term
+
+    def _set_closures(self, closures):
+        """Flatten the closures (term -> ancestor terms) and their inverse into the offset arrays."""
+        counts = [0] * len(self.ids)
+        for term in range(len(self.ids)):
+            ancestors = closures.get(term) or [term]
+            self.closure.extend(ancestors)
+            self.closure_offsets.append(len(self.closure))
+            for ancestor in ancestors:
+                if ancestor != term:
+                    counts[ancestor] += 1
+        self.descendant_offsets = _offsets(counts)
+        self.descendant_terms = array("I", [0]) * sum(counts)
+        position = array("I", self.descendant_offsets[:-1])
+        for term in range(len(self.ids)):
+            for ancestor in self._closure(term):
+                if ancestor != term:
+                    self.descendant_terms[position[ancestor]] = term
+                    position[ancestor] += 1
+
+    def _set_edges(self, edges):
+        """Store the (sub, predicate code, obj) edges as neighbours of both of their terms."""
+        counts = [0] * len(self.ids)
+        for sub, _code, obj in edges:
+            counts[sub] += 1
+            counts[obj] += 1
+        self.neighbour_offsets = _offsets(counts)
+        self.neighbours = array("I", [0]) * sum(counts)
+        self.neighbour_predicates = array("B", [0]) * sum(counts)
+        position = array("I", self.neighbour_offsets[:-1])
+        for sub, code, obj in edges:
+            for term, neighbour in ((sub, obj), (obj, sub)):
+                self.neighbours[position[term]] = neighbour
+                self.neighbour_predicates[position[term]] = code
+                position[term] += 1
+        self.has_edges = True
+
+
+def _curie(iri):
+    """Contract an OBO PURL to a CURIE, e.g. http://purl.obolibrary.org/obo/GO_0008150 to GO:0008150."""
+    if iri.startswith(OBO_PREFIX):
+        prefix, _, local_id = iri[len(OBO_PREFIX) :].partition("_")
+        return prefix + ":" + local_id
+    return iri
+
+
+def _offsets(counts):
+    """Return the offsets of consecutive runs of the given lengths."""
+    offsets = array("I", [0])
+    for count in counts:
+        offsets.append(offsets[-1] + count)
+    return offsets
+
+
+def _transitive_closures(parents):
+    """
+    Compute the reflexive transitive closure of every term of a DAG.
+
+    :param parents: The direct parents of every term.
+    :return: A dictionary of term -> closure, the term first, then its ancestors.
+    """
+    closures = {}
+    for root in range(len(parents)):
+        stack = [(root, False)]
+        while stack:
+            term, expanded = stack.pop()
+            if term in closures:
+                continue
+            if not expanded:
+                stack.append((term, True))
+                stack.extend((parent, False) for parent in parents[term] if parent not in closures)
+                continue
+            closure = {term: None}
+            for parent in parents[term]:
+                # a parent without a closure yet is part of a cycle
+                closure.update(dict.fromkeys(closures.get(parent, (parent,))))
+            closures[term] = list(closure)
+    return closures
+
+
+def get_closure_index():
+    """
+    Get the closure index, if it is enabled and loaded.
+
+    :return: The closure index, or None.
+    :rtype: OntologyClosureIndex
+    """
+    return closure_index
+
+
+async def load_closure_index():
+    """Build the closure index from its configured source and swap it in for the current one."""
+    global closure_index
+    source = get_closure_index_config()["source"]
+    logger.info("Building the ontology closure index from %s", source)
+    if source == "golr":
+        docs = [doc async for doc in iterate_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, GOLR_FIELDS, GOLR_PAGE_SIZE)]
+        index = await run_in_threadpool(OntologyClosureIndex.from_golr_docs, docs)
+    else:
+        if source.startswith("http"):
+            async with httpx.AsyncClient(
+                follow_redirects=True, timeout=300, headers={"User-Agent": get_user_agent()}
+            ) as client:
+                response = await client.get(source)
+                response.raise_for_status()
+                content = response.content
+        else:
+            with open(source, "rb") as f:
+                content = f.read()
+        graph_document = await run_in_threadpool(json.loads, content)
+        index = await run_in_threadpool(OntologyClosureIndex.from_obographs, graph_document)
+    closure_index = index
+    logger.info("Ontology closure index loaded: %s terms, %s closure entries", len(index), len(index.closure))
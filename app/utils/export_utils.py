@@ -0,0 +1,45 @@
+"""streaming export utilities."""
+import json
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "tsv": "text/tab-separated-values"}
+# number of rows written to the response at once
+EXPORT_WRITE_SIZE = 1000
+# separator of the values of multivalued fields in TSV cells, as in GAF files
+TSV_VALUE_SEPARATOR = "|"
+
+
+async def stream_export(docs, fields, format: str):
+    """
+    Serialize documents as NDJSON or TSV, as they are received.
+
+    :param docs: An async iterator over the documents, e.g. iterate_solr_on.
+    :param fields: The fields to export, in column order; missing fields are null (NDJSON) or empty (TSV).
+    :param format: ndjson or tsv; TSV starts with a header row.
+    :return: An async iterator over chunks of EXPORT_WRITE_SIZE rows; the TSV header comes with the first chunk,
+        so that the first document is fetched before anything is written.
+    """
+    serialize = _ndjson_row if format == "ndjson" else _tsv_row
+    lines = ["\t".join(fields)] if format == "tsv" else []
+    async for doc in docs:
+        lines.append(serialize(doc, fields))
+        if len(lines) >= EXPORT_WRITE_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _ndjson_row(doc, fields):
+    return json.dumps({field: doc.get(field) for field in fields})
+
+
+def _tsv_row(doc, fields):
+    return "\t".join(_tsv_cell(doc.get(field)) for field in fields)
+
+
+def _tsv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        value = TSV_VALUE_SEPARATOR.join(str(v) for v in value)
+    return str(value).replace("\t", " ").replace("\r", " ").replace("\n", " ")
@@ -1,10 +1,20 @@
 """golr utils."""
+import base64
+import binascii
+import json
+import logging
+from urllib.parse import quote
 
-import requests
+import httpx
+import orjson
+
+from app.utils.http_utils import decode_json, fetch
+
+logger = logging.getLogger()
 
 
 # Respect the method name for run_sparql_on with enums
-def run_solr_on(solr_instance, category, id, fields):
+async def run_solr_on(solr_instance, category, id, fields):
     """Return the result of a solr query on the given solrInstance, for a certain document_category and id."""
     query = (
         solr_instance.value
@@ -14,25 +24,27 @@ def run_solr_on(solr_instance, category, id, fields):
         + id
         + '"&fl='
         + fields
-        + "&wt=json&indent=on"
+        + "&wt=json"
     )
 
-    print(query)
-    timeout_seconds = 60  # Set the desired timeout value in seconds
+    logger.debug("GOlr query: %s", query)
 
     try:
-        response = requests.get(query, timeout=timeout_seconds)
+        # pooled, keep-alive client; the timeout comes from solr_url.timeout in conf/config.yaml
+        response = await fetch("solr_url", "GET", query)
 
-        return response.json()["response"]["docs"][0]
+        return decode_json(response)["response"]["docs"][0]
         # Process the response here
-    except requests.Timeout:
-        print("Request timed out")
-    except requests.RequestException as e:
-        print(f"Request error: {e}")
+    except httpx.TimeoutException:
+        logger.error("GOlr request timed out: %s", query)
+    except httpx.HTTPError as e:
+        logger.error("Error while querying GOlr: %s", e)
+    except orjson.JSONDecodeError as e:
+        logger.error("Invalid JSON response from GOlr: %s", e)
 
 
 # (ESOLR.GOLR, ESOLRDoc.ANNOTATION, q, qf, fields, fq, False)
-def gu_run_solr_text_on(
+async def gu_run_solr_text_on(
     solr_instance, category: str, q: str, qf: str, fields: str, optionals: str, highlight: bool = False
 ):
     """
@@ -49,12 +61,109 @@ def gu_run_solr_text_on(
     :return: The result of the query
 
     """
-    solr_url = solr_instance.value
+    query = _text_query(solr_instance, category, q, qf, fields, optionals)
+    logger.debug("GOlr query: %s", query)
+
+    try:
+        # pooled, keep-alive client; the timeout comes from solr_url.timeout in conf/config.yaml
+        response = await fetch("solr_url", "GET", query)
+
+        return _text_docs(decode_json(response), highlight)
+    except httpx.TimeoutException:
+        logger.error("GOlr request timed out: %s", query)
+    except httpx.HTTPError as e:
+        logger.error("Error while querying GOlr: %s", e)
+    except orjson.JSONDecodeError as e:
+        logger.error("Invalid JSON response from GOlr: %s", e)
+
+
+async def gu_run_solr_text_page_on(
+    solr_instance, category: str, q: str, qf: str, fields: str, optionals: str, cursor_mark: str = "*"
+):
+    """
+    Return a page of the result of a text query, walked with a solr cursor instead of start offsets.
+
+    Documents are sorted by relevance, then by id, as a cursor needs a total order.
+
+    :param solr_instance: The solr instance to query
+    :param category: The document category to query
+    :param q: The query string
+    :param qf: The query fields
+    :param fields: The fields to return
+    :param optionals: The optional parameters, e.g. the rows; they can not include start
+    :param cursor_mark: The solr cursorMark of the page, * for the first page
+    :return: The documents of the page, and the cursorMark of the next page (None after the last page)
+    """
+    query = (
+        _text_query(solr_instance, category, q, qf, fields, optionals, highlight=False)
+        + "&sort="
+        + quote("score desc,id asc")
+        + "&cursorMark="
+        + quote(cursor_mark, safe="")
+    )
+    response = await fetch("solr_url", "GET", query)
+    response.raise_for_status()
+    results = decode_json(response)
+    docs = _text_docs(results, highlight=False)
+    next_cursor_mark = results.get("nextCursorMark")
+    return docs, next_cursor_mark if next_cursor_mark != cursor_mark else None
+
+
+async def gu_run_solr_text_pivot_on(solr_instance, category: str, q: str, qf: str, optionals: str, pivot: str):
+    """
+    Return the facet pivot counts of a text query, without fetching any document.
+
+    :param solr_instance: The solr instance to query
+    :param category: The document category to query
+    :param q: The query string
+    :param qf: The query fields
+    :param optionals: The optional parameters, e.g. filter queries
+    :param pivot: The pivot fields, e.g. taxon,taxon_label
+    :return: The pivot counts, a list of {field, value, count, pivot} dictionaries
+    """
+    query = (
+        _text_query(solr_instance, category, q, qf, "id", optionals, highlight=False)
+        + "&rows=0&facet=on&facet.limit=-1&facet.mincount=1&facet.pivot="
+        + pivot
+    )
+    response = await fetch("solr_url", "GET", query)
+    response.raise_for_status()
+    return decode_json(response)["facet_counts"]["facet_pivot"].get(pivot, [])
+
+
+def _text_docs(results, highlight: bool):
+    """
+    Return the documents of a decoded text query response, with GOlr-style MGI ids made biolink-style.
+
+    :param results: The decoded solr response.
+    :param highlight: Whether to add the highlighting of each document to it, as "highlighting".
+    :return: The documents.
+    """
+    # solr returns matching text in the field "highlighting", but it is not included in the response.
+    # We add it to the response here to make it easier to use. Highlighting is keyed by the id of the document
+    highlighting = results.get("highlighting", {}) if highlight else None
+    docs = results["response"]["docs"]
+    for doc in docs:
+        doc_id = doc.get("id")
+        if highlight:
+            doc["highlighting"] = highlighting.get(doc_id, {}) if doc_id is not None else {}
+        if doc_id is not None and doc_id.startswith("MGI:"):
+            doc["id"] = doc_id.replace("MGI:MGI:", "MGI:")
+    return docs
+
 
+def _text_query(solr_instance, category, q: str, qf: str, fields: str, optionals: str, highlight: bool = True):
+    """Return the URL of a text query, see gu_run_solr_text_on."""
     if optionals is None:
         optionals = ""
-    query = (
-        solr_url
+    highlighting = ""
+    if highlight:
+        highlighting = (
+            "&hl=on&hl.snippets=1000&hl.fl=bioentity_name_searchable,bioentity_label_searchable,bioentity_class,"
+            "annotation_class_label_searchable,&hl.requireFieldMatch=true"
+        )
+    return (
+        solr_instance.value
         + "select?q="
         + q
         + "&qf="
@@ -63,39 +172,74 @@ def gu_run_solr_text_on(
         + category.value
         + '"&fl='
         + fields
-        + "&hl=on&hl.snippets=1000&hl.fl=bioentity_name_searchable,bioentity_label_searchable,bioentity_class,"
-        + "annotation_class_label_searchable,&hl.requireFieldMatch=true"
-        + "&wt=json&indent=on"
+        + highlighting
+        + "&wt=json"
         + optionals
     )
-    print(query)
-    timeout_seconds = 60  # Set the desired timeout value in seconds
 
+
+def encode_cursor(cursor_mark: str, **state):
+    """
+    Wrap a solr cursorMark in the opaque cursor token given to API clients.
+
+    :param cursor_mark: The solr cursorMark.
+    :param state: Anything else needed to fetch the next pages, e.g. the subjects the query fell back to.
+    :return: The URL-safe token.
+    """
+    cursor = json.dumps({"mark": cursor_mark, **state}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(cursor).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Unwrap a cursor token given by an API client.
+
+    :param cursor: The token, or * for the first page.
+    :return: The state of the cursor, with its solr cursorMark in "mark".
+    :raises ValueError: If the token is not a cursor token.
+    """
+    if cursor == "*":
+        return {"mark": "*"}
     try:
-        response = requests.get(query, timeout=timeout_seconds)
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor: {}".format(cursor)) from e
+    if not isinstance(state, dict) or not isinstance(state.get("mark"), str):
+        raise ValueError("Invalid cursor: {}".format(cursor))
+    return state
 
-        # solr returns matching text in the field "highlighting", but it is not included in the response.
-        # We add it to the response here to make it easier to use. Highlighting is keyed by the id of the document
-        if highlight:
-            highlight_added = []
-            for doc in response.json()["response"]["docs"]:
-                if doc.get("id") is not None and doc.get("id") in response.json()["highlighting"]:
-                    doc["highlighting"] = response.json()["highlighting"][doc["id"]]
-                    if doc.get("id").startswith("MGI:"):
-                        doc["id"] = doc["id"].replace("MGI:MGI:", "MGI:")
-                else:
-                    doc["highlighting"] = {}
-                highlight_added.append(doc)
-            return highlight_added
-        else:
-            return_doc = []
-            for doc in response.json()["response"]["docs"]:
-                if doc.get("id") is not None and doc.get("id").startswith("MGI:"):
-                    doc["id"] = doc["id"].replace("MGI:MGI:", "MGI:")
-                return_doc.append(doc)
-            return return_doc
-            # Process the response here
-    except requests.Timeout:
-        print("Request timed out")
-    except requests.RequestException as e:
-        print(f"Request error: {e}")
+
+async def iterate_solr_on(solr_instance, category, fields: str, rows: int = 1000, filters: str = ""):
+    """
+    Page through every document of a document_category using a solr cursor.
+
+    :param solr_instance: The solr instance to query
+    :param category: The document category to query
+    :param fields: The fields to return
+    :param rows: The number of documents fetched per request
+    :param filters: Extra filter queries, e.g. '&fq=idspace:"GO"'
+    :return: An async iterator over the documents, sorted by id
+    """
+    query = (
+        solr_instance.value
+        + 'select?q=*:*&fq=document_category:"'
+        + category.value
+        + '"'
+        + filters
+        + "&fl="
+        + fields
+        + "&rows="
+        + str(rows)
+        + "&sort=id+asc&wt=json&cursorMark="
+    )
+    cursor = "*"
+    while True:
+        # every page is fetched once, so it is kept out of the single-flight and the shared cache
+        response = await fetch("solr_url", "GET", query + quote(cursor, safe=""), shared=False)
+        response.raise_for_status()
+        results = decode_json(response)
+        for doc in results["response"]["docs"]:
+            yield doc
+        if results.get("nextCursorMark", cursor) == cursor:
+            break
+        cursor = results["nextCursorMark"]
@@ -0,0 +1,209 @@
+"""shared, connection-pooled async HTTP clients for the upstream services."""
+import asyncio
+import logging
+from urllib.parse import quote
+
+import httpx
+import orjson
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.settings import get_http_client_config, get_user_agent
+from app.utils.shared_cache import is_shared, shared_cache_key, shared_get, shared_set
+
+logger = logging.getLogger()
+
+# one client per upstream service (the config.yaml section name, e.g. solr_url), along with the event loop
+# it was created in; a client can not be shared across event loops.
+_clients = {}
+# one SingleFlight per upstream service, see fetch
+_single_flights = {}
+# the characters of a URL left as is, see requote_url; "%" keeps the escapes of the URL builders
+URL_SAFE_CHARACTERS = "!#$%&'()*+,/:;=?@[]~"
+
+
+class SingleFlight:
+
+    """
+    Coalesce concurrent identical calls: while a call is in flight, callers with the same key await its result.
+
+    The call is shielded, so that a caller going away does not cancel it for the others.
+    """
+
+    def __init__(self):
+        """Create a SingleFlight with no call in flight."""
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+
+    async def do(self, key, coroutine_function):
+        """
+        Return the result of coroutine_function(), sharing it with the concurrent calls with the same key.
+
+        :param key: The (hashable) key of the call, e.g. the URL of a request.
+        :param coroutine_function: The coroutine function making the call.
+        :return: The result of the call; its exception is raised to every caller.
+        """
+        # futures belong to an event loop, as the clients do
+        key = (asyncio.get_running_loop(), key)
+        future = self._in_flight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(coroutine_function())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._done(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def stats(self):
+        """Return the number of calls made, of calls coalesced into them, and of calls in flight."""
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+    def _done(self, key, future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if not future.cancelled():
+            # retrieved, in case every caller went away
+            future.exception()
+
+
+def get_async_client(service: str) -> httpx.AsyncClient:
+    """
+    Return the shared, keep-alive client for an upstream service.
+
+    The client is normally opened by the application lifespan; it is created lazily here if the running
+    event loop does not have one yet (e.g. when the app is driven by a TestClient without its context manager).
+
+    :param service: The config.yaml section of the service, e.g. solr_url.
+    :type service: str
+    :return: The pooled client for the service.
+    :rtype: httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(service)
+    if entry is not None:
+        client_loop, client = entry
+        if client_loop is loop and not client.is_closed:
+            return client
+
+    config = get_http_client_config(service)
+    limits = httpx.Limits(
+        max_connections=config["max_connections"],
+        max_keepalive_connections=config["max_keepalive_connections"],
+        keepalive_expiry=config["keepalive_expiry"],
+    )
+    logger.info("Creating a new HTTP client for %s with %s", service, limits)
+    client = httpx.AsyncClient(
+        timeout=config["timeout"],
+        limits=limits,
+        headers={"User-Agent": get_user_agent()},
+    )
+    _clients[service] = (loop, client)
+    return client
+
+
+async def close_async_clients():
+    """Close the clients that were created in the running event loop."""
+    loop = asyncio.get_running_loop()
+    for service, (client_loop, client) in list(_clients.items()):
+        if client_loop is loop:
+            await client.aclose()
+            del _clients[service]
+
+
+def get_single_flight(service: str) -> SingleFlight:
+    """
+    Return the SingleFlight of the requests to an upstream service, creating it on first use.
+
+    :param service: The config.yaml section of the service, e.g. solr_url.
+    :return: The SingleFlight of the service.
+    """
+    if service not in _single_flights:
+        _single_flights[service] = SingleFlight()
+    return _single_flights[service]
+
+
+async def fetch(service: str, method: str, url: str, *, shared: bool = True, **kwargs) -> httpx.Response:
+    """
+    Send a request with the pooled client of an upstream service, coalesced with the identical requests in flight.
+
+    Identical concurrent requests (e.g. the same popular autocomplete prefix) share one upstream round trip and
+    its response; callers must not modify the response, and decode its body themselves. If a shared cache is
+    configured for the service, 200 responses are also shared with the other workers of the host, see
+    shared_cache.
+
+    :param service: The config.yaml section of the service, e.g. solr_url.
+    :param method: The HTTP method, e.g. GET.
+    :param url: The URL.
+    :param shared: Whether the response is shared with identical requests; False for the pages of a cursor walk
+        (exports, index builds), which are not requested again and would evict the useful cache entries.
+    :param kwargs: The other arguments of httpx.AsyncClient.request, e.g. data or headers.
+    :return: The response.
+    """
+    url = requote_url(url)
+    if not shared:
+        return await get_async_client(service).request(method, url, **kwargs)
+    key = (method, url, repr(kwargs))
+    return await get_single_flight(service).do(key, lambda: _fetch_shared(service, method, url, kwargs))
+
+
+async def _fetch_shared(service: str, method: str, url: str, kwargs):
+    """Send a request, unless the shared cache has its response body; the cache is read in the thread pool."""
+    if not is_shared(service):
+        return await get_async_client(service).request(method, url, **kwargs)
+    key = shared_cache_key(service, method, url, repr(kwargs))
+    content = await run_in_threadpool(shared_get, service, key)
+    if content is not None:
+        return httpx.Response(200, content=content, request=httpx.Request(method, url))
+    response = await get_async_client(service).request(method, url, **kwargs)
+    if response.status_code == 200:
+        await run_in_threadpool(shared_set, service, key, response.content)
+    return response
+
+
+def requote_url(url: str) -> str:
+    """
+    Escape the characters of a URL that are not allowed in it, leaving its escapes (e.g. %2A) as they are.
+
+    The solr URLs are built as strings mixing raw characters (e.g. the quotes of document_category:"annotation")
+    and escaped values (e.g. a cursorMark); httpx before 0.25 escapes the whole query again when it has raw
+    characters, turning %2A into %252A.
+
+    :param url: The URL.
+    :return: The URL, with only allowed characters.
+    """
+    return quote(url, safe=URL_SAFE_CHARACTERS)
+
+
+def single_flight_stats():
+    """Return the stats of the SingleFlight of each upstream service, see SingleFlight.stats."""
+    return {service: single_flight.stats() for service, single_flight in _single_flights.items()}
+
+
+def decode_json(response: httpx.Response):
+    """
+    Decode the JSON body of a response with orjson, which is several times faster than json on large solr pages.
+
+    Decode each response once and keep the result; response.json() parses the whole body again on every call.
+
+    :param response: The response.
+    :return: The decoded body.
+    """
+    return orjson.loads(response.content)
+
+
+async def gather_bounded(coroutines, limit: int):
+    """
+    Run coroutines concurrently, at most limit at a time, and return their results in order.
+
+    :param coroutines: The coroutines to run.
+    :param limit: The maximum number of coroutines running at once, e.g. the max_concurrent_queries of a service.
+    :return: The list of results.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
@@ -0,0 +1,213 @@
+"""
+on-disk gene <-> protein identifier index, built from GPI or UniProt idmapping files.
+
+Build it with:
+
+    python -m app.utils.idmapping_index idmapping.db goa_human.gpi.gz HUMAN_9606_idmapping.dat.gz
+
+and set idmapping.database in conf/config.yaml to the path of the index.
+"""
+import argparse
+import gzip
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger()
+
+# the UniProt idmapping ID types kept in the index, and the prefix of their CURIEs
+UNIPROT_ID_TYPES = {"GeneID": "NCBIGene", "HGNC": "HGNC", "Ensembl": "ENSEMBL"}
+# xref prefixes as spelled in GPI files -> the prefix used by the API
+XREF_PREFIXES = {"Ensembl": "ENSEMBL", "EnsemblGenome": "ENSEMBL", "NCBI_Gene": "NCBIGene", "EntrezGene": "NCBIGene"}
+# the maximum number of identifiers looked up in a single query
+LOOKUP_BATCH_SIZE = 500
+MMAP_SIZE = 1024 * 1024 * 1024
+# the version of the index schema, stored as its user_version; version 2 added the Swiss-Prot flag of the proteins
+INDEX_VERSION = 2
+# the GPI property of a protein giving its UniProtKB section
+DB_SUBSET_PROPERTIES = {"db_subset", "db-subset"}
+
+
+def open_index(path: str, version: int = None):
+    """
+    Open an identifier index read-only, memory-mapped so that the workers of a server share its pages.
+
+    :param path: The path of the index.
+    :param version: The schema version the index must have (its user_version), e.g. INDEX_VERSION; not checked if
+        None.
+    :return: The connection to the index.
+    :rtype: sqlite3.Connection
+    :raises ValueError: If the index was built with another version of the schema, and needs to be rebuilt.
+    """
+    connection = sqlite3.connect("file:{}?mode=ro".format(path), uri=True, check_same_thread=False)
+    (user_version,) = connection.execute("PRAGMA user_version").fetchone()
+    if version is not None and user_version != version:
+        connection.close()
+        raise ValueError("The index {} has version {}, expected {}".format(path, user_version, version))
+    connection.execute("PRAGMA mmap_size = {}".format(MMAP_SIZE))
+    return connection
+
+
+def lookup_proteins(connection, genes):
+    """
+    Look up the proteins of genes.
+
+    :param connection: The connection to the index, see open_index.
+    :param genes: The gene CURIEs, e.g. HGNC:10848.
+    :return: A dictionary of gene CURIE -> list of UniProtKB CURIEs (Swiss-Prot if any, else TrEMBL), for the genes
+        in the index.
+    """
+    proteins = {}
+    reviewed_genes = set()
+    query = "SELECT gene, protein, reviewed FROM mapping WHERE gene IN ({}) ORDER BY gene, reviewed DESC, protein"
+    for gene, protein, reviewed in _lookup(connection, query, genes):
+        if reviewed:
+            reviewed_genes.add(gene)
+        elif gene in reviewed_genes:
+            continue
+        proteins.setdefault(gene, []).append(protein)
+    return proteins
+
+
+def lookup_genes(connection, proteins, prefix: str = "HGNC:"):
+    """
+    Look up the genes of proteins.
+
+    :param connection: The connection to the index, see open_index.
+    :param proteins: The UniProtKB CURIEs, e.g. UniProtKB:Q15465.
+    :param prefix: The prefix of the genes to return.
+    :return: A dictionary of UniProtKB CURIE -> the first of its genes with the prefix, for the proteins in the index.
+    """
+    genes = {}
+    query = "SELECT protein, gene FROM mapping WHERE protein IN ({}) AND gene LIKE ?"
+    for protein, gene in _lookup(connection, query, proteins, (prefix + "%",)):
+        genes.setdefault(protein, gene)
+    return genes
+
+
+def _lookup(connection, query, ids, parameters=()):
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        chunk = ids[i : i + LOOKUP_BATCH_SIZE]
+        yield from connection.execute(query.format(",".join("?" * len(chunk))), (*chunk, *parameters))
+
+
+def parse_uniprot_idmapping(lines):
+    """
+    Parse a UniProt idmapping file (accession, ID type, ID), e.g. HUMAN_9606_idmapping.dat.
+
+    The lines of an accession start with its entry name (UniProtKB-ID), which tells Swiss-Prot entries from TrEMBL
+    entries: the name of a TrEMBL entry is its accession followed by the species, e.g. A0A024R161_HUMAN.
+
+    :param lines: The lines of the file.
+    :return: An iterator over the (gene CURIE, UniProtKB CURIE, is Swiss-Prot) rows; protein isoforms are skipped.
+    """
+    # the file is grouped by accession, so only the Swiss-Prot accession being read is kept
+    reviewed_accession = None
+    for line in lines:
+        columns = line.rstrip("\n").split("\t")
+        if len(columns) >= 3 and columns[1] == "UniProtKB-ID":
+            reviewed_accession = None if columns[2].startswith(columns[0] + "_") else columns[0]
+            continue
+        if len(columns) < 3 or columns[1] not in UNIPROT_ID_TYPES or "-" in columns[0]:
+            continue
+        accession, id_type, id = columns[:3]
+        if id_type == "Ensembl":
+            # Ensembl gene ids are versioned, e.g. ENSG00000164690.9
+            id = id.split(".", 1)[0]
+        prefix = UNIPROT_ID_TYPES[id_type]
+        gene = id if id.startswith(prefix + ":") else prefix + ":" + id
+        yield gene, "UniProtKB:" + accession, accession == reviewed_accession
+
+
+def parse_gpi(lines):
+    """
+    Parse a GPI 1.2 or 2.0 file, e.g. goa_human.gpi or mgi.gpi.
+
+    Proteins are mapped to the genes in their cross references, and genes to the proteins in theirs. A protein is
+    Swiss-Prot if its db_subset property says so, e.g. in the GOA files.
+
+    :param lines: The lines of the file.
+    :return: An iterator over the (gene CURIE, UniProtKB CURIE, is Swiss-Prot) rows.
+    """
+    version = "1.2"
+    for line in lines:
+        if line.startswith("!"):
+            if line.startswith("!gpi-version:"):
+                version = line.split(":", 1)[1].strip()
+            continue
+        columns = line.rstrip("\n").split("\t")
+        if version.startswith("2"):
+            if len(columns) < 10:
+                continue
+            id, xrefs, properties = columns[0], columns[9], columns[10] if len(columns) > 10 else ""
+        else:
+            if len(columns) < 9:
+                continue
+            db, local_id, xrefs, properties = columns[0], columns[1], columns[8], columns[9] if len(columns) > 9 else ""
+            id = local_id if local_id.startswith(db + ":") else db + ":" + local_id
+        reviewed = any(
+            key in DB_SUBSET_PROPERTIES and value == "Swiss-Prot"
+            for key, _, value in (property.partition("=") for property in properties.split("|"))
+        )
+        for xref in filter(None, xrefs.split("|")):
+            prefix, _, local_id = xref.partition(":")
+            xref = XREF_PREFIXES.get(prefix, prefix) + ":" + local_id
+            if id.startswith("UniProtKB:") and not xref.startswith("UniProtKB:"):
+                yield xref, id, reviewed
+            elif xref.startswith("UniProtKB:") and not id.startswith("UniProtKB:"):
+                yield id, xref, False
+
+
+def build_index(output: str, paths):
+    """
+    Build an identifier index from GPI and UniProt idmapping files (optionally gzipped).
+
+    The index is written next to the output and moved into place once complete, so a server can keep reading
+    the previous one in the meantime.
+
+    :param output: The path of the index.
+    :param paths: The paths of the files; files with idmapping in their name are read as UniProt idmapping files.
+    :return: The number of (gene, protein) pairs in the index.
+    """
+    building = output + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+    connection = sqlite3.connect(building)
+    connection.execute(
+        "CREATE TABLE mapping (gene TEXT NOT NULL, protein TEXT NOT NULL, reviewed INTEGER NOT NULL,"
+        " PRIMARY KEY (gene, protein)) WITHOUT ROWID"
+    )
+    for path in paths:
+        logger.info("Loading %s", path)
+        parse = parse_uniprot_idmapping if "idmapping" in os.path.basename(path) else parse_gpi
+        with (gzip.open if path.endswith(".gz") else open)(path, "rt") as f:
+            # a protein is Swiss-Prot if any of the files says so
+            connection.executemany(
+                "INSERT INTO mapping VALUES (?, ?, ?)"
+                " ON CONFLICT (gene, protein) DO UPDATE SET reviewed = max(reviewed, excluded.reviewed)",
+                parse(f),
+            )
+        connection.commit()
+    connection.execute("CREATE INDEX mapping_protein ON mapping (protein, gene)")
+    (count,) = connection.execute("SELECT count(*) FROM mapping").fetchone()
+    connection.execute("PRAGMA user_version = {}".format(INDEX_VERSION))
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+    os.replace(building, output)
+    return count
+
+
+def main():
+    """Build an identifier index from the command line."""
+    parser = argparse.ArgumentParser(description="Build the gene <-> protein identifier index.")
+    parser.add_argument("output", help="path of the index, e.g. idmapping.db")
+    parser.add_argument("files", nargs="+", help="GPI or UniProt idmapping files, optionally gzipped")
+    args = parser.parse_args()
+    count = build_index(args.output, args.files)
+    print("Wrote {} gene/protein pairs to {}".format(count, args.output))
+
+
+if __name__ == "__main__":
+    main()
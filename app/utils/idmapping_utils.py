@@ -0,0 +1,187 @@
+"""gene and protein identifier mapping with a local index and MyGene.info."""
+import asyncio
+import logging
+
+import orjson
+from biothings_client import get_client
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.cache_utils import get_idmapping_cache
+from app.utils.idmapping_index import INDEX_VERSION, lookup_genes, lookup_proteins, open_index
+from app.utils.settings import get_cache_config, get_idmapping_database
+from app.utils.shared_cache import is_shared, shared_cache_key, shared_get_many, shared_set_many
+
+logger = logging.getLogger()
+
+mygene_client = None
+idmapping_database = None
+
+# MyGene.info fields to search, by CURIE prefix; other prefixes (e.g. ZFIN, RGD) are MyGene.info fields themselves
+MYGENE_SCOPES = {"NCBIGene": "entrezgene", "ENSEMBL": "ensembl.gene", "UniProtKB": "uniprot"}
+# MyGene.info keeps the prefix in these fields, e.g. MGI:98214
+PREFIXED_FIELDS = {"MGI"}
+
+
+def get_mygene_client():
+    """
+    Get the MyGene.info client, creating it on first use.
+
+    :return: The MyGene.info client.
+    """
+    global mygene_client
+    if mygene_client is None:
+        mygene_client = get_client("gene")
+    return mygene_client
+
+
+def get_idmapping_database_connection():
+    """
+    Get the connection to the local identifier index, opening it on first use.
+
+    :return: The connection, or None if no index is configured or it needs to be rebuilt.
+    :rtype: sqlite3.Connection
+    """
+    global idmapping_database
+    if idmapping_database is None and get_idmapping_database():
+        logger.info("Opening the identifier index %s", get_idmapping_database())
+        try:
+            idmapping_database = open_index(get_idmapping_database(), INDEX_VERSION)
+        except ValueError as e:
+            logger.error("%s, rebuild it; using MyGene.info only", e)
+            # do not try to open it again
+            idmapping_database = False
+    return idmapping_database or None
+
+
+async def genes_to_uniprot(ids):
+    """
+    Map genes to their UniProtKB proteins.
+
+    Genes that are not in the local index are resolved with one MyGene.info query per identifier prefix.
+
+    :param ids: The gene CURIEs, e.g. HGNC:10848 or NCBIGene:6469.
+    :return: A dictionary of gene CURIE -> list of UniProtKB CURIEs (Swiss-Prot if any, else TrEMBL); the list is
+        empty if the gene is unknown or MyGene.info could not be reached.
+    """
+    return await _map_ids("uniprot", ids, "uniprot", _uniprot_ids, [], lookup_proteins)
+
+
+async def uniprot_to_genes(ids):
+    """
+    Map UniProtKB proteins to their HGNC genes.
+
+    Proteins that are not in the local index are resolved with a single MyGene.info query.
+
+    :param ids: The UniProtKB CURIEs, e.g. UniProtKB:Q15465.
+    :return: A dictionary of UniProtKB CURIE -> HGNC CURIE, or None if the protein has no HGNC gene.
+    """
+    return await _map_ids("HGNC", ids, "HGNC", _hgnc_id, None, lookup_genes)
+
+
+async def _map_ids(direction, ids, fields, parse, missing, lookup):
+    """
+    Map identifiers with the local identifier index and the cache, querying MyGene.info for the misses.
+
+    :param direction: The name of the mapping, part of the cache keys.
+    :param ids: The CURIEs to map.
+    :param fields: The MyGene.info fields to return.
+    :param parse: The function turning the MyGene.info hits of an identifier into its mapping.
+    :param missing: The mapping of an identifier without hits.
+    :param lookup: The function looking identifiers up in the local index.
+    :return: A dictionary of CURIE -> mapping, in the order of ids.
+    """
+    cache = get_idmapping_cache()
+    connection = get_idmapping_database_connection()
+    mappings = lookup(connection, ids) if connection is not None else {}
+    negative_ttl = get_cache_config("idmapping")["negative_ttl"]
+    misses = []
+    for id in ids:
+        if id in mappings:
+            continue
+        mapping = cache.get((direction, id))
+        if mapping is not None:
+            mappings[id] = mapping[0]
+        else:
+            misses.append(id)
+
+    if misses and is_shared("mygene"):
+        # the mappings another worker of the host got from MyGene.info
+        shared = await run_in_threadpool(
+            shared_get_many, "mygene", [shared_cache_key("mygene", direction, id) for id in misses]
+        )
+        for id, content in zip(misses, shared, strict=True):
+            if content is not None:
+                mapping = tuple(orjson.loads(content))
+                cache.set((direction, id), mapping, None if mapping[0] else negative_ttl)
+                mappings[id] = mapping[0]
+
+    queries = {}
+    for id in misses:
+        if id not in mappings:
+            prefix, _, local_id = id.partition(":")
+            scope = MYGENE_SCOPES.get(prefix, prefix)
+            queries.setdefault(scope, {})[id if prefix in PREFIXED_FIELDS else local_id] = id
+
+    if queries:
+        shared_entries = []
+        scopes = list(queries)
+        results = await asyncio.gather(
+            *[_querymany(list(queries[scope]), scope, fields) for scope in scopes], return_exceptions=True
+        )
+        for scope, hits in zip(scopes, results, strict=True):
+            if isinstance(hits, Exception):
+                logger.error("Error while querying MyGeneInfo with %s: %s", list(queries[scope].values()), hits)
+                for id in queries[scope].values():
+                    mappings[id] = missing
+                continue
+            hits_by_query = {}
+            for hit in hits:
+                if not hit.get("notfound"):
+                    hits_by_query.setdefault(hit["query"], []).append(hit)
+            for query, id in queries[scope].items():
+                mapping = parse(hits_by_query.get(query, []))
+                mappings[id] = mapping
+                # the mapping is wrapped in a tuple, as None is a valid (negative) mapping
+                cache.set((direction, id), (mapping,), None if mapping else negative_ttl)
+                shared_entries.append(
+                    (
+                        shared_cache_key("mygene", direction, id),
+                        orjson.dumps([mapping]),
+                        None if mapping else negative_ttl,
+                    )
+                )
+        if shared_entries and is_shared("mygene"):
+            await run_in_threadpool(shared_set_many, "mygene", shared_entries)
+
+    return {id: mappings[id] for id in ids}
+
+
+async def _querymany(query_terms, scope, fields):
+    """Run one (blocking) MyGene.info querymany call in the thread pool."""
+    logger.info("Querying MyGeneInfo for %s identifiers in %s", len(query_terms), scope)
+    return await run_in_threadpool(
+        get_mygene_client().querymany, query_terms, scopes=scope, fields=fields, verbose=False
+    )
+
+
+def _uniprot_ids(hits):
+    """Return the UniProtKB CURIEs of the hits of a gene: their Swiss-Prot ids, or their TrEMBL ids."""
+    uniprot_ids = []
+    for hit in hits:
+        if "uniprot" not in hit:
+            continue
+        ids = hit["uniprot"]["Swiss-Prot"] if "Swiss-Prot" in hit["uniprot"] else hit["uniprot"].get("TrEMBL", [])
+        if isinstance(ids, str):
+            ids = [ids]
+        for id in ids:
+            uniprot_ids.append(id if id.startswith("UniProtKB") else "UniProtKB:{}".format(id))
+    return uniprot_ids
+
+
+def _hgnc_id(hits):
+    """Return the HGNC CURIE of the first hit of a protein that has one, or None."""
+    for hit in hits:
+        if hit.get("HGNC"):
+            gene_id = str(hit["HGNC"])
+            return gene_id if gene_id.startswith("HGNC") else "HGNC:{}".format(gene_id)
+    return None
@@ -1,71 +1,212 @@
 """ontology utility functions."""
+import asyncio
+import copy
 import logging
+import re
 
 from linkml_runtime.utils.namespaces import Namespaces
-from oaklib.implementations.sparql.sparql_implementation import SparqlImplementation
-from oaklib.implementations.sparql.sparql_query import SparqlQuery
-from oaklib.resource import OntologyResource
 from ontobio.golr.golr_query import ESOLR, ESOLRDoc
 from ontobio.ontol_factory import OntologyFactory
 from ontobio.sparql.sparql_ontol_utils import SEPARATOR
+from starlette.concurrency import run_in_threadpool
 
+from app.utils.cache_utils import get_facet_cache, get_response_cache, get_term_cache
 from app.utils.golr_utils import gu_run_solr_text_on
-from app.utils.settings import get_golr_config, get_sparql_endpoint
+from app.utils.settings import get_golr_config
+from app.utils.shared_cache import set_shared_release
+from app.utils.sparql_utils import run_sparql_on
 
 cfg = get_golr_config()
 omap = {}
+namespaces = None
+# subset id -> categories of the subset, see get_ontology_subsets_by_id
+subsets = {}
+# maximum number of subsets in the registry, well above the number of GO subsets
+MAX_SUBSETS = 100
+
+# maximum number of IRIs per VALUES query when fetching labels
+LABEL_BATCH_SIZE = 200
+# characters that can not appear in a SPARQL IRI reference, see is_valid_iri
+INVALID_IRI_CHARACTERS = re.compile(r'[\s<>"{}|^`\\]')
+# marks a cache miss, as None is a valid (cached) label
+MISSING = object()
+
+GO_VERSION_SPARQL = "SELECT ?version WHERE { <http://purl.obolibrary.org/obo/go.owl> owl:versionIRI ?version } LIMIT 1"
 
 aspect_map = {"P": "GO:0008150", "F": "GO:0003674", "C": "GO:0005575"}
 logging.basicConfig(filename="combined_access_error.log", level=logging.INFO, format="%(asctime)s - %(message)s")
 logger = logging.getLogger()
 
 
-def batch_fetch_labels(ids):
+async def batch_fetch_labels(ids):
     """
     Fetch all rdfs:label assertions for a set of CURIEs.
 
+    The CURIEs are resolved with one VALUES query per LABEL_BATCH_SIZE CURIEs rather than one query per CURIE.
+    Labels are served from the term cache when possible.
+
     :param ids: List of CURIEs for which labels are to be fetched.
     :type ids: list
-    :return: Dictionary containing the CURIEs as keys and their corresponding labels as values.
+    :return: Dictionary containing the CURIEs as keys, in request order, and their corresponding labels as values.
+             CURIEs that can not be expanded or have no label map to None.
     :rtype: dict
     """
-    m = {}
+    cache = get_term_cache()
+    labels = {}
+    iris = {}
     for id in ids:
-        if id.startswith("MGI:"):
-            id = "MGI:" + id
-        label = goont_fetch_label(id)
-        if label is not None:
-            m[id] = label
-    return m
-
-
-def goont_fetch_label(id):
+        curie = id
+        if curie.startswith("MGI:"):
+            curie = "MGI:" + curie
+        label = cache.get(("label", curie), MISSING)
+        if label is not MISSING:
+            labels[id] = label
+            continue
+        try:
+            iris[id] = (curie, str(get_namespaces().uri_for(curie)))
+        except ValueError:
+            logger.info("Unknown CURIE prefix for %s", id)
+            labels[id] = None
+
+    if iris:
+        fetched = await fetch_labels_by_iri([iri for _curie, iri in iris.values()])
+        for id, (curie, iri) in iris.items():
+            labels[id] = fetched.get(iri)
+            cache.set(("label", curie), labels[id])
+    return {id: labels[id] for id in ids}
+
+
+async def goont_fetch_label(id):
     """
     Fetch all rdfs:label assertions for a URI.
 
     :param id: The URI for which the label is to be fetched.
     :type id: str
-    :return: List of labels for the given URI.
-    :rtype: list
+    :return: The label for the given URI, or None if it has none.
+    :rtype: str
+    """
+    cache = get_term_cache()
+    label = cache.get(("label", id), MISSING)
+    if label is MISSING:
+        iri = str(get_namespaces().uri_for(id))
+        labels = await fetch_labels_by_iri([iri])
+        label = labels.get(iri)
+        cache.set(("label", id), label)
+    return label
+
+
+async def fetch_labels_by_iri(iris):
+    """
+    Fetch the rdfs:label of each IRI, chunking the IRIs into VALUES queries of at most LABEL_BATCH_SIZE IRIs.
+
+    Invalid IRIs (e.g. expanded from a CURIE with a space or a ">") are left out of the queries, so that they do not
+    fail the query of the other IRIs of their chunk.
+
+    :param iris: List of IRIs for which labels are to be fetched.
+    :type iris: list
+    :return: Dictionary of IRI to label, for the IRIs that have a label.
+    :rtype: dict
+    """
+    unique_iris = []
+    for iri in dict.fromkeys(iris):
+        if is_valid_iri(iri):
+            unique_iris.append(iri)
+        else:
+            logger.info("Invalid IRI %r, not looked up", iri)
+    chunks = [unique_iris[i : i + LABEL_BATCH_SIZE] for i in range(0, len(unique_iris), LABEL_BATCH_SIZE)]
+    results = await asyncio.gather(*[run_sparql_on(create_labels_sparql(chunk)) for chunk in chunks])
+    labels = {}
+    for bindings in results:
+        for row in bindings:
+            labels.setdefault(row["iri"]["value"], row["label"]["value"])
+    return labels
+
+
+def is_valid_iri(iri: str):
+    """
+    Return whether an IRI can be written as a SPARQL IRI reference, <iri>.
+
+    :param iri: The IRI.
+    :return: False if the IRI is empty or has characters that would end the reference or inject query text.
+    :rtype: bool
+    """
+    return bool(iri) and INVALID_IRI_CHARACTERS.search(iri) is None
+
+
+def create_labels_sparql(iris):
+    """
+    Create SPARQL query for fetching the labels of a set of IRIs.
+
+    :param iris: The IRIs for which the labels are to be fetched, valid according to is_valid_iri.
+    :type iris: list
+    :return: SPARQL query string.
+    :rtype: str
+    """
+    values = " ".join("<" + iri + ">" for iri in iris)
+    return "SELECT ?iri ?label WHERE { VALUES ?iri { " + values + " } ?iri rdfs:label ?label }"
+
+
+def get_namespaces():
     """
-    ns = Namespaces()
-    ns.add_prefixmap("go")
-    iri = ns.uri_for(id)
-    ont_r = OntologyResource(url=get_sparql_endpoint())
-    si = SparqlImplementation(ont_r)
-    query = SparqlQuery(select=["?label"], where=["<" + iri + "> rdfs:label ?label"])
-    bindings = si._sparql_query(query.query_str())
-    rows = [r["label"]["value"] for r in bindings]
-    return rows[0]
+    Get the GO namespaces used to expand CURIEs, building them on first use.
+
+    :return: The GO namespaces.
+    :rtype: Namespaces
+    """
+    global namespaces
+    if namespaces is None:
+        namespaces = Namespaces()
+        namespaces.add_prefixmap("go")
+    return namespaces
 
 
-def get_ontology_subsets_by_id(id: str):
+async def get_ontology_subsets_by_id(id: str):
     """
     Get ontology subsets based on the provided identifier.
 
+    Subsets are loaded from GOlr once and kept in the subset registry; they are dropped when a new GO release is
+    published and reloaded in the background by refresh_ontology_subsets. Unknown ids, with no categories, are not
+    registered, and the registry holds at most MAX_SUBSETS subsets.
+
     :param id: The identifier for the ontology subset.
     :type id: str
-    :return: List of ontology subsets.
+    :return: List of ontology subsets, a copy the caller can modify.
+    :rtype: list
+    """
+    if id in subsets:
+        return copy.deepcopy(subsets[id])
+    result = await fetch_ontology_subsets_by_id(id)
+    if result and len(subsets) < MAX_SUBSETS:
+        subsets[id] = copy.deepcopy(result)
+    return result
+
+
+async def refresh_ontology_subsets():
+    """
+    Reload the subsets of the registry from GOlr, keeping the current version of a subset if it fails.
+
+    Subsets that are no longer in GOlr are dropped.
+    """
+    for id in list(subsets):
+        try:
+            result = await fetch_ontology_subsets_by_id(id)
+        except Exception:
+            logger.exception("Could not refresh the subset %s", id)
+            continue
+        if result:
+            subsets[id] = result
+        else:
+            logger.info("Subset %s is no longer in GOlr, dropping it", id)
+            subsets.pop(id, None)
+
+
+async def fetch_ontology_subsets_by_id(id: str):
+    """
+    Fetch the categories and terms of an ontology subset from GOlr.
+
+    :param id: The identifier for the ontology subset, e.g. goslim_agr.
+    :type id: str
+    :return: List of the categories of the subset, with their terms.
     :rtype: list
     """
     q = "*:*"
@@ -85,7 +226,7 @@ def get_ontology_subsets_by_id(id: str):
         fq = '&fq=annotation_class:("' + goslim_agr_ids + '")'
 
     fq = fq + "&rows=1000"
-    data = gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, q, qf, fields, fq, False)
+    data = await gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, q, qf, fields, fq, False)
 
     tr = {}
     for term in data:
@@ -101,7 +242,7 @@ def get_ontology_subsets_by_id(id: str):
         cats.append(category)
 
     fq = "&fq=annotation_class_label:(" + " or ".join(cats) + ")&rows=1000"
-    data = gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, q, qf, fields, fq, False)
+    data = await gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, q, qf, fields, fq, False)
 
     for category in tr:
         for temp in data:
@@ -117,19 +258,19 @@ def get_ontology_subsets_by_id(id: str):
 
         # if goslim_agr, reorder the list based on the temporary json object below
     if id == "goslim_agr":
+        categories_by_id = {}
+        for category in result:
+            categories_by_id.setdefault(category["annotation_class"], []).append(category)
         temp = []
         for agr_category in agr_slim_order:
-            cat = agr_category["category"]
-            for category in result:
-                if category["annotation_class"] == cat:
-                    ordered_terms = []
-                    for ordered_term in agr_category["terms"]:
-                        for unordered_term in category["terms"]:
-                            if unordered_term["annotation_class"] == ordered_term:
-                                ordered_terms.append(unordered_term)
-                                break
-                    category["terms"] = ordered_terms
-                    temp.append(category)
+            for category in categories_by_id.get(agr_category["category"], []):
+                terms_by_id = {}
+                for term in category["terms"]:
+                    terms_by_id.setdefault(term["annotation_class"], term)
+                category["terms"] = [
+                    terms_by_id[ordered_term] for ordered_term in agr_category["terms"] if ordered_term in terms_by_id
+                ]
+                temp.append(category)
         result = temp
 
     return result
@@ -251,6 +392,44 @@ agr_slim_order = [
 ]
 
 
+async def fetch_go_summary(goid):
+    """
+    Fetch the summary (label, definition, synonyms, ...) of a GO term, from the term cache when possible.
+
+    :param goid: The GO identifier for which the summary is to be fetched.
+    :type goid: str
+    :return: The bindings of the create_go_summary_sparql query.
+    :rtype: list
+    """
+    cache = get_term_cache()
+    results = cache.get(("summary", goid))
+    if results is None:
+        results = await run_sparql_on(create_go_summary_sparql(goid))
+        cache.set(("summary", goid), results)
+    return results
+
+
+async def sync_ontology_release():
+    """
+    Fetch the version IRI of GO from the triplestore and invalidate the caches and the subsets if it changed.
+
+    :return: True if a new release was published since the last check.
+    :rtype: bool
+    """
+    bindings = await run_sparql_on(GO_VERSION_SPARQL)
+    if not bindings:
+        logger.info("No version IRI found for GO, keeping the term cache")
+        return False
+    changed = get_term_cache().set_release(bindings[0]["version"]["value"])
+    get_facet_cache().set_release(bindings[0]["version"]["value"])
+    get_response_cache().set_release(bindings[0]["version"]["value"])
+    await run_in_threadpool(set_shared_release, bindings[0]["version"]["value"])
+    logger.info("Term cache: %s", get_term_cache().stats())
+    if changed:
+        subsets.clear()
+    return changed
+
+
 def create_go_summary_sparql(goid):
     """
     Create SPARQL query for fetching GO summary.
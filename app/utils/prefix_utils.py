@@ -1,5 +1,6 @@
 """prefix utility functions."""
 import logging
+from types import MappingProxyType
 
 from curies import Converter
 from prefixmaps import load_context
@@ -7,6 +8,11 @@ from prefixmaps import load_context
 logging.basicConfig(filename="combined_access_error.log", level=logging.INFO, format="%(asctime)s - %(message)s")
 logger = logging.getLogger()
 
+# built once per process, see get_prefixes, get_converter and get_prefix_list
+prefix_maps = {}
+converter = None
+prefix_list = None
+
 
 # have to remap prefixes from prefixmaps in order to match the prefixes in Minerva
 def remap_prefixes(cmap):
@@ -17,12 +23,81 @@ def remap_prefixes(cmap):
 
 
 def get_prefixes(context: str = "go"):
-    """Returns a dictionary of all prefixes in the GO namespace."""
-    context = load_context(context)
-    extended_prefix_map = context.as_extended_prefix_map()
-    converter = Converter.from_extended_prefix_map(extended_prefix_map)
-    cmaps = converter.prefix_map
-    # hacky solution to: https://github.com/geneontology/go-site/issues/2000
-    cmap_remapped = remap_prefixes(cmaps)
-
-    return cmap_remapped
+    """Returns a read-only dictionary of all prefixes in the GO namespace, built on first use."""
+    if context not in prefix_maps:
+        logger.info("Loading the %s prefix map", context)
+        extended_prefix_map = load_context(context).as_extended_prefix_map()
+        cmaps = dict(Converter.from_extended_prefix_map(extended_prefix_map).prefix_map)
+        # hacky solution to: https://github.com/geneontology/go-site/issues/2000
+        prefix_maps[context] = MappingProxyType(remap_prefixes(cmaps))
+    return prefix_maps[context]
+
+
+async def get_converter():
+    """
+    Returns the converter for the GO prefixes (including the Minerva remaps), built on first use.
+
+    A coroutine function, so that FastAPI runs it on the event loop rather than in the threadpool when it is used
+    as a dependency; it is built at startup, see app.main.lifespan.
+    """
+    global converter
+    if converter is None:
+        # have to set strict to "False" to allow for WB and WormBase as prefixes that
+        # map to the same expanded URI prefix
+        converter = Converter.from_prefix_map(dict(get_prefixes("go")), strict=False)
+    return converter
+
+
+def get_prefix_list():
+    """Returns the sorted prefixes of the GO namespace, built on first use."""
+    global prefix_list
+    if prefix_list is None:
+        prefix_list = tuple(sorted(get_prefixes("go")))
+    return prefix_list
+
+
+def expand_identifier(converter: Converter, id: str):
+    """
+    Expand one CURIE, reporting failures instead of raising.
+
+    :param converter: The converter to use, see get_converter.
+    :param id: The CURIE to expand, e.g. MGI:3588192 or MGI:MGI:3588192.
+    :return: A dictionary with the id, its uri (None if it could not be expanded) and an error message.
+    """
+    curie = id.strip()
+    if curie.startswith("MGI:MGI:"):
+        curie = curie.replace("MGI:MGI:", "MGI:")
+    uri = None
+    error = None
+    if not curie:
+        error = "empty identifier"
+    else:
+        try:
+            uri = converter.expand(curie)
+        except ValueError as e:
+            error = str(e)
+        if uri is None and error is None:
+            error = "unknown prefix"
+    return {"id": id, "uri": uri, "error": error}
+
+
+def contract_uri(converter: Converter, uri: str):
+    """
+    Contract one URI to a CURIE, reporting failures instead of raising.
+
+    :param converter: The converter to use, see get_converter.
+    :param uri: The URI to contract, e.g. http://purl.obolibrary.org/obo/GO_0008150.
+    :return: A dictionary with the uri, its id (None if it could not be contracted) and an error message.
+    """
+    id = None
+    error = None
+    if not uri.strip():
+        error = "empty uri"
+    else:
+        try:
+            id = converter.compress(uri.strip())
+        except ValueError as e:
+            error = str(e)
+        if id is None and error is None:
+            error = "unknown URI prefix"
+    return {"uri": uri, "id": id, "error": error}
@@ -0,0 +1,105 @@
+"""ribbon aggregation utilities."""
+from app.utils.ontology_utils import aspect_map
+
+
+def aggregate_ribbon_annotations(categories, annotations, cross_aspect: bool = False):
+    """
+    Summarize the annotations of one subject into the groups of the ribbon categories.
+
+    Each slim group gets a bit; the regulates_closure of every annotation is read once to build its bitset and
+    the (data ordered) list of annotations of each group, so the groups and the Other buckets are filled without
+    scanning the closures again.
+
+    :param categories: The ribbon categories, with their All, Term and Other groups.
+    :param annotations: The annotation documents of the subject, with the annotation_class, evidence_type,
+        regulates_closure and aspect fields.
+    :param cross_aspect: Whether annotations can be counted in the groups of another aspect.
+    :return: The groups, nb_classes and nb_annotations of the subject.
+    """
+    # one bit per distinct group id (the All group of a category has the id of the category)
+    group_bits = {}
+    for category in categories:
+        for group in category["groups"]:
+            if group["type"] != "Other":
+                group_bits.setdefault(group["id"], 1 << len(group_bits))
+
+    # the groups (All and Term) and the Term groups of each category, as bitsets
+    category_masks = []
+    for category in categories:
+        group_mask = 0
+        term_mask = 0
+        for group in category["groups"]:
+            if group["type"] != "Other":
+                group_mask |= group_bits[group["id"]]
+            if group["type"] == "Term":
+                term_mask |= group_bits[group["id"]]
+        category_masks.append((group_mask, term_mask))
+
+    # single pass over the closures: the group bitset of each annotation and the annotations of each group
+    masks = []
+    aspects = []
+    members = {}
+    for i, annotation in enumerate(annotations):
+        aspect = aspect_map[annotation["aspect"]]
+        mask = 0
+        if group_bits:
+            for term in annotation["regulates_closure"]:
+                bit = group_bits.get(term)
+                if bit is not None and not mask & bit:
+                    mask |= bit
+                    members.setdefault(term, []).append(i)
+        masks.append(mask)
+        aspects.append(aspect)
+
+    # an annotation is counted if it falls in any group of a category it can be mapped to
+    terms = set()
+    nb_annotations = 0
+    for i, annotation in enumerate(annotations):
+        for category, (group_mask, _term_mask) in zip(categories, category_masks, strict=True):
+            if (cross_aspect or category["id"] == aspects[i]) and masks[i] & group_mask:
+                terms.add(annotation["annotation_class"])
+                nb_annotations += 1
+                break
+
+    groups = {}
+    for category, (_group_mask, term_mask) in zip(categories, category_masks, strict=True):
+        for group in category["groups"]:
+            if group["type"] == "Other":
+                continue
+            for i in members.get(group["id"], ()):
+                if cross_aspect or category["id"] == aspects[i]:
+                    if group["id"] not in groups:
+                        groups[group["id"]] = {"ALL": _subgroup()}
+                    _count(groups[group["id"]], annotations[i])
+
+        other = {"ALL": _subgroup()}
+        for i, annotation in enumerate(annotations):
+            if (cross_aspect or category["id"] == aspects[i]) and not masks[i] & term_mask:
+                _count(other, annotation)
+        groups[category["id"] + "-other"] = other
+
+    # compute the number of classes for each group that have subgroup (annotations)
+    for group_id, group in groups.items():
+        for subgroup in group.values():
+            subgroup["nb_classes"] = len(subgroup["terms"])
+            if "-other" not in group_id:
+                del subgroup["terms"]
+            else:
+                subgroup["terms"] = list(subgroup["terms"])
+
+    return {"groups": groups, "nb_classes": len(terms), "nb_annotations": nb_annotations}
+
+
+def _subgroup():
+    return {"terms": set(), "nb_classes": 0, "nb_annotations": 0}
+
+
+def _count(group, annotation):
+    """Add an annotation to the ALL and evidence type subgroups of a group."""
+    subgroup = group.get(annotation["evidence_type"])
+    if subgroup is None:
+        subgroup = group[annotation["evidence_type"]] = _subgroup()
+    subgroup["terms"].add(annotation["annotation_class"])
+    subgroup["nb_annotations"] += 1
+    group["ALL"]["terms"].add(annotation["annotation_class"])
+    group["ALL"]["nb_annotations"] += 1
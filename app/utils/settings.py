@@ -40,6 +40,99 @@ def get_golr_config():
     return golr_config
 
 
+def get_http_client_config(service: str):
+    """
+    Returns the timeout and connection pool settings for an upstream service.
+
+    :param service: The config.yaml section of the service, e.g. solr_url or sparql_url.
+    :return: A dictionary with the timeout (seconds), the pool limits of the service and the maximum number of
+        queries a single API request sends to it at once.
+    """
+    service_config = get_golr_config()[service]
+    pool = service_config.get("pool") or {}
+    return {
+        "timeout": service_config.get("timeout", 60),
+        "max_concurrent_queries": service_config.get("max_concurrent_queries", 10),
+        "max_connections": pool.get("max_connections", 100),
+        "max_keepalive_connections": pool.get("max_keepalive_connections", 20),
+        "keepalive_expiry": pool.get("keepalive_expiry", 30),
+    }
+
+
+def get_cache_config(name: str):
+    """
+    Returns the settings of an in-process cache.
+
+    :param name: The name of the cache in the cache section of config.yaml, e.g. terms.
+    :return: A dictionary with the max_entries, max_bytes, ttl, negative_ttl (seconds, for cached misses) and
+        max_stale (seconds an expired entry can be served while it is recomputed) of the cache.
+    """
+    cache_config = (get_golr_config().get("cache") or {}).get(name) or {}
+    return {
+        "max_entries": cache_config.get("max_entries", 10000),
+        "max_bytes": cache_config.get("max_bytes", 64 * 1024 * 1024),
+        "ttl": cache_config.get("ttl", 86400),
+        "negative_ttl": cache_config.get("negative_ttl", 3600),
+        "max_stale": cache_config.get("max_stale", 0),
+    }
+
+
+def get_shared_cache_config():
+    """
+    Returns the settings of the upstream result cache shared by the workers of a host.
+
+    :return: A dictionary with the database (the path of a SQLite file) or redis_url of the cache, None if it is
+        disabled, its max_bytes, and the ttl (seconds) of the results of each upstream service it caches.
+    """
+    shared_cache_config = get_golr_config().get("shared_cache") or {}
+    return {
+        "database": shared_cache_config.get("database"),
+        "redis_url": shared_cache_config.get("redis_url"),
+        "max_bytes": shared_cache_config.get("max_bytes", 1024 * 1024 * 1024),
+        "ttl": shared_cache_config.get("ttl") or {},
+    }
+
+
+def get_release_check_interval():
+    """Returns the number of seconds between two checks of the ontology release version."""
+    return (get_golr_config().get("cache") or {}).get("release_check_interval", 3600)
+
+
+def get_subsets_refresh_interval():
+    """Returns the number of seconds between two reloads of the ontology subsets (slims)."""
+    return (get_golr_config().get("cache") or {}).get("subsets_refresh_interval", 86400)
+
+
+def get_stats_log_interval():
+    """Returns the number of seconds between two logs of the upstream request and cache counters."""
+    return (get_golr_config().get("cache") or {}).get("stats_log_interval", 300)
+
+
+def get_idmapping_database():
+    """Returns the path of the local gene <-> protein identifier index, or None if MyGene.info is used alone."""
+    return (get_golr_config().get("idmapping") or {}).get("database")
+
+
+def get_autocomplete_database():
+    """Returns the path of the local entity autocomplete index, or None if autocomplete queries GOlr."""
+    return (get_golr_config().get("autocomplete") or {}).get("database")
+
+
+def get_closure_index_config():
+    """
+    Returns the settings of the local ontology closure index.
+
+    :return: A dictionary with enabled, the source of the index (golr, or the path or URL of an obographs JSON file)
+        and rebuild_on_release.
+    """
+    index_config = get_golr_config().get("closure_index") or {}
+    return {
+        "enabled": index_config.get("enabled", False),
+        "source": index_config.get("source", "golr"),
+        "rebuild_on_release": index_config.get("rebuild_on_release", True),
+    }
+
+
 class ESOLR(Enum):
 
     """Enum for the GOLR URL."""
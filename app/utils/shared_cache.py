@@ -0,0 +1,303 @@
+"""
+upstream result cache shared by the workers of a host.
+
+The gunicorn workers each keep their own in-process caches (see cache_utils); this tier sits behind them, so that
+a GOlr, SPARQL, MyGene.info or S3 result is fetched once per host. The cache is a memory-mapped SQLite file, or a
+Redis-compatible server: both implement the subset of Redis commands used here,
+
+    get(key) -> bytes or None
+    set(key, value, ex=seconds)
+    delete(*keys)
+    flushdb()
+
+Set shared_cache.database (or shared_cache.redis_url) in conf/config.yaml to enable it.
+
+The functions of this module block on the cache: call them from the thread pool (run_in_threadpool) in async code.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from app.utils.settings import get_shared_cache_config
+
+logger = logging.getLogger()
+
+shared_cache = None
+
+MMAP_SIZE = 1024 * 1024 * 1024
+# the number of seconds to wait for the write lock of another worker, after which the request is a miss
+BUSY_TIMEOUT = 0.05
+# the result code of SQLite for a lock it gave up on, sqlite3.SQLITE_BUSY from Python 3.11
+SQLITE_BUSY = 5
+# the number of writes of a worker between two evictions of expired and excess entries
+PURGE_INTERVAL = 1000
+# the number of entries evicted at once when the cache is over max_bytes
+EVICTION_BATCH_SIZE = 100
+# the key holding the GO release the cached results belong to
+RELEASE_KEY = "release"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entry_expires_at ON entry (expires_at);
+"""
+EVICT_QUERY = """
+DELETE FROM entry WHERE key IN (SELECT key FROM entry WHERE expires_at IS NOT NULL ORDER BY expires_at LIMIT ?)
+"""
+
+
+class SQLiteCache:
+
+    """
+    A cache of bytes in a SQLite file, shared by the processes that open it.
+
+    The file is in WAL mode, so that readers do not wait for writers, and memory-mapped, so that the workers of a
+    host share its pages. Expired entries, then the entries expiring first, are evicted once the file outgrows
+    max_bytes; entries without expiry are kept.
+
+    :param path: The path of the SQLite file, created if missing.
+    :param max_bytes: The maximum size of the file, in bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        """Open the cache, creating its table if needed."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        # autocommit: every statement is a transaction of its own, so no worker holds the write lock for long
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=BUSY_TIMEOUT)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute("PRAGMA mmap_size = {}".format(MMAP_SIZE))
+        self._connection.executescript(SCHEMA)
+
+    def get(self, key: str):
+        """
+        Return the cached value of a key.
+
+        :param key: The key.
+        :return: The value, or None if the key is missing or expired.
+        :rtype: bytes
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM entry WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: bytes, ex: int = None):
+        """
+        Cache a value.
+
+        :param key: The key.
+        :param value: The value.
+        :param ex: The number of seconds the entry stays valid; it never expires if None.
+        """
+        expires_at = None if ex is None else time.time() + ex
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entry (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+            self._writes += 1
+            if self._writes % PURGE_INTERVAL == 0:
+                self._purge()
+
+    def delete(self, *keys: str):
+        """
+        Remove keys from the cache.
+
+        :param keys: The keys.
+        :return: The number of entries removed.
+        :rtype: int
+        """
+        with self._lock:
+            return self._connection.executemany("DELETE FROM entry WHERE key = ?", [(key,) for key in keys]).rowcount
+
+    def flushdb(self):
+        """Remove every entry."""
+        with self._lock:
+            self._connection.execute("DELETE FROM entry")
+
+    def stats(self):
+        """Return the size of the cache and the hit/miss counters of this worker."""
+        with self._lock:
+            size = self._size()
+        return {"bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def _size(self):
+        """Return the number of bytes used by the entries, from the pages of the file in use; the lock is held."""
+        page_count, free_count, page_size = (
+            self._connection.execute("PRAGMA {}".format(pragma)).fetchone()[0]
+            for pragma in ("page_count", "freelist_count", "page_size")
+        )
+        return (page_count - free_count) * page_size
+
+    def _purge(self):
+        """Evict the expired entries, then the entries expiring first while the cache is over max_bytes."""
+        self._connection.execute("DELETE FROM entry WHERE expires_at <= ?", (time.time(),))
+        while self._size() > self.max_bytes:
+            if self._connection.execute(EVICT_QUERY, (EVICTION_BATCH_SIZE,)).rowcount == 0:
+                break
+
+
+def get_shared_cache():
+    """
+    Get the shared cache, opening it on first use.
+
+    Errors while opening the cache are logged, and opening it is tried again on the next use.
+
+    :return: The cache, a SQLiteCache or a redis.Redis client, or None if no shared cache is configured or it could
+        not be opened.
+    """
+    global shared_cache
+    if shared_cache is None:
+        config = get_shared_cache_config()
+        if config["redis_url"]:
+            # optional dependency, only needed with a Redis-compatible server
+            import redis
+
+            logger.info("Using the shared cache at %s", config["redis_url"])
+            shared_cache = redis.Redis.from_url(config["redis_url"])
+        elif config["database"]:
+            logger.info("Opening the shared cache %s", config["database"])
+            try:
+                shared_cache = SQLiteCache(config["database"], config["max_bytes"])
+            except sqlite3.Error as e:
+                # e.g. another worker creating the file at startup
+                _log_error("Error while opening the shared cache %s: %s", config["database"], e)
+    return shared_cache
+
+
+def shared_cache_key(service: str, *parts):
+    """
+    Return the key of an upstream result.
+
+    :param service: The upstream service, a key of shared_cache.ttl in conf/config.yaml, e.g. solr_url.
+    :param parts: What identifies the result, e.g. the method, URL and body of a request.
+    :return: The key, the service followed by a digest of the parts.
+    """
+    return "{}:{}".format(service, hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest())
+
+
+def is_shared(service: str):
+    """
+    Return whether the results of a service go through the shared cache.
+
+    :param service: The upstream service, see shared_cache_key.
+    :return: True if a shared cache is configured, with a ttl for the service.
+    :rtype: bool
+    """
+    return service in get_shared_cache_config()["ttl"] and get_shared_cache() is not None
+
+
+def shared_get(service: str, key: str):
+    """
+    Return an upstream result from the shared cache.
+
+    Errors of the cache are logged, and treated as misses.
+
+    :param service: The upstream service, see shared_cache_key.
+    :param key: The key, see shared_cache_key.
+    :return: The result, or None if it is not cached, or the service is not cached.
+    :rtype: bytes
+    """
+    cache = get_shared_cache()
+    if cache is None or service not in get_shared_cache_config()["ttl"]:
+        return None
+    try:
+        return cache.get(key)
+    except Exception as e:
+        _log_error("Error while reading %s from the shared cache: %s", key, e)
+        return None
+
+
+def shared_get_many(service: str, keys):
+    """
+    Return upstream results from the shared cache, see shared_get.
+
+    :param service: The upstream service, see shared_cache_key.
+    :param keys: The keys, see shared_cache_key.
+    :return: The list of results, None for the results that are not cached.
+    """
+    return [shared_get(service, key) for key in keys]
+
+
+def shared_set(service: str, key: str, value: bytes, ttl: int = None):
+    """
+    Store an upstream result in the shared cache, if the service is cached.
+
+    :param service: The upstream service, see shared_cache_key.
+    :param key: The key, see shared_cache_key.
+    :param value: The result.
+    :param ttl: The number of seconds the result stays valid, if not the ttl of the service.
+    """
+    cache = get_shared_cache()
+    ttls = get_shared_cache_config()["ttl"]
+    if cache is None or service not in ttls:
+        return
+    try:
+        cache.set(key, value, ex=ttls[service] if ttl is None else ttl)
+    except Exception as e:
+        _log_error("Error while writing %s to the shared cache: %s", key, e)
+
+
+def shared_set_many(service: str, entries):
+    """
+    Store upstream results in the shared cache, see shared_set.
+
+    :param service: The upstream service, see shared_cache_key.
+    :param entries: The (key, value, ttl) of the results.
+    """
+    for key, value, ttl in entries:
+        shared_set(service, key, value, ttl)
+
+
+def _log_error(message: str, key: str, error: Exception):
+    """Log an error of the cache; the write lock being held by another worker is expected under load."""
+    if _is_busy(error):
+        logger.debug(message, key, error)
+    else:
+        logger.warning(message, key, error)
+
+
+def _is_busy(error: Exception):
+    """Return whether an error is SQLite giving up on a lock held by another worker ("database is locked")."""
+    # sqlite_errorcode is only set from Python 3.11
+    return isinstance(error, sqlite3.OperationalError) and (
+        getattr(error, "sqlite_errorcode", None) == SQLITE_BUSY or "database is locked" in str(error)
+    )
+
+
+def set_shared_release(release: str):
+    """
+    Record the release the shared cache belongs to, flushing it if the release changed.
+
+    Every worker calls it; the first one to see a new release flushes the cache.
+
+    :param release: The release version, e.g. an ontology version IRI.
+    :return: True if the cache was flushed.
+    :rtype: bool
+    """
+    cache = get_shared_cache()
+    if cache is None:
+        return False
+    try:
+        previous = cache.get(RELEASE_KEY)
+        if previous == release.encode():
+            return False
+        if previous is not None:
+            logger.info("Release changed from %s to %s, flushing the shared cache", previous.decode(), release)
+            cache.flushdb()
+        cache.set(RELEASE_KEY, release.encode())
+    except Exception as e:
+        logger.warning("Error while checking the release of the shared cache: %s", e)
+        return False
+    return previous is not None
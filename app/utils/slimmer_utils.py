@@ -0,0 +1,126 @@
+"""local map2slim: map the GO annotations of subjects to a slim without GOlr facets."""
+import logging
+from urllib.parse import quote
+
+from ontobio.golr.golr_query import GolrAssociationQuery, goassoc_fieldmap
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.closure_utils import get_closure_index
+from app.utils.golr_utils import iterate_solr_on
+from app.utils.http_utils import decode_json, fetch, gather_bounded
+from app.utils.settings import ESOLR, ESOLRDoc, get_http_client_config
+
+logger = logging.getLogger()
+
+# the GOlr closure field a slim is computed over, by relationship type (as in ontobio's goassoc_fieldmap)
+SLIM_CLOSURE_FIELDS = {"acts_upstream_of_or_within": "regulates_closure", "involved_in": "isa_partof_closure"}
+# the fields ontobio's map2slim selects, without the closure field
+ANNOTATION_FIELDS = (
+    "id,assigned_by,source,bioentity,bioentity_label,taxon,taxon_label,qualifier,relation_label,annotation_class,"
+    "annotation_class_label,evidence,evidence_closure_map,frequency,frequency_label,onset,onset_label,evidence_graph,"
+    "reference,is_redundant_for,type,evidence_label,evidence_type,evidence_type_label,evidence_with,evidence_closure,"
+    "evidence_closure_label,evidence_subset_closure,evidence_subset_closure_label,evidence_type_closure,"
+    "evidence_type_closure_label,aspect"
+)
+# inferred from electronic annotation
+IEA_ECO = "ECO:0000501"
+GOLR_PAGE_SIZE = 1000
+
+
+async def map2slim(
+    subjects,
+    slim,
+    relationship_type: str = "acts_upstream_of_or_within",
+    exclude_automatic_assertions: bool = False,
+    rows: int = -1,
+    start: int = 0,
+):
+    """
+    Map the GO annotations of subjects to a slim, in the format of ontobio's map2slim.
+
+    With rows=-1 the annotations of each subject are fetched once, with concurrent cursor queries, and mapped to
+    the slim locally: the slim terms of each annotation class are computed once per call, from the ontology
+    closure index for involved_in (when it is loaded) or from the GOlr closure field otherwise.
+
+    :param subjects: The subject CURIEs, e.g. ZFIN:ZDB-GENE-980526-388 or UniProtKB:P12345.
+    :param slim: The GO term CURIEs of the slim.
+    :param relationship_type: acts_upstream_of_or_within (regulates closure) or involved_in (is_a/part_of closure).
+    :param exclude_automatic_assertions: Whether to skip the IEA annotations.
+    :param rows: The number of annotations to slim, -1 for all.
+    :param start: The number of annotations to skip.
+    :return: A list of {"subject", "slim", "assocs"} dictionaries, one per subject and slim term.
+    """
+    closure_field = SLIM_CLOSURE_FIELDS[relationship_type]
+    index = get_closure_index() if closure_field == "isa_partof_closure" else None
+    fields = ANNOTATION_FIELDS if index is not None else ANNOTATION_FIELDS + "," + closure_field
+    filters = ['-evidence_subset_closure:"{}"'.format(IEA_ECO)] if exclude_automatic_assertions else []
+
+    translator = GolrAssociationQuery(object_category="function", relationship_type=relationship_type)
+    subjects = list(dict.fromkeys(translator.make_gostyle_identifier(subject) for subject in subjects))
+    if rows < 0:
+        annotation_queries = [_fetch_subject_annotations(subject, fields, filters) for subject in subjects]
+        results = await gather_bounded(annotation_queries, get_http_client_config("solr_url")["max_concurrent_queries"])
+        docs = [doc for subject_docs in results for doc in subject_docs][start:]
+    else:
+        docs = await _fetch_annotation_page(subjects, fields, filters, rows, start)
+    logger.info("Slimming %s annotations of %s subjects", len(docs), len(subjects))
+    return await run_in_threadpool(slim_associations, docs, slim, relationship_type, index)
+
+
+def slim_associations(docs, slim, relationship_type: str = "acts_upstream_of_or_within", closure_index=None):
+    """
+    Translate GOlr annotation documents and group them by subject and slim term, as ontobio's map2slim does.
+
+    :param docs: The GOlr annotation documents; they are modified.
+    :param slim: The GO term CURIEs of the slim.
+    :param relationship_type: acts_upstream_of_or_within or involved_in.
+    :param closure_index: The ontology closure index to read the is_a/part_of closures from, or None to read
+        the closure field of the documents.
+    :return: A list of {"subject", "slim", "assocs"} dictionaries, one per subject and slim term.
+    """
+    translator = GolrAssociationQuery(object_category="function", relationship_type=relationship_type)
+    field_mapping = goassoc_fieldmap(relationship_type)
+    closure_field = SLIM_CLOSURE_FIELDS[relationship_type]
+    slim = set(slim)
+
+    # annotation class -> its slim terms, in closure order
+    slim_terms = {}
+    pmap = {}
+    for doc in docs:
+        term = doc["annotation_class"]
+        closure = doc.pop(closure_field, None)
+        if term not in slim_terms:
+            if closure_index is not None and term in closure_index:
+                closure = closure_index.ancestors(term)
+            slim_terms[term] = [ancestor for ancestor in closure or [term] if ancestor in slim]
+        association = translator.translate_doc(doc, field_mapping=field_mapping)
+        association["slim"] = list(slim_terms[term])
+        for slim_term in association["slim"]:
+            pmap.setdefault((association["subject"]["id"], slim_term), []).append(association)
+
+    return [{"subject": subject, "slim": slim_term, "assocs": assocs} for (subject, slim_term), assocs in pmap.items()]
+
+
+async def _fetch_subject_annotations(subject, fields, filters):
+    """Fetch every annotation of a subject, with a GOlr cursor."""
+    subject_filters = "".join("&fq=" + quote(fq, safe=":") for fq in filters + ['bioentity:"{}"'.format(subject)])
+    return [
+        doc async for doc in iterate_solr_on(ESOLR.GOLR, ESOLRDoc.ANNOTATION, fields, GOLR_PAGE_SIZE, subject_filters)
+    ]
+
+
+async def _fetch_annotation_page(subjects, fields, filters, rows, start):
+    """Fetch a page of the annotations of subjects; the query is POSTed as it can be too long for a URL."""
+    subject_filter = "bioentity:({})".format(" OR ".join('"{}"'.format(subject) for subject in subjects))
+    data = {
+        "q": "*:*",
+        "fq": ['document_category:"{}"'.format(ESOLRDoc.ANNOTATION.value), *filters, subject_filter],
+        "fl": fields,
+        "rows": rows,
+        "start": start,
+        "sort": "id asc",
+        "wt": "json",
+    }
+    response = await fetch("solr_url", "POST", ESOLR.GOLR.value + "select", data=data)
+    response.raise_for_status()
+    return decode_json(response)["response"]["docs"]
@@ -1,7 +1,53 @@
 """Utils for SPARQL queries."""
+import logging
+from typing import Dict, List, TypedDict
+
+from oaklib.datamodels.vocabulary import DEFAULT_PREFIX_MAP
+
+from app.utils.http_utils import fetch
+from app.utils.settings import get_sparql_endpoint
 
 SEPARATOR = "|"  # separator for splitting values
 
+logger = logging.getLogger()
+
+
+class SparqlTerm(TypedDict, total=False):
+
+    """A single bound value in a SPARQL JSON result, e.g. {"type": "uri", "value": "http://..."}."""
+
+    type: str
+    value: str
+    datatype: str
+
+
+# one result row, keyed by the variable name of the SELECT clause
+SparqlBinding = Dict[str, SparqlTerm]
+
+
+async def run_sparql_on(query: str) -> List[SparqlBinding]:
+    """
+    Run a SELECT query against the configured SPARQL endpoint.
+
+    The default prefixes (rdf, rdfs, owl, ...) are declared for the query the same way
+    oaklib's SparqlImplementation does, and the request goes through the pooled sparql_url client.
+
+    :param query: The SPARQL query.
+    :type query: str
+    :return: The bindings of the query result, one dictionary per row.
+    :rtype: List[SparqlBinding]
+    """
+    prefixes = "".join(f"PREFIX {k}: <{v}>\n" for k, v in DEFAULT_PREFIX_MAP.items())
+    response = await fetch(
+        "sparql_url",
+        "POST",
+        get_sparql_endpoint(),
+        data={"query": prefixes + query},
+        headers={"Accept": "application/sparql-results+json"},
+    )
+    response.raise_for_status()
+    return response.json()["results"]["bindings"]
+
 
 def transform(data, keys_to_split=None):
     """
@@ -0,0 +1,27 @@
+"""
+Benchmark of the decoding of GOlr text query responses against the original implementation.
+
+Run with: python -m tests.benchmarks.bench_golr_decoding
+"""
+import random
+import timeit
+
+from app.utils.golr_utils import _text_docs
+from app.utils.http_utils import decode_json
+from tests.unit.test_golr_utils import legacy_text_docs, make_text_response
+
+
+def main():
+    """Time both implementations on highlighted responses with a growing number of rows."""
+    rng = random.Random(0)  # noqa: S311
+    print("%8s %12s %12s %8s" % ("rows", "legacy (ms)", "orjson (ms)", "speedup"))
+    for rows in [10, 100, 1000]:
+        response = make_text_response(rng, rows)
+        number = max(1, 1000 // rows)
+        legacy = timeit.timeit(lambda response=response: legacy_text_docs(response, True), number=number)
+        decoded = timeit.timeit(lambda response=response: _text_docs(decode_json(response), True), number=number)
+        print("%8d %12.1f %12.1f %7.1fx" % (rows, 1000 * legacy / number, 1000 * decoded / number, legacy / decoded))
+
+
+if __name__ == "__main__":
+    main()
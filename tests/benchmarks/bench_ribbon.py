@@ -0,0 +1,35 @@
+"""
+Benchmark of the ribbon aggregation against the original implementation.
+
+Run with: python -m tests.benchmarks.bench_ribbon
+"""
+import random
+import timeit
+
+from app.utils.ribbon_utils import aggregate_ribbon_annotations
+from tests.unit.test_ribbon_utils import legacy_aggregate_ribbon_annotations, make_annotations, make_categories
+
+
+def main():
+    """Time both implementations on subjects with a growing number of annotations."""
+    rng = random.Random(0)  # noqa: S311
+    categories = make_categories(rng, 50)
+    print("%12s %12s %12s %8s" % ("annotations", "legacy (ms)", "bitset (ms)", "speedup"))
+    for nb_annotations in [100, 1000, 5000, 20000]:
+        annotations = make_annotations(rng, categories, nb_annotations)
+        number = max(1, 2000 // nb_annotations)
+        legacy = timeit.timeit(
+            lambda annotations=annotations: legacy_aggregate_ribbon_annotations(categories, annotations, False),
+            number=number,
+        )
+        bitset = timeit.timeit(
+            lambda annotations=annotations: aggregate_ribbon_annotations(categories, annotations, False), number=number
+        )
+        print(
+            "%12d %12.1f %12.1f %7.1fx"
+            % (nb_annotations, 1000 * legacy / number, 1000 * bitset / number, legacy / bitset)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark of the local map2slim engine against ontobio's map2slim.
+
+Run with: python -m tests.benchmarks.bench_slimmer
+or, against the configured GOlr: python -m tests.benchmarks.bench_slimmer --live ZFIN:ZDB-GENE-980526-388 MGI:3588192
+"""
+import argparse
+import asyncio
+import copy
+import random
+import time
+import timeit
+
+from ontobio.golr.golr_associations import map2slim as ontobio_map2slim
+
+from app.utils.closure_utils import OntologyClosureIndex
+from app.utils.settings import ESOLR
+from app.utils.slimmer_utils import map2slim, slim_associations
+from tests.unit.test_slimmer_utils import make_docs, make_terms, ontobio_slim
+
+
+def offline():
+    """Time the slimming of generated annotations, GOlr being mocked for both implementations."""
+    rng = random.Random(0)  # noqa: S311
+    closures = make_terms(rng, 5000)
+    index = OntologyClosureIndex.from_golr_docs(
+        {"id": term, "isa_partof_closure": isa_partof} for term, (isa_partof, _) in closures.items()
+    )
+    print("%10s %6s %12s %12s %12s %8s" % ("subjects", "slim", "annotations", "ontobio (ms)", "local (ms)", "speedup"))
+    for nb_subjects, nb_slim, nb_docs in [(10, 20, 1000), (100, 100, 10000), (1000, 500, 50000)]:
+        docs = make_docs(rng, closures, nb_subjects, nb_docs)
+        slim = rng.sample(list(closures), nb_slim)
+        subjects = sorted({doc["bioentity"] for doc in docs})
+        ontobio_docs = copy.deepcopy(docs)
+        ontobio = timeit.timeit(
+            lambda docs=ontobio_docs, slim=slim, subjects=subjects: ontobio_slim(docs, slim, subjects, "involved_in"),
+            number=1,
+        )
+        # the local engine gets the is_a/part_of closures from the index, so they are not fetched from GOlr
+        for doc in docs:
+            del doc["isa_partof_closure"]
+        local = timeit.timeit(
+            lambda docs=docs, slim=slim: slim_associations(docs, slim, "involved_in", index), number=1
+        )
+        print(
+            "%10d %6d %12d %12.1f %12.1f %7.1fx"
+            % (nb_subjects, nb_slim, nb_docs, 1000 * ontobio, 1000 * local, ontobio / local)
+        )
+
+
+def live(subjects, slim):
+    """Time both implementations against the configured GOlr."""
+    started = time.perf_counter()
+    expected = ontobio_map2slim(subjects=subjects, slim=slim, object_category="function", url=ESOLR.GOLR.value, rows=-1)
+    ontobio = time.perf_counter() - started
+    started = time.perf_counter()
+    results = asyncio.run(map2slim(subjects, slim))
+    local = time.perf_counter() - started
+    print("ontobio: %.2fs, %d results; local: %.2fs, %d results" % (ontobio, len(expected), local, len(results)))
+
+
+def main():
+    """Run the offline benchmark, or the live one if subjects are given."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--live", nargs="+", metavar="SUBJECT", help="subjects to slim with the configured GOlr")
+    parser.add_argument("--slim", nargs="+", default=["GO:0003674", "GO:0008150", "GO:0005575"], help="slim terms")
+    args = parser.parse_args()
+    if args.live:
+        live(args.live, args.slim)
+    else:
+        offline()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Unit tests for the entity autocomplete prefix index."""
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.utils.autocomplete_index import (
+    bioentity_entity,
+    build_index,
+    highlight,
+    search_index,
+    term_entity,
+)
+from app.utils.idmapping_index import open_index
+
+DOCS = [
+    term_entity(
+        {"id": "GO:0008150", "annotation_class_label": "biological_process", "synonym": ["physiological process"]}
+    ),
+    term_entity(
+        {"id": "GO:0007224", "annotation_class_label": "smoothened signaling pathway", "synonym": ["hh signaling"]}
+    ),
+    bioentity_entity(
+        {
+            "id": "ZFIN:ZDB-GENE-980526-166",
+            "bioentity_label": "shha",
+            "bioentity_name": "sonic hedgehog signaling molecule a",
+            "taxon": "NCBITaxon:7955",
+            "taxon_label": "Danio rerio",
+        }
+    ),
+    bioentity_entity(
+        {
+            "id": "MGI:MGI:98297",
+            "bioentity_label": "Shh",
+            "bioentity_name": "sonic hedgehog",
+            "synonym": ["Hx", "Dsh"],
+            "taxon": "NCBITaxon:10090",
+            "taxon_label": "Mus musculus",
+        }
+    ),
+]
+
+
+async def iterate(entities):
+    """Turn a list of entities into an async iterator, as build_index takes."""
+    for entity in entities:
+        yield entity
+
+
+class TestAutocompleteIndex(unittest.TestCase):
+
+    """Test building and querying the autocomplete index."""
+
+    def setUp(self):
+        """Build an index from a few GO terms and genes."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "autocomplete.db")
+        self.count = asyncio.run(build_index(self.path, iterate(DOCS)))
+        self.connection = open_index(self.path)
+
+    def tearDown(self):
+        """Close and remove the index."""
+        self.connection.close()
+        self.directory.cleanup()
+
+    def ids(self, prefix, **kwargs):
+        """Return the ids of the entities matching a prefix."""
+        return [match["id"] for match in search_index(self.connection, prefix, **kwargs)]
+
+    def test_search_ranking(self):
+        """Test that labels beat names, and words at the start of a value beat later ones."""
+        self.assertEqual(self.count, 4)
+        self.assertEqual(self.ids("shh"), ["MGI:98297", "ZFIN:ZDB-GENE-980526-166"])
+        self.assertEqual(self.ids("Sonic HED*"), ["MGI:98297", "ZFIN:ZDB-GENE-980526-166"])
+        self.assertEqual(self.ids("hedgehog"), ["MGI:98297", "ZFIN:ZDB-GENE-980526-166"])
+        self.assertEqual(self.ids("signal"), ["GO:0007224", "ZFIN:ZDB-GENE-980526-166"])
+        self.assertEqual(self.ids("physio"), ["GO:0008150"])
+        self.assertEqual(self.ids("go:00081"), ["GO:0008150"])
+        self.assertEqual(self.ids("  "), [])
+
+    def test_search_filters(self):
+        """Test the category and taxon filters, and paging."""
+        self.assertEqual(self.ids("s", category="term"), ["GO:0007224"])
+        self.assertEqual(self.ids("sonic", taxon=["NCBITaxon:7955"]), ["ZFIN:ZDB-GENE-980526-166"])
+        self.assertEqual(self.ids("sonic", start=1, rows=1), ["ZFIN:ZDB-GENE-980526-166"])
+
+    def test_search_match(self):
+        """Test that the best matching field of an entity is returned, and highlighted."""
+        (match,) = search_index(self.connection, "dsh")
+        self.assertEqual((match["field"], match["value"], match["taxon"]), ("synonym", "Dsh", "NCBITaxon:10090"))
+        self.assertEqual(highlight("Sonic hedgehog", "hed"), "Sonic <em>hedgehog</em>")
+        self.assertEqual(highlight("sonic hedgehog signaling", "Sonic Hedge*"), "<em>sonic hedgehog</em> signaling")
+        self.assertEqual(highlight("shha", "hh"), "shha")
+
+    def test_frequent_prefixes(self):
+        """Test that the prefixes ranked at build time match what the range queries match."""
+        queries = [("s", {}), ("sonic", {}), ("s", {"category": "term"}), ("s", {"taxon": ["NCBITaxon:7955"]})]
+        expected = [self.ids(prefix, **kwargs) for prefix, kwargs in queries]
+        path = os.path.join(self.directory.name, "frequent.db")
+        with mock.patch("app.utils.autocomplete_index.FREQUENT_PREFIX_KEYS", 1):
+            asyncio.run(build_index(path, iterate(DOCS)))
+        self.connection.close()
+        self.connection = open_index(path)
+        self.assertIsNotNone(self.connection.execute("SELECT 1 FROM top_prefix WHERE key = 'sonic'").fetchone())
+        self.assertEqual([self.ids(prefix, **kwargs) for prefix, kwargs in queries], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,14 @@
 """Unit tests for the endpoints in the bioentity module."""
+import json
 import logging
 import unittest
+from unittest import mock
 
+import httpx
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.utils.golr_utils import decode_cursor, encode_cursor
 from app.utils.settings import ESOLR, ESOLRDoc
 
 test_client = TestClient(app)
@@ -110,6 +114,211 @@ class TestBioentityEndpoints(unittest.TestCase):
             response = test_client.get(f"/api/bioentity/function/{go_id}/taxons")
             self.assertEqual(response.status_code, 200)
 
+    def test_bioentity_gene_function_uniprot_fallback(self):
+        """
+        Test that the annotations of the UniProtKB proteins of a gene are fetched with a single query.
+
+        :return: None
+        """
+        prots = ["UniProtKB:P12345", "UniProtKB:A0A000", "UniProtKB:P12345"]
+        found = {"numFound": 3, "associations": [{"id": "a"}, {"id": "b"}, {"id": "c"}]}
+        with mock.patch("app.routers.bioentity.gene_to_uniprot_from_mygene", return_value=prots), mock.patch(
+            "app.routers.bioentity.search_associations",
+            side_effect=[{"numFound": 0, "associations": []}, found],
+        ) as search:
+            response = test_client.get("/api/bioentity/gene/NCBIGene:6469/function")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"associations": found["associations"]})
+        self.assertEqual(search.call_count, 2)
+        self.assertEqual(search.call_args.kwargs["subjects"], ["UniProtKB:P12345", "UniProtKB:A0A000"])
+
+    def test_bioentity_gene_function_batch(self):
+        """
+        Test the GO terms of a list of genes, keyed by gene.
+
+        :return: None
+        """
+        response = test_client.post("/api/bioentity/gene/function", json={"gene": gene_ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()), gene_ids)
+        for gene_id, result in response.json().items():
+            self.assertGreater(len(result["associations"]), 0)
+            for association in result["associations"]:
+                self.assertEqual(association["subject"]["id"], gene_id)
+        response = test_client.post("/api/bioentity/gene/function", json={"gene": ["MGI:3588192"] * 1001})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bioentity_gene_function_batch_uniprot_fallback(self):
+        """
+        Test that the genes without annotations fall back to their UniProtKB proteins, queried together.
+
+        :return: None
+        """
+        direct = {"ZFIN:ZDB-GENE-980526-388": [{"id": "a"}], "HGNC:10848": [], "NCBIGene:6469": []}
+        prots = {"HGNC:10848": ["UniProtKB:P1", "UniProtKB:P2"], "NCBIGene:6469": ["UniProtKB:P2"]}
+        prot_assocs = {"UniProtKB:P1": [{"id": "b"}], "UniProtKB:P2": [{"id": "c"}]}
+        with mock.patch("app.routers.bioentity.genes_to_uniprot", return_value=prots), mock.patch(
+            "app.routers.bioentity.search_associations_by_subject", side_effect=[direct, prot_assocs]
+        ) as search:
+            response = test_client.post("/api/bioentity/gene/function", json={"gene": list(direct)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "ZFIN:ZDB-GENE-980526-388": {"associations": [{"id": "a"}]},
+                "HGNC:10848": {"associations": [{"id": "b"}, {"id": "c"}]},
+                "NCBIGene:6469": {"associations": [{"id": "c"}]},
+            },
+        )
+        self.assertEqual(search.call_args.args[0], ["UniProtKB:P1", "UniProtKB:P2", "UniProtKB:P2"])
+
+    def test_bioentity_function_taxon_counts(self):
+        """
+        Test the taxon breakdown of a GO term computed by solr facets.
+
+        :return: None
+        """
+        response = test_client.get("/api/bioentity/function/GO:0044598/taxons", params={"facet": True})
+        self.assertEqual(response.status_code, 200)
+        counts = response.json()
+        self.assertGreater(len(counts), 0)
+        for taxon, count in counts.items():
+            self.assertTrue(taxon.startswith("NCBITaxon:"))
+            self.assertGreater(count["count"], 0)
+            self.assertIn("label", count)
+        self.assertEqual(
+            [c["count"] for c in counts.values()], sorted((c["count"] for c in counts.values()), reverse=True)
+        )
+
+    def test_bioentity_function_cursor_pagination(self):
+        """
+        Test walking the annotations of a GO term with cursors.
+
+        :return: None
+        """
+        params = {"rows": 5, "cursor": "*"}
+        first_page = test_client.get("/api/bioentity/function/GO:0044598", params=params)
+        self.assertEqual(first_page.status_code, 200)
+        self.assertEqual(len(first_page.json()), 5)
+        params["cursor"] = first_page.headers["X-Next-Cursor"]
+        second_page = test_client.get("/api/bioentity/function/GO:0044598", params=params)
+        self.assertEqual(second_page.status_code, 200)
+        self.assertGreater(len(second_page.json()), 0)
+        self.assertNotEqual(first_page.json(), second_page.json())
+
+    def test_bioentity_gene_function_cursor_pagination(self):
+        """
+        Test walking the GO terms of a gene with cursors.
+
+        :return: None
+        """
+        params = {"rows": 2, "cursor": "*"}
+        response = test_client.get("/api/bioentity/gene/ZFIN:ZDB-GENE-980526-388/function", params=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json().get("associations")), 2)
+        self.assertIn("X-Next-Cursor", response.headers)
+
+    def test_invalid_cursor(self):
+        """
+        Test that an invalid cursor is rejected.
+
+        :return: None
+        """
+        response = test_client.get("/api/bioentity/function/GO:0044598", params={"cursor": "not a cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_rows_limit(self):
+        """
+        Test that pages walked with a cursor are limited to MAX_CURSOR_ROWS results.
+
+        :return: None
+        """
+        response = test_client.get("/api/bioentity/function/GO:0044598", params={"cursor": "*", "rows": 100000})
+        self.assertEqual(response.status_code, 400)
+
+    def test_taxon_counts_golr_error(self):
+        """
+        Test that a failing GOlr facet query is reported as a 502.
+
+        :return: None
+        """
+        error = mock.AsyncMock(side_effect=httpx.ConnectError("connection refused"))
+        with mock.patch("app.utils.golr_utils.fetch", error):
+            response = test_client.get("/api/bioentity/function/GO:0007155/taxons", params={"facet": True})
+        self.assertEqual(response.status_code, 502)
+
+    def test_cursor_golr_error(self):
+        """
+        Test that a failing GOlr request for a page is reported as a 502.
+
+        :return: None
+        """
+        error = mock.AsyncMock(side_effect=httpx.ConnectError("connection refused"))
+        with (
+            mock.patch("app.utils.golr_utils.fetch", error),
+            mock.patch("app.utils.association_utils.fetch", error),
+        ):
+            for endpoint in [
+                "/api/bioentity/function/GO:0044598",
+                "/api/bioentity/gene/ZFIN:ZDB-GENE-980526-388/function",
+            ]:
+                response = test_client.get(endpoint, params={"cursor": "*"})
+                self.assertEqual(response.status_code, 502)
+
+    def test_cursor_tokens(self):
+        """
+        Test that cursor tokens carry the solr cursorMark and the state of the query.
+
+        :return: None
+        """
+        cursor = encode_cursor("AoE/R0dPOjAwMDEyMzQ+", subjects=["UniProtKB:P12345"])
+        self.assertNotIn("/", cursor)
+        self.assertEqual(decode_cursor(cursor), {"mark": "AoE/R0dPOjAwMDEyMzQ+", "subjects": ["UniProtKB:P12345"]})
+        self.assertEqual(decode_cursor("*"), {"mark": "*"})
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor("x")[:-2] + "!!")
+
+    def test_bioentity_function_export(self):
+        """
+        Test the NDJSON export of the annotations to a GO term.
+
+        :return: None
+        """
+        response = test_client.get("/api/bioentity/function/GO:0044598/export")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        lines = response.text.splitlines()
+        self.assertGreater(len(lines), 0)
+        for line in lines:
+            self.assertIn("GO:", json.loads(line)["annotation_class"])
+
+    def test_bioentity_gene_function_export(self):
+        """
+        Test the TSV export of the annotations of a gene.
+
+        :return: None
+        """
+        response = test_client.get("/api/bioentity/gene/MGI:3588192/function/export", params={"format": "tsv"})
+        self.assertEqual(response.status_code, 200)
+        lines = response.text.splitlines()
+        self.assertEqual(lines[0].split("\t")[0], "bioentity")
+        self.assertGreater(len(lines), 1)
+        for line in lines[1:]:
+            self.assertEqual(line.split("\t")[0], "MGI:MGI:3588192")
+
+    def test_export_filename(self):
+        """
+        Test that the file name of an export only keeps safe characters of the identifier.
+
+        :return: None
+        """
+        response = test_client.get('/api/bioentity/gene/ZFIN:ZDB-GENE-980526-388";x=y/function/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.headers["content-disposition"],
+            'attachment; filename="ZFIN_ZDB-GENE-980526-388__x_y_annotations.ndjson"',
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
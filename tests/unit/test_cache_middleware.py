@@ -0,0 +1,150 @@
+"""Unit tests for the response cache middleware."""
+import gzip
+import time
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware.cache_middleware import ResponseCacheMiddleware, cache_response
+from app.utils.cache_utils import TTLCache
+
+
+def make_app():
+    """Create an app with a cacheable and an uncacheable route, counting their calls."""
+    app = FastAPI()
+    app.add_middleware(ResponseCacheMiddleware)
+    app.state.calls = 0
+    app.state.fail = False
+
+    @app.get("/api/ontology/term/{id}")
+    @cache_response(max_age=60)
+    async def get_term(id: str, rows: int = 10, taxon: str = None):
+        app.state.calls += 1
+        return {"goid": id, "rows": rows, "taxon": taxon, "synonyms": ["regulation of signaling"] * 100}
+
+    @app.get("/api/ontology/subset/{id}")
+    @cache_response(max_age=0)
+    async def get_subset(id: str):
+        app.state.calls += 1
+        if app.state.fail:
+            raise ValueError("GOlr timed out")
+        return {"id": id, "version": app.state.calls}
+
+    @app.get("/api/search/{term}")
+    async def search(term: str):
+        app.state.calls += 1
+        return {"term": term}
+
+    return app
+
+
+class TestResponseCacheMiddleware(unittest.TestCase):
+
+    """Test caching responses, and answering conditional requests."""
+
+    def setUp(self):
+        """Create the app, with an empty response cache."""
+        self.cache = TTLCache(100, 1 << 20, 3600, max_stale=3600)
+        patcher = mock.patch("app.middleware.cache_middleware.get_response_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = make_app()
+        self.client = TestClient(self.app)
+
+    def test_cached_route(self):
+        """Test that a cacheable route is computed once, and has an ETag and a max-age."""
+        first = self.client.get("/api/ontology/term/GO:0008150?rows=5")
+        second = self.client.get("/api/ontology/term/GO:0008150?rows=5")
+        self.assertEqual(self.app.state.calls, 1)
+        self.assertEqual((first.headers["x-cache"], second.headers["x-cache"]), ("MISS", "HIT"))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first.headers["etag"], second.headers["etag"])
+        self.assertEqual(second.headers["cache-control"], "public, max-age=60, stale-while-revalidate=3600")
+        self.assertEqual(second.headers["content-type"], "application/json")
+
+    def test_normalised_key(self):
+        """Test that the order of the query parameters does not matter, but their values do."""
+        self.client.get("/api/ontology/term/GO:0008150?rows=5&taxon=NCBITaxon:9606")
+        response = self.client.get("/api/ontology/term/GO:0008150?taxon=NCBITaxon:9606&rows=5")
+        self.assertEqual(response.headers["x-cache"], "HIT")
+        response = self.client.get("/api/ontology/term/GO:0008150?rows=6&taxon=NCBITaxon:9606")
+        self.assertEqual(response.headers["x-cache"], "MISS")
+        self.assertEqual(response.json()["rows"], 6)
+        self.assertEqual(self.app.state.calls, 2)
+
+    def test_conditional_request(self):
+        """Test that a request with the ETag of the response gets a 304, without a body."""
+        etag = self.client.get("/api/ontology/term/GO:0008150").headers["etag"]
+        for if_none_match in [etag, "W/" + etag, '"other", ' + etag, "*"]:
+            response = self.client.get("/api/ontology/term/GO:0008150", headers={"If-None-Match": if_none_match})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response.headers["etag"], etag)
+        response = self.client.get("/api/ontology/term/GO:0008150", headers={"If-None-Match": '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_compressed_variant(self):
+        """Test that the gzip variant is served to the clients accepting it, with an ETag of its own."""
+        identity = self.client.get("/api/ontology/term/GO:0008150", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", identity.headers)
+        with self.client.stream(
+            "GET", "/api/ontology/term/GO:0008150", headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            self.assertEqual(response.headers["content-encoding"], "gzip")
+            self.assertEqual(gzip.decompress(b"".join(response.iter_raw())), identity.content)
+            gzip_etag = response.headers["etag"]
+        self.assertNotEqual(gzip_etag, identity.headers["etag"])
+        headers = {"Accept-Encoding": "gzip", "If-None-Match": identity.headers["etag"]}
+        self.assertEqual(self.client.get("/api/ontology/term/GO:0008150", headers=headers).status_code, 200)
+        headers["If-None-Match"] = gzip_etag
+        self.assertEqual(self.client.get("/api/ontology/term/GO:0008150", headers=headers).status_code, 304)
+
+    def test_stale_while_revalidate(self):
+        """Test that an expired response is served with its age while it is recomputed in the background."""
+        with TestClient(self.app) as client:
+            self.assertEqual(client.get("/api/ontology/subset/goslim_agr").json()["version"], 1)
+            response = client.get("/api/ontology/subset/goslim_agr")
+            self.assertEqual((response.headers["x-cache"], response.json()["version"]), ("STALE", 1))
+            self.assertIn("age", response.headers)
+            self.assertIn("stale-while-revalidate=3600", response.headers["cache-control"])
+            self.wait_for_calls(2)
+
+            # a failing revalidation keeps the stale response
+            self.app.state.fail = True
+            self.assertEqual(client.get("/api/ontology/subset/goslim_agr").json()["version"], 2)
+            self.wait_for_calls(3)
+            response = client.get("/api/ontology/subset/goslim_agr")
+            self.assertEqual((response.status_code, response.json()["version"]), (200, 2))
+        self.assertEqual(self.cache.stats()["stale_hits"], 3)
+
+    def test_max_stale(self):
+        """Test that a response expired for longer than max_stale is recomputed before answering."""
+        self.cache.max_stale = 0
+        self.client.get("/api/ontology/subset/goslim_agr")
+        response = self.client.get("/api/ontology/subset/goslim_agr")
+        self.assertEqual((response.headers["x-cache"], response.json()["version"]), ("MISS", 2))
+        self.assertNotIn("age", response.headers)
+
+    def wait_for_calls(self, calls):
+        """Wait for the background revalidation to call the route."""
+        for _ in range(100):
+            if self.app.state.calls >= calls:
+                # let the revalidation store its response
+                time.sleep(0.05)
+                return
+            time.sleep(0.01)
+        self.fail("the route was not called")
+
+    def test_uncached_route(self):
+        """Test that the routes not marked with cache_response are not cached."""
+        self.client.get("/api/search/shh")
+        response = self.client.get("/api/search/shh")
+        self.assertEqual(self.app.state.calls, 2)
+        self.assertNotIn("etag", response.headers)
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Unit tests for the in-process caches in the cache utils module."""
+import time
+import unittest
+
+from app.utils.cache_utils import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    """Test the LRU+TTL cache."""
+
+    def test_hit_and_miss(self):
+        """Test that cached values are returned and counted."""
+        cache = TTLCache(max_entries=10, max_bytes=1024 * 1024, ttl=60)
+        self.assertIsNone(cache.get("GO:0008150"))
+        cache.set("GO:0008150", "biological_process")
+        self.assertEqual(cache.get("GO:0008150"), "biological_process")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when the cache is full."""
+        cache = TTLCache(max_entries=2, max_bytes=1024 * 1024, ttl=60)
+        cache.set("GO:0008150", "biological_process")
+        cache.set("GO:0003674", "molecular_function")
+        cache.get("GO:0008150")
+        cache.set("GO:0005575", "cellular_component")
+        self.assertEqual(cache.get("GO:0008150"), "biological_process")
+        self.assertIsNone(cache.get("GO:0003674"))
+        self.assertEqual(len(cache), 2)
+
+    def test_memory_cap(self):
+        """Test that the cache stays under its byte limit."""
+        cache = TTLCache(max_entries=1000, max_bytes=2000, ttl=60)
+        for i in range(100):
+            cache.set(i, "x" * 100)
+        self.assertLessEqual(cache.stats()["bytes"], 2000)
+        self.assertLess(len(cache), 100)
+
+    def test_ttl(self):
+        """Test that entries expire after the TTL."""
+        cache = TTLCache(max_entries=10, max_bytes=1024 * 1024, ttl=0.01)
+        cache.set("GO:0008150", "biological_process")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("GO:0008150"))
+
+    def test_stale_entries(self):
+        """Test that expired entries are returned with their age by get_with_age until max_stale, and not by get."""
+        cache = TTLCache(max_entries=10, max_bytes=1024 * 1024, ttl=0.01, max_stale=0.05)
+        cache.set("GO:0008150", "biological_process")
+        value, age, stale = cache.get_with_age("GO:0008150")
+        self.assertEqual((value, stale), ("biological_process", False))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("GO:0008150"))
+        value, age, stale = cache.get_with_age("GO:0008150")
+        self.assertEqual((value, stale), ("biological_process", True))
+        self.assertGreaterEqual(age, 0.02)
+        time.sleep(0.05)
+        self.assertIsNone(cache.get_with_age("GO:0008150"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["stale_hits"]), (1, 1))
+
+    def test_release_invalidation(self):
+        """Test that a new release drops the cached entries."""
+        cache = TTLCache(max_entries=10, max_bytes=1024 * 1024, ttl=60)
+        self.assertFalse(cache.set_release("http://purl.obolibrary.org/obo/go/releases/2023-01-01/go.owl"))
+        cache.set("GO:0008150", "biological_process")
+        self.assertFalse(cache.set_release("http://purl.obolibrary.org/obo/go/releases/2023-01-01/go.owl"))
+        self.assertEqual(cache.get("GO:0008150"), "biological_process")
+        self.assertTrue(cache.set_release("http://purl.obolibrary.org/obo/go/releases/2023-02-01/go.owl"))
+        self.assertIsNone(cache.get("GO:0008150"))
+
+
+if __name__ == "__main__":
+    unittest.main()
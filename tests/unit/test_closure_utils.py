@@ -0,0 +1,103 @@
+"""Unit tests for the ontology closure index."""
+import unittest
+
+from app.utils.closure_utils import OntologyClosureIndex
+
+OBO = "http://purl.obolibrary.org/obo/"
+# biological_process <- metabolic process <- nucleic acid metabolic process <- DNA metabolic process,
+# with a part_of edge from DNA repair to DNA metabolic process
+GRAPH = {
+    "graphs": [
+        {
+            "nodes": [
+                {"id": OBO + "GO_0008150", "lbl": "biological_process", "type": "CLASS"},
+                {"id": OBO + "GO_0008152", "lbl": "metabolic process", "type": "CLASS"},
+                {"id": OBO + "GO_0090304", "lbl": "nucleic acid metabolic process", "type": "CLASS"},
+                {"id": OBO + "GO_0006259", "lbl": "DNA metabolic process", "type": "CLASS"},
+                {"id": OBO + "GO_0046483", "lbl": "heterocycle metabolic process", "type": "CLASS"},
+                {"id": OBO + "GO_0006281", "lbl": "DNA repair", "type": "CLASS"},
+                {"id": OBO + "BFO_0000050", "lbl": "part of", "type": "PROPERTY"},
+            ],
+            "edges": [
+                {"sub": OBO + "GO_0008152", "pred": "is_a", "obj": OBO + "GO_0008150"},
+                {"sub": OBO + "GO_0090304", "pred": "is_a", "obj": OBO + "GO_0008152"},
+                {"sub": OBO + "GO_0046483", "pred": "is_a", "obj": OBO + "GO_0008152"},
+                {"sub": OBO + "GO_0006259", "pred": "is_a", "obj": OBO + "GO_0090304"},
+                {"sub": OBO + "GO_0006281", "pred": OBO + "BFO_0000050", "obj": OBO + "GO_0006259"},
+                {"sub": OBO + "GO_0006281", "pred": OBO + "RO_0002211", "obj": OBO + "GO_0046483"},
+            ],
+        }
+    ]
+}
+
+
+class TestOntologyClosureIndex(unittest.TestCase):
+
+    """Test the closure index built from obographs and from GOlr documents."""
+
+    def setUp(self):
+        """Build the index of the test graph."""
+        self.index = OntologyClosureIndex.from_obographs(GRAPH)
+
+    def test_ancestors(self):
+        """Test that the closure is reflexive and follows is_a and part_of, but no other relation."""
+        self.assertEqual(
+            set(self.index.ancestors("GO:0006281")),
+            {"GO:0006281", "GO:0006259", "GO:0090304", "GO:0008152", "GO:0008150"},
+        )
+        self.assertEqual(self.index.ancestors("GO:0006281")[0], "GO:0006281")
+        self.assertEqual(self.index.label("GO:0006281"), "DNA repair")
+
+    def test_descendants(self):
+        """Test that the descendants exclude the term itself."""
+        self.assertEqual(
+            set(self.index.descendants("GO:0008152")), {"GO:0090304", "GO:0046483", "GO:0006259", "GO:0006281"}
+        )
+        self.assertEqual(self.index.descendants("GO:0006281"), [])
+
+    def test_shared_ancestors(self):
+        """Test the ancestors shared by two terms, with their labels."""
+        shared, labels = self.index.shared_ancestors("GO:0006259", "GO:0046483")
+        self.assertEqual(set(shared), {"GO:0008152", "GO:0008150"})
+        self.assertEqual(labels, [self.index.label(id) for id in shared])
+
+    def test_shared_neighbours(self):
+        """Test the terms directly related to a term, and to both terms."""
+        self.assertTrue(self.index.has_edges)
+        self.assertEqual(self.index.shared_neighbours("GO:0090304", "GO:0046483", "is_a"), ["GO:0008152"])
+        self.assertEqual(self.index.shared_neighbours("GO:0090304", "GO:0046483", "BFO:0000050"), [])
+        self.assertEqual(self.index.direct_neighbours("GO:0006259", "BFO:0000050"), ["GO:0006281"])
+        self.assertEqual(self.index.direct_neighbours("GO:0006259", "is_a"), ["GO:0090304"])
+
+    def test_from_golr_docs(self):
+        """Test that an index built from GOlr documents keeps the GOlr closures and labels."""
+        docs = [
+            {
+                "id": "GO:0006259",
+                "annotation_class_label": "DNA metabolic process",
+                "isa_partof_closure": ["GO:0006259", "GO:0008152", "GO:0008150"],
+                "isa_partof_closure_label": ["DNA metabolic process", "metabolic process", "biological_process"],
+            },
+            {
+                "id": "GO:0046483",
+                "annotation_class_label": "heterocycle metabolic process",
+                "isa_partof_closure": ["GO:0046483", "GO:0008152", "GO:0008150"],
+                "isa_partof_closure_label": [
+                    "heterocycle metabolic process",
+                    "metabolic process",
+                    "biological_process",
+                ],
+            },
+        ]
+        index = OntologyClosureIndex.from_golr_docs(docs)
+        self.assertFalse(index.has_edges)
+        self.assertEqual(index.ancestors("GO:0006259"), ["GO:0006259", "GO:0008152", "GO:0008150"])
+        self.assertEqual(
+            index.shared_ancestors("GO:0006259", "GO:0046483"),
+            (["GO:0008152", "GO:0008150"], ["metabolic process", "biological_process"]),
+        )
+        self.assertEqual(index.descendants("GO:0008150"), ["GO:0006259", "GO:0046483"])
+
+
+if __name__ == "__main__":
+    unittest.main()
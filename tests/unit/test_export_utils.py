@@ -0,0 +1,64 @@
+"""Unit tests for the streaming export utils."""
+import asyncio
+import json
+import unittest
+
+from app.utils import export_utils
+from app.utils.export_utils import stream_export
+
+docs = [
+    {"bioentity": "ZFIN:ZDB-GENE-1", "annotation_class": "GO:0008150", "reference": ["PMID:1", "ZFIN:ZDB-PUB-2"]},
+    {"bioentity": "ZFIN:ZDB-GENE-2", "annotation_class_label": "a\tlabel\nwith breaks"},
+]
+fields = ["bioentity", "annotation_class", "annotation_class_label", "reference"]
+
+
+async def iterate(items):
+    """Turn a list into an async iterator, as returned by iterate_solr_on."""
+    for item in items:
+        yield item
+
+
+def export(items, format):
+    """Collect the chunks of an export."""
+
+    async def collect():
+        return [chunk async for chunk in stream_export(iterate(items), fields, format)]
+
+    return asyncio.run(collect())
+
+
+class TestExportUtils(unittest.TestCase):
+
+    """Test the streaming export."""
+
+    def test_ndjson(self):
+        """Test that every document is a JSON line with the exported fields."""
+        lines = "".join(export(docs, "ndjson")).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["reference"], ["PMID:1", "ZFIN:ZDB-PUB-2"])
+        self.assertIsNone(json.loads(lines[1])["annotation_class"])
+        self.assertEqual(list(json.loads(lines[1])), fields)
+
+    def test_tsv(self):
+        """Test the header row, multivalued cells, missing cells and escaping."""
+        lines = "".join(export(docs, "tsv")).splitlines()
+        self.assertEqual(lines[0].split("\t"), fields)
+        self.assertEqual(lines[1].split("\t"), ["ZFIN:ZDB-GENE-1", "GO:0008150", "", "PMID:1|ZFIN:ZDB-PUB-2"])
+        self.assertEqual(lines[2].split("\t"), ["ZFIN:ZDB-GENE-2", "", "a label with breaks", ""])
+
+    def test_chunks(self):
+        """Test that rows are written in chunks, the TSV header coming with the first one."""
+        original = export_utils.EXPORT_WRITE_SIZE
+        export_utils.EXPORT_WRITE_SIZE = 2
+        try:
+            chunks = export(docs * 2, "tsv")
+        finally:
+            export_utils.EXPORT_WRITE_SIZE = original
+        self.assertEqual([chunk.count("\n") for chunk in chunks], [2, 2, 1])
+        self.assertEqual(export([], "ndjson"), [])
+        self.assertEqual(export([], "tsv"), ["\t".join(fields) + "\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Unit tests for the decoding of GOlr text query responses."""
+import asyncio
+import copy
+import json
+import random
+import unittest
+from unittest import mock
+
+import httpx
+
+from app.utils.golr_utils import _text_docs, gu_run_solr_text_on, run_solr_on
+from app.utils.http_utils import decode_json
+from app.utils.settings import ESOLR, ESOLRDoc
+
+
+def make_text_response(rng, rows: int):
+    """Generate the response of a highlighted GOlr text query on bioentities."""
+    prefixes = ["ZFIN:ZDB-GENE-", "MGI:MGI:", "UniProtKB:P", "FB:FBgn"]
+    docs = []
+    highlighting = {}
+    for i in range(rows):
+        doc_id = prefixes[i % len(prefixes)] + str(i)
+        docs.append(
+            {
+                "id": doc_id,
+                "bioentity_label": "gene%d" % i,
+                "bioentity_name": "protein coding gene %d" % i,
+                "taxon": "NCBITaxon:7955",
+                "taxon_label": "Danio rerio",
+                "type": "protein",
+                "synonym": ["syn%d" % j for j in range(rng.randint(0, 5))],
+            }
+        )
+        if rng.random() < 0.8:
+            highlighting[doc_id] = {"bioentity_label_searchable": ["<em>gene</em>%d" % i]}
+    body = {"response": {"numFound": rows, "docs": docs}, "highlighting": highlighting}
+    return httpx.Response(200, content=json.dumps(body, indent=2).encode())
+
+
+def legacy_text_docs(response, highlight: bool):
+    """Decode a text query response as gu_run_solr_text_on did, parsing the body again for every access."""
+    if highlight:
+        highlight_added = []
+        for doc in response.json()["response"]["docs"]:
+            if doc.get("id") is not None and doc.get("id") in response.json()["highlighting"]:
+                doc["highlighting"] = response.json()["highlighting"][doc["id"]]
+                if doc.get("id").startswith("MGI:"):
+                    doc["id"] = doc["id"].replace("MGI:MGI:", "MGI:")
+            else:
+                doc["highlighting"] = {}
+            highlight_added.append(doc)
+        return highlight_added
+    return_doc = []
+    for doc in response.json()["response"]["docs"]:
+        if doc.get("id") is not None and doc.get("id").startswith("MGI:"):
+            doc["id"] = doc["id"].replace("MGI:MGI:", "MGI:")
+        return_doc.append(doc)
+    return return_doc
+
+
+class TestGolrUtils(unittest.TestCase):
+
+    """Test the decoding of GOlr text query responses."""
+
+    def setUp(self):
+        """Generate a response."""
+        self.response = make_text_response(random.Random(0), 200)  # noqa: S311
+
+    def test_text_docs_without_highlighting(self):
+        """Test that the documents are the ones the legacy decoding returned."""
+        docs = _text_docs(decode_json(self.response), highlight=False)
+        self.assertEqual(docs, legacy_text_docs(self.response, highlight=False))
+        self.assertFalse(any(doc["id"].startswith("MGI:MGI:") for doc in docs))
+
+    def test_text_docs_with_highlighting(self):
+        """Test that the highlighted documents are the ones the legacy decoding returned."""
+        docs = _text_docs(decode_json(self.response), highlight=True)
+        expected = legacy_text_docs(self.response, highlight=True)
+        for doc, legacy_doc in zip(docs, expected, strict=True):
+            self.assertEqual(doc["highlighting"], legacy_doc["highlighting"])
+            # legacy only made the ids of the highlighted documents biolink-style
+            if legacy_doc["highlighting"]:
+                self.assertEqual(doc, legacy_doc)
+            else:
+                self.assertEqual(doc["id"], legacy_doc["id"].replace("MGI:MGI:", "MGI:"))
+
+    def test_text_docs_without_highlighting_section(self):
+        """Test that a response without highlighting gives empty highlights."""
+        results = copy.deepcopy(decode_json(self.response))
+        del results["highlighting"]
+        self.assertTrue(all(doc["highlighting"] == {} for doc in _text_docs(results, highlight=True)))
+
+    def test_invalid_json(self):
+        """Test that a response that is not JSON, e.g. an HTML error page of a proxy, gives None."""
+        response = httpx.Response(200, content=b"<html><body>Bad Gateway</body></html>")
+        with mock.patch("app.utils.golr_utils.fetch", mock.AsyncMock(return_value=response)):
+            self.assertIsNone(asyncio.run(run_solr_on(ESOLR.GOLR, ESOLRDoc.ONTOLOGY, "GO:0008150", "id")))
+            self.assertIsNone(
+                asyncio.run(gu_run_solr_text_on(ESOLR.GOLR, ESOLRDoc.BIOENTITY, "shh", "bioentity", "id", ""))
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
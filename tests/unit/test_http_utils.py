@@ -0,0 +1,94 @@
+"""Unit tests for the coalescing and the escaping of upstream requests in the http utils module."""
+import asyncio
+import unittest
+
+import httpx
+
+from app.utils.http_utils import SingleFlight, requote_url
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    """Test the coalescing of concurrent identical calls."""
+
+    def setUp(self):
+        """Create a SingleFlight and a slow call counting its runs."""
+        self.single_flight = SingleFlight()
+        self.runs = 0
+
+    async def call(self, result="docs", error=None):
+        """Return a result, or raise an error, after a while."""
+        self.runs += 1
+        await asyncio.sleep(0.05)
+        if error is not None:
+            raise error
+        return result
+
+    def test_concurrent_calls_are_coalesced(self):
+        """Test that concurrent calls with the same key share one run, and calls with other keys do not."""
+
+        async def run():
+            return await asyncio.gather(
+                *(self.single_flight.do("q=shh*", self.call) for _ in range(5)),
+                self.single_flight.do("q=bmp*", lambda: self.call("other")),
+            )
+
+        self.assertEqual(asyncio.run(run()), ["docs"] * 5 + ["other"])
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(self.single_flight.stats(), {"calls": 2, "coalesced": 4, "in_flight": 0})
+
+    def test_sequential_calls_are_not_coalesced(self):
+        """Test that a call made after the previous one completed runs again."""
+
+        async def run():
+            await self.single_flight.do("q=shh*", self.call)
+            await self.single_flight.do("q=shh*", self.call)
+
+        asyncio.run(run())
+        self.assertEqual(self.runs, 2)
+
+    def test_errors_are_shared(self):
+        """Test that every caller gets the error of the call."""
+
+        async def run():
+            calls = [self.single_flight.do("q=shh*", lambda: self.call(error=ValueError("timeout"))) for _ in range(3)]
+            return await asyncio.gather(*calls, return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual([str(result) for result in results], ["timeout"] * 3)
+        self.assertEqual(self.runs, 1)
+
+    def test_cancelled_caller(self):
+        """Test that a caller going away does not cancel the call for the others."""
+
+        async def run():
+            first = asyncio.ensure_future(self.single_flight.do("q=shh*", self.call))
+            second = asyncio.ensure_future(self.single_flight.do("q=shh*", self.call))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), "docs")
+        self.assertEqual(self.runs, 1)
+
+
+class TestRequoteUrl(unittest.TestCase):
+
+    """Test the escaping of the URLs built by the solr utils."""
+
+    def test_escapes_are_kept(self):
+        """Test that raw characters are escaped, and the escapes are sent once."""
+        url = requote_url('http://golr/select?q=*:*&fq=document_category:"annotation"&qf=bioentity%5E2&cursorMark=%2A')
+        self.assertEqual(
+            httpx.Request("GET", url).url.raw_path,
+            b"/select?q=*:*&fq=document_category:%22annotation%22&qf=bioentity%5E2&cursorMark=%2A",
+        )
+
+    def test_escaped_url_is_unchanged(self):
+        """Test that a URL with only allowed characters is unchanged."""
+        url = "http://golr/select?q=*:*&fq=bioentity:%22ZFIN%3AZDB-GENE-1%22&sort=id+asc&fl=id,bioentity"
+        self.assertEqual(requote_url(url), url)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Unit tests for the on-disk gene <-> protein identifier index."""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from app.utils.idmapping_index import INDEX_VERSION, build_index, lookup_genes, lookup_proteins, open_index
+
+GPI = """!gpi-version: 2.0
+UniProtKB:Q15465\tSHH\tSHH protein\t\tPR:000000001\tNCBITaxon:9606\t\t\t\tHGNC:10848|NCBIGene:6469\tdb_subset=Swiss-Prot
+UniProtKB:A0A2R8Y5N6\tSHH\tSHH protein\t\tPR:000000001\tNCBITaxon:9606\t\t\t\tHGNC:10848\tdb_subset=TrEMBL
+MGI:98297\tShh\tsonic hedgehog\t\tSO:0000704\tNCBITaxon:10090\t\t\t\tUniProtKB:Q62226|ENSEMBL:ENSMUSG00000002633\t
+"""
+IDMAPPING = """Q15465\tUniProtKB-ID\tSHH_HUMAN
+Q15465\tGeneID\t6469
+Q15465\tEnsembl\tENSG00000164690.9
+Q15465-2\tEnsembl\tENSG00000164690.9
+Q15465\tRefSeq\tNP_000184.1
+A0A2R8Y5N6\tUniProtKB-ID\tA0A2R8Y5N6_HUMAN
+A0A2R8Y5N6\tGeneID\t6469
+A0A2R8Y5N6\tGeneID\t100000001
+"""
+
+
+class TestIdMappingIndex(unittest.TestCase):
+
+    """Test building and querying the identifier index."""
+
+    def setUp(self):
+        """Build an index from a small GPI file and a small UniProt idmapping file."""
+        self.directory = tempfile.TemporaryDirectory()
+        paths = []
+        for name, content in [("test.gpi", GPI), ("HUMAN_9606_idmapping.dat", IDMAPPING)]:
+            paths.append(os.path.join(self.directory.name, name))
+            with open(paths[-1], "w") as f:
+                f.write(content)
+        self.path = os.path.join(self.directory.name, "idmapping.db")
+        self.count = build_index(self.path, paths)
+        self.connection = open_index(self.path, INDEX_VERSION)
+
+    def tearDown(self):
+        """Close and remove the index."""
+        self.connection.close()
+        self.directory.cleanup()
+
+    def test_lookup_proteins(self):
+        """Test that genes are mapped to their Swiss-Prot proteins if any, else to their TrEMBL proteins."""
+        self.assertEqual(self.count, 7)
+        proteins = lookup_proteins(
+            self.connection,
+            ["HGNC:10848", "NCBIGene:6469", "ENSEMBL:ENSG00000164690", "MGI:98297", "NCBIGene:100000001", "HGNC:1"],
+        )
+        self.assertEqual(
+            proteins,
+            {
+                "HGNC:10848": ["UniProtKB:Q15465"],
+                "NCBIGene:6469": ["UniProtKB:Q15465"],
+                "ENSEMBL:ENSG00000164690": ["UniProtKB:Q15465"],
+                "MGI:98297": ["UniProtKB:Q62226"],
+                "NCBIGene:100000001": ["UniProtKB:A0A2R8Y5N6"],
+            },
+        )
+
+    def test_lookup_genes(self):
+        """Test that proteins are mapped to their HGNC gene only."""
+        self.assertEqual(
+            lookup_genes(self.connection, ["UniProtKB:Q15465", "UniProtKB:Q62226"]),
+            {"UniProtKB:Q15465": "HGNC:10848"},
+        )
+
+    def test_outdated_index(self):
+        """Test that an index built with another version of the schema is not opened."""
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA user_version = 1")
+        connection.close()
+        with self.assertRaises(ValueError):
+            open_index(self.path, INDEX_VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
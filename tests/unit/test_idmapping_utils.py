@@ -0,0 +1,37 @@
+"""Unit tests for the MyGene.info identifier mapping."""
+import asyncio
+import unittest
+
+from app.utils.cache_utils import get_idmapping_cache
+from app.utils.idmapping_utils import genes_to_uniprot, uniprot_to_genes
+
+
+class TestIdMapping(unittest.TestCase):
+
+    """Test the batched, cached gene <-> UniProtKB mapping."""
+
+    def test_genes_to_uniprot(self):
+        """Test mapping a batch of genes of different prefixes, including an unknown one."""
+        ids = ["HGNC:10848", "NCBIGene:6469", "HGNC:99999999"]
+        mappings = asyncio.run(genes_to_uniprot(ids))
+        self.assertEqual(list(mappings), ids)
+        self.assertIn("UniProtKB:Q15465", mappings["HGNC:10848"])
+        self.assertIn("UniProtKB:Q15465", mappings["NCBIGene:6469"])
+        self.assertEqual(mappings["HGNC:99999999"], [])
+
+    def test_uniprot_to_genes(self):
+        """Test mapping UniProtKB proteins to HGNC genes."""
+        mappings = asyncio.run(uniprot_to_genes(["UniProtKB:Q15465"]))
+        self.assertEqual(mappings, {"UniProtKB:Q15465": "HGNC:10848"})
+
+    def test_mappings_are_cached(self):
+        """Test that known and unknown identifiers are answered from the cache the second time."""
+        ids = ["HGNC:10848", "HGNC:99999999"]
+        first = asyncio.run(genes_to_uniprot(ids))
+        hits = get_idmapping_cache().stats()["hits"]
+        self.assertEqual(asyncio.run(genes_to_uniprot(ids)), first)
+        self.assertEqual(get_idmapping_cache().stats()["hits"], hits + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -35,6 +35,22 @@ class TestLabelerEndpoint(unittest.TestCase):
         map_response = response.json()
         self.assertEqual(map_response["GO:0003677"], "DNA binding")
 
+    def test_labeler_endpoint_batch(self):
+        """
+        Test the labeler endpoint with several IDs, including an unknown one.
+
+        :return: None
+        """
+        endpoint = "/api/ontol/labeler"
+        data = {"id": ["GO:0008150", "GO:0003677", "FAKE:0000000"]}
+        response = test_client.get(endpoint, params=data)
+        self.assertEqual(response.status_code, 200)
+        map_response = response.json()
+        self.assertEqual(list(map_response.keys()), ["GO:0008150", "GO:0003677", "FAKE:0000000"])
+        self.assertEqual(map_response["GO:0008150"], "biological_process")
+        self.assertEqual(map_response["GO:0003677"], "DNA binding")
+        self.assertIsNone(map_response["FAKE:0000000"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,8 @@
 """Unit tests for the endpoints in the ontology utils module."""
+import asyncio
 import logging
 import unittest
+from unittest import mock
 
 from fastapi.testclient import TestClient
 from ontobio.sparql.sparql_ontology import EagerRemoteSparqlOntology
@@ -26,7 +28,7 @@ class TestOntologyUtils(unittest.TestCase):
 
     def test_go_sparql(self):
         """Test fetching label for a given GO term."""
-        results = ou.goont_fetch_label("GO:0008150")
+        results = asyncio.run(ou.goont_fetch_label("GO:0008150"))
         self.assertEqual(results, "biological_process")
 
     def test_get_ontology(self):
@@ -217,12 +219,53 @@ class TestOntologyUtils(unittest.TestCase):
 
     def test_get_ontology_subsets_by_id(self):
         """Test getting subsets of an ontology by ID."""
-        ribbon_categories = ou.get_ontology_subsets_by_id("goslim_agr")
+        ribbon_categories = asyncio.run(ou.get_ontology_subsets_by_id("goslim_agr"))
         self.assertEqual(len(ribbon_categories), 3)
         for ribbon_category in ribbon_categories:
             if ribbon_category.get("annotation_class") == "GO:0003674":
                 self.assertEqual(len(ribbon_category.get("terms")), 16)
 
+    def test_get_ontology_subsets_by_id_returns_copies(self):
+        """Test that the subsets are served from the registry and that callers can not modify them."""
+        ribbon_categories = asyncio.run(ou.get_ontology_subsets_by_id("goslim_agr"))
+        self.assertIn("goslim_agr", ou.subsets)
+        ribbon_categories[0]["terms"].clear()
+        self.assertEqual(asyncio.run(ou.get_ontology_subsets_by_id("goslim_agr")), ou.subsets["goslim_agr"])
+        self.assertGreater(len(ou.subsets["goslim_agr"][0]["terms"]), 0)
+
+    def test_unknown_subsets_are_not_registered(self):
+        """Test that only the subsets with categories are kept in the registry, up to MAX_SUBSETS of them."""
+        categories = [{"annotation_class": "GO:0003674", "terms": []}]
+        fetch = mock.AsyncMock(side_effect=lambda id: categories if id.startswith("goslim") else [])
+        with (
+            mock.patch.object(ou, "fetch_ontology_subsets_by_id", fetch),
+            mock.patch.object(ou, "subsets", {}),
+            mock.patch.object(ou, "MAX_SUBSETS", 2),
+        ):
+            self.assertEqual(asyncio.run(ou.get_ontology_subsets_by_id("not_a_subset")), [])
+            self.assertNotIn("not_a_subset", ou.subsets)
+            for id in ["goslim_agr", "goslim_generic", "goslim_plant"]:
+                self.assertEqual(asyncio.run(ou.get_ontology_subsets_by_id(id)), categories)
+            self.assertEqual(list(ou.subsets), ["goslim_agr", "goslim_generic"])
+
+            fetch.side_effect = lambda id: [] if id == "goslim_agr" else categories
+            asyncio.run(ou.refresh_ontology_subsets())
+            self.assertEqual(list(ou.subsets), ["goslim_generic"])
+
+    def test_invalid_iris_are_not_queried(self):
+        """Test that CURIEs expanding to invalid IRIs map to None without being sent to SPARQL."""
+        bindings = [
+            {
+                "iri": {"value": "http://purl.obolibrary.org/obo/GO_0003674"},
+                "label": {"value": "molecular_function"},
+            }
+        ]
+        with mock.patch.object(ou, "run_sparql_on", mock.AsyncMock(return_value=bindings)) as run_sparql_on:
+            labels = asyncio.run(ou.batch_fetch_labels(["GO:0003674", "GO:0003674> } <x", "GO:0003674 x"]))
+        self.assertEqual(labels, {"GO:0003674": "molecular_function", "GO:0003674> } <x": None, "GO:0003674 x": None})
+        (query,) = [call.args[0] for call in run_sparql_on.call_args_list]
+        self.assertIn("VALUES ?iri { <http://purl.obolibrary.org/obo/GO_0003674> }", query)
+
     def test_correct_goid(self):
         """Test correcting a GO ID."""
         corrected_id = ou.correct_goid(goid="GO:00012345")
@@ -1,4 +1,5 @@
 """Unit tests for the endpoints in the prefix module."""
+import json
 import logging
 import unittest
 
@@ -51,8 +52,38 @@ class TestIdentifierAPI(unittest.TestCase):
         """
         response = test_client.get("/api/identifier/prefixes")
         self.assertGreater(len(response.json()), 50)
+        self.assertEqual(response.json(), sorted(response.json()))
         self.assertEqual(response.status_code, 200)
 
+    def test_batch_expand(self):
+        """Test expanding a batch of identifiers, one NDJSON line per identifier in request order."""
+        ids = gene_ids + ["NOTAPREFIX:123"]
+        response = test_client.post("/api/identifier/prefixes/expand", json=ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        results = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([result["id"] for result in results], ids)
+        self.assertEqual(results[2]["uri"], results[3]["uri"])
+        self.assertIsNone(results[-1]["uri"])
+        self.assertIsNotNone(results[-1]["error"])
+
+    def test_batch_contract(self):
+        """Test contracting a newline-delimited batch of URIs."""
+        body = "http://purl.obolibrary.org/obo/GO_0008150\nhttp://example.org/unknown/1\n"
+        response = test_client.post(
+            "/api/identifier/prefixes/contract/", content=body, headers={"content-type": "text/plain"}
+        )
+        self.assertEqual(response.status_code, 200)
+        results = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]["id"], "GO:0008150")
+        self.assertIsNone(results[1]["id"])
+
+    def test_batch_expand_invalid_json(self):
+        """Test that a JSON body that is not an array of strings is rejected."""
+        response = test_client.post("/api/identifier/prefixes/expand", json={"id": "GO:0008150"})
+        self.assertEqual(response.status_code, 422)
+
 
 if __name__ == "__main__":
     unittest.main()
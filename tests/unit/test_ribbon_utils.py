@@ -0,0 +1,174 @@
+"""Unit tests for the ribbon aggregation in the ribbon utils module."""
+import json
+import random
+import unittest
+
+from app.utils import ontology_utils
+from app.utils.ribbon_utils import aggregate_ribbon_annotations
+
+EVIDENCE_TYPES = ["EXP", "IDA", "IBA", "IEA", "ISS", "TAS"]
+ASPECTS = {"P": "GO:0008150", "F": "GO:0003674", "C": "GO:0005575"}
+
+
+def make_categories(rng, nb_groups):
+    """Make ribbon categories with All, Term and Other groups, sharing some term ids between categories."""
+    categories = []
+    for aspect_id in ASPECTS.values():
+        groups = [{"id": aspect_id, "label": "all", "type": "All"}]
+        groups += [{"id": "GO:%07d" % rng.randrange(nb_groups * 2), "type": "Term"} for _ in range(nb_groups)]
+        groups.append({"id": aspect_id, "label": "other", "type": "Other"})
+        categories.append({"id": aspect_id, "groups": groups})
+    return categories
+
+
+def make_annotations(rng, categories, nb_annotations):
+    """Make annotations whose regulates_closure hit some of the groups, possibly in another aspect."""
+    group_ids = [group["id"] for category in categories for group in category["groups"]]
+    annotations = []
+    for _ in range(nb_annotations):
+        aspect = rng.choice(list(ASPECTS))
+        closure = ["GO:%07d" % rng.randrange(10**6) for _ in range(rng.randrange(20))]
+        closure += rng.sample(group_ids, rng.randrange(4))
+        if rng.random() < 0.8:
+            closure.append(ASPECTS[aspect])
+        rng.shuffle(closure)
+        annotations.append(
+            {
+                "annotation_class": "GO:%07d" % rng.randrange(200),
+                "evidence_type": rng.choice(EVIDENCE_TYPES),
+                "regulates_closure": closure,
+                "aspect": aspect,
+            }
+        )
+    return annotations
+
+
+def legacy_aggregate_ribbon_annotations(categories, data, cross_aspect):
+    """Aggregate the annotations of one subject the way the ribbon endpoint did before the ribbon utils."""
+    entity = {"groups": {}, "nb_classes": 0, "nb_annotations": 0, "terms": set()}
+    for annot in data:
+        aspect = ontology_utils.aspect_map[annot["aspect"]]
+        found = False
+        for cat in categories:
+            for gp in cat["groups"]:
+                group = gp["id"]
+                if gp["type"] == "Other":
+                    continue
+                if cross_aspect or cat["id"] == aspect:
+                    if group in annot["regulates_closure"]:
+                        found = True
+                        break
+        if found:
+            entity["terms"].add(annot["annotation_class"])
+            entity["nb_annotations"] += 1
+
+    for cat in categories:
+        for gp in cat["groups"]:
+            group = gp["id"]
+            if gp["type"] == "Other":
+                continue
+            for annot in data:
+                aspect = ontology_utils.aspect_map[annot["aspect"]]
+                if cross_aspect or cat["id"] == aspect:
+                    if group in annot["regulates_closure"]:
+                        if group not in entity["groups"]:
+                            entity["groups"][group] = {}
+                            entity["groups"][group]["ALL"] = {"terms": set(), "nb_classes": 0, "nb_annotations": 0}
+                        if annot["evidence_type"] not in entity["groups"][group]:
+                            entity["groups"][group][annot["evidence_type"]] = {
+                                "terms": set(),
+                                "nb_classes": 0,
+                                "nb_annotations": 0,
+                            }
+                        entity["groups"][group][annot["evidence_type"]]["terms"].add(annot["annotation_class"])
+                        entity["groups"][group][annot["evidence_type"]]["nb_annotations"] += 1
+                        entity["groups"][group]["ALL"]["terms"].add(annot["annotation_class"])
+                        entity["groups"][group]["ALL"]["nb_annotations"] += 1
+
+        terms = [term["id"] for term in ontology_utils.get_category_terms(cat)]
+        other = {"ALL": {"terms": set(), "nb_classes": 0, "nb_annotations": 0}}
+        for annot in data:
+            aspect = ontology_utils.aspect_map[annot["aspect"]]
+            if cross_aspect or cat["id"] == aspect:
+                found = False
+                for term in terms:
+                    if term in annot["regulates_closure"]:
+                        found = True
+                        break
+                if not found:
+                    other["ALL"]["nb_annotations"] += 1
+                    other["ALL"]["terms"].add(annot["annotation_class"])
+                    if annot["evidence_type"] not in other:
+                        other[annot["evidence_type"]] = {"terms": set(), "nb_classes": 0, "nb_annotations": 0}
+                    other[annot["evidence_type"]]["nb_annotations"] += 1
+                    other[annot["evidence_type"]]["terms"].add(annot["annotation_class"])
+        entity["groups"][cat["id"] + "-other"] = other
+
+    for group in entity["groups"]:
+        for subgroup in entity["groups"][group]:
+            entity["groups"][group][subgroup]["nb_classes"] = len(entity["groups"][group][subgroup]["terms"])
+            if "-other" not in group:
+                del entity["groups"][group][subgroup]["terms"]
+            else:
+                entity["groups"][group][subgroup]["terms"] = list(entity["groups"][group][subgroup]["terms"])
+
+    entity["nb_classes"] = len(entity["terms"])
+    del entity["terms"]
+    return entity
+
+
+class TestRibbonAggregation(unittest.TestCase):
+
+    """Test that the ribbon aggregation matches the original implementation."""
+
+    def test_identical_to_legacy(self):
+        """Test that groups, Other buckets and counts are identical, including the order of the keys."""
+        rng = random.Random(42)  # noqa: S311
+        for nb_groups, nb_annotations in [(0, 10), (1, 0), (5, 50), (20, 500), (50, 2000)]:
+            categories = make_categories(rng, nb_groups)
+            annotations = make_annotations(rng, categories, nb_annotations)
+            for cross_aspect in (False, True):
+                expected = legacy_aggregate_ribbon_annotations(categories, annotations, cross_aspect)
+                actual = aggregate_ribbon_annotations(categories, annotations, cross_aspect)
+                self.assertEqual(json.dumps(actual), json.dumps(expected))
+
+    def test_counts(self):
+        """Test the counts of a small, hand-made subject."""
+        categories = [
+            {
+                "id": "GO:0008150",
+                "groups": [
+                    {"id": "GO:0008150", "type": "All"},
+                    {"id": "GO:0006259", "type": "Term"},
+                    {"id": "GO:0008150", "type": "Other"},
+                ],
+            }
+        ]
+        annotations = [
+            {
+                "annotation_class": "GO:0006281",
+                "evidence_type": "IDA",
+                "regulates_closure": ["GO:0006281", "GO:0006259", "GO:0008150"],
+                "aspect": "P",
+            },
+            {
+                "annotation_class": "GO:0007165",
+                "evidence_type": "IEA",
+                "regulates_closure": ["GO:0007165", "GO:0008150"],
+                "aspect": "P",
+            },
+            {"annotation_class": "GO:0005634", "evidence_type": "IDA", "regulates_closure": [], "aspect": "C"},
+        ]
+        result = aggregate_ribbon_annotations(categories, annotations)
+        self.assertEqual(result["nb_annotations"], 2)
+        self.assertEqual(result["nb_classes"], 2)
+        self.assertEqual(list(result["groups"]), ["GO:0008150", "GO:0006259", "GO:0008150-other"])
+        self.assertEqual(
+            result["groups"]["GO:0006259"],
+            {"ALL": {"nb_classes": 1, "nb_annotations": 1}, "IDA": {"nb_classes": 1, "nb_annotations": 1}},
+        )
+        self.assertEqual(result["groups"]["GO:0008150-other"]["ALL"]["terms"], ["GO:0007165"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Unit tests for the upstream result cache shared by the workers of a host."""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+from app.utils.http_utils import fetch
+from app.utils.shared_cache import SQLiteCache, get_shared_cache, set_shared_release, shared_get, shared_set
+
+
+class FakeClient:
+
+    """An upstream client counting its requests, answering with a status code."""
+
+    def __init__(self, status_code=200):
+        """Create a client that made no request yet."""
+        self.status_code = status_code
+        self.requests = 0
+
+    async def request(self, method, url, **kwargs):
+        """Answer a request with the URL as body."""
+        self.requests += 1
+        return httpx.Response(self.status_code, content=url.encode(), request=httpx.Request(method, url))
+
+
+class TestSharedCache(unittest.TestCase):
+
+    """Test the SQLite cache, and the upstream requests going through it."""
+
+    def setUp(self):
+        """Open a cache in a temporary file."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "shared.db")
+        self.cache = SQLiteCache(self.path, 1 << 20)
+        config = {"database": self.path, "redis_url": None, "max_bytes": 1 << 20, "ttl": {"solr_url": 60}}
+        for patcher in [
+            mock.patch("app.utils.shared_cache.get_shared_cache", return_value=self.cache),
+            mock.patch("app.utils.shared_cache.get_shared_cache_config", return_value=config),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Remove the cache."""
+        self.directory.cleanup()
+
+    def test_shared_between_processes(self):
+        """Test that a value written by one connection (worker) is read by another, until it expires."""
+        self.cache.set("solr_url:a", b"docs", ex=60)
+        self.cache.set("solr_url:b", b"stale", ex=-1)
+        other = SQLiteCache(self.path, 1 << 20)
+        self.assertEqual(other.get("solr_url:a"), b"docs")
+        self.assertIsNone(other.get("solr_url:b"))
+        self.assertEqual(other.delete("solr_url:a", "solr_url:c"), 1)
+        self.assertIsNone(self.cache.get("solr_url:a"))
+        self.assertEqual(other.stats()["hits"], 1)
+
+    def test_eviction(self):
+        """Test that the entries expiring first are evicted once the cache is over max_bytes."""
+        self.cache.max_bytes = 256 * 1024
+        self.cache.set("release", b"2024-01-01")
+        with (
+            mock.patch("app.utils.shared_cache.PURGE_INTERVAL", 10),
+            mock.patch("app.utils.shared_cache.EVICTION_BATCH_SIZE", 10),
+        ):
+            for i in range(200):
+                self.cache.set("solr_url:{}".format(i), os.urandom(4096), ex=60 + i)
+        self.assertLessEqual(self.cache.stats()["bytes"], self.cache.max_bytes)
+        self.assertIsNone(self.cache.get("solr_url:0"))
+        self.assertIsNotNone(self.cache.get("solr_url:199"))
+        self.assertEqual(self.cache.get("release"), b"2024-01-01")
+
+    def test_busy(self):
+        """Test that a write lock held by another worker skips the writes without waiting, and not the reads."""
+        self.cache.set("solr_url:a", b"docs")
+        other = sqlite3.connect(self.path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            start = time.monotonic()
+            shared_set("solr_url", "solr_url:b", b"docs")
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual(shared_get("solr_url", "solr_url:a"), b"docs")
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        self.assertEqual(shared_get("solr_url", "solr_url:a"), b"docs")
+        self.assertIsNone(shared_get("solr_url", "solr_url:b"))
+
+    def test_open_error(self):
+        """Test that a cache that could not be opened is a miss, and is opened again on the next use."""
+        error = sqlite3.OperationalError("database is locked")
+        with (
+            mock.patch("app.utils.shared_cache.get_shared_cache", get_shared_cache),
+            mock.patch("app.utils.shared_cache.shared_cache", None),
+            mock.patch("app.utils.shared_cache.SQLiteCache", side_effect=[error, self.cache]),
+        ):
+            self.assertIsNone(shared_get("solr_url", "solr_url:a"))
+            self.cache.set("solr_url:a", b"docs")
+            self.assertEqual(shared_get("solr_url", "solr_url:a"), b"docs")
+
+    def test_release(self):
+        """Test that the cache is flushed when the release changes, once."""
+        self.assertFalse(set_shared_release("2024-01-01"))
+        self.cache.set("solr_url:a", b"docs")
+        self.assertFalse(set_shared_release("2024-01-01"))
+        self.assertEqual(self.cache.get("solr_url:a"), b"docs")
+        self.assertTrue(set_shared_release("2024-02-01"))
+        self.assertFalse(set_shared_release("2024-02-01"))
+        self.assertIsNone(self.cache.get("solr_url:a"))
+
+    def test_fetch(self):
+        """Test that the 200 responses of a cached service are fetched once, the others and unshared ones every time."""
+        client = FakeClient()
+        with mock.patch("app.utils.http_utils.get_async_client", return_value=client):
+            for _ in range(3):
+                response = asyncio.run(fetch("solr_url", "GET", "http://golr/select?q=shh"))
+                self.assertEqual(response.content, b"http://golr/select?q=shh")
+                response.raise_for_status()
+            self.assertEqual(client.requests, 1)
+            for _ in range(2):
+                asyncio.run(fetch("sparql_url", "POST", "http://rdf/sparql", data={"query": "ASK {}"}))
+            self.assertEqual(client.requests, 3)
+            client.status_code = 503
+            for _ in range(2):
+                asyncio.run(fetch("solr_url", "GET", "http://golr/select?q=bmp"))
+            self.assertEqual(client.requests, 5)
+            # the pages of a cursor walk are not cached
+            client.status_code = 200
+            for _ in range(2):
+                asyncio.run(fetch("solr_url", "GET", "http://golr/select?q=*:*&cursorMark=*", shared=False))
+            self.assertEqual(client.requests, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 """Unit tests for the endpoints in the slimmer module."""
+import json
 import logging
 import unittest
 from pprint import pprint
+from unittest import mock
 
 from fastapi.testclient import TestClient
 
@@ -99,6 +101,51 @@ class TestSlimmerEndpoint(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertGreater(len(response.json()), 0)
 
+    def test_post_slimmer_endpoint(self):
+        """Test the bulk slimmer endpoint: one NDJSON line per subject, in request order."""
+        endpoint = "/api/bioentityset/slimmer/function"
+        subjects = ["ZFIN:ZDB-GENE-980526-388", "MGI:MGI:3588192", "ZFIN:ZDB-GENE-980526-388"]
+        data = {"subject": subjects, "slim": ["GO:0003674", "GO:0008150", "GO:0005575"]}
+        response = test_client.post(endpoint, json=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([line["subject"] for line in lines], subjects)
+        for line in lines:
+            self.assertIsNone(line["error"])
+            for result in line["results"]:
+                self.assertIn(result["slim"], data["slim"])
+                self.assertTrue(result["assocs"])
+
+    def test_post_slimmer_endpoint_errors(self):
+        """Test that failing subjects, and failing mappings of a chunk, get error lines instead of ending the stream."""
+        endpoint = "/api/bioentityset/slimmer/function"
+        subjects = ["ZFIN:ZDB-GENE-980526-388", "MGI:MGI:3588192"]
+        data = {"subject": subjects, "slim": ["GO:0003674"]}
+
+        async def map2slim(subjects, slim, **kwargs):
+            if subjects == ["ZFIN:ZDB-GENE-980526-388"]:
+                raise KeyError("annotation_class")
+            return []
+
+        with mock.patch("app.routers.slimmer.map2slim", map2slim):
+            response = test_client.post(endpoint, json=data)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([line["subject"] for line in lines], subjects)
+        self.assertTrue(lines[0]["error"].startswith("Slimming failed"))
+        self.assertIsNone(lines[1]["error"])
+
+        with mock.patch("app.routers.slimmer.genes_to_uniprot", mock.AsyncMock(side_effect=ValueError("MyGene"))):
+            response = test_client.post(endpoint, json=data)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([line["subject"] for line in lines], subjects)
+        self.assertTrue(all(line["error"].startswith("Gene mapping failed") for line in lines))
+
+    def test_post_slimmer_endpoint_requires_subjects(self):
+        """Test that the bulk slimmer endpoint validates its body."""
+        response = test_client.post("/api/bioentityset/slimmer/function", json={"slim": ["GO:0003674"]})
+        self.assertEqual(response.status_code, 422)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,117 @@
+"""Unit tests for the local map2slim engine."""
+import copy
+import json
+import random
+import unittest
+from unittest import mock
+
+import pysolr
+from ontobio.golr.golr_associations import map2slim as ontobio_map2slim
+
+from app.utils.closure_utils import OntologyClosureIndex
+from app.utils.slimmer_utils import slim_associations
+
+
+def make_terms(rng, nb_terms: int):
+    """Generate GO terms with random is_a/part_of and regulates closures (regulates including is_a/part_of)."""
+    closures = {}
+    for i in range(nb_terms):
+        term = "GO:%07d" % i
+        ancestors = ["GO:%07d" % j for j in sorted(rng.sample(range(i), min(i, rng.randint(0, 8))))]
+        isa_partof = [term, *ancestors]
+        regulates = isa_partof + ["GO:%07d" % j for j in rng.sample(range(nb_terms), 2) if j != i]
+        closures[term] = (isa_partof, list(dict.fromkeys(regulates)))
+    return closures
+
+
+def make_docs(rng, closures, nb_subjects: int, nb_docs: int):
+    """Generate GOlr annotation documents for subjects of a few id spaces."""
+    prefixes = ["ZFIN:ZDB-GENE-", "MGI:MGI:", "UniProtKB:P", "FB:FBgn"]
+    terms = list(closures)
+    docs = []
+    for i in range(nb_docs):
+        subject = prefixes[i % nb_subjects % len(prefixes)] + str(i % nb_subjects)
+        term = rng.choice(terms)
+        evidence = rng.choice(["IDA", "IEA", "ISS", "IMP"])
+        docs.append(
+            {
+                "id": "doc-%d" % i,
+                "bioentity": subject,
+                "bioentity_label": "gene %d" % (i % nb_subjects),
+                "taxon": "NCBITaxon:7955",
+                "taxon_label": "Danio rerio",
+                "qualifier": rng.choice([["enables"], ["involved_in"], ["NOT", "involved_in"]]),
+                "annotation_class": term,
+                "annotation_class_label": "term " + term,
+                "aspect": rng.choice("FPC"),
+                "assigned_by": "ZFIN",
+                "reference": ["PMID:%d" % rng.randint(1, 1000)],
+                "evidence_type": evidence,
+                "evidence_subset_closure": ["ECO:0000501"] if evidence == "IEA" else ["ECO:0000314"],
+                "isa_partof_closure": closures[term][0],
+                "regulates_closure": closures[term][1],
+            }
+        )
+    return docs
+
+
+def ontobio_slim(docs, slim, subjects, relationship_type):
+    """Run ontobio's map2slim on documents (which it modifies) served by a mocked GOlr."""
+    results = pysolr.Results({"response": {"docs": docs, "numFound": len(docs)}})
+    with mock.patch.object(pysolr.Solr, "search", return_value=results):
+        return ontobio_map2slim(
+            subjects=subjects,
+            slim=slim,
+            object_category="function",
+            url="http://localhost/solr/",
+            relationship_type=relationship_type,
+            rows=-1,
+        )
+
+
+class TestSlimmerUtils(unittest.TestCase):
+
+    """Test the local map2slim engine."""
+
+    def setUp(self):
+        """Generate an ontology, annotations and a slim."""
+        self.rng = random.Random(0)  # noqa: S311
+        self.closures = make_terms(self.rng, 300)
+        self.docs = make_docs(self.rng, self.closures, 20, 1000)
+        self.slim = self.rng.sample(list(self.closures), 30)
+        self.subjects = sorted({doc["bioentity"] for doc in self.docs})
+
+    def test_slim_associations_matches_ontobio(self):
+        """Test that the local engine returns what ontobio's map2slim returns, for both relationship types."""
+        for relationship_type in ["acts_upstream_of_or_within", "involved_in"]:
+            expected = ontobio_slim(copy.deepcopy(self.docs), self.slim, self.subjects, relationship_type)
+            results = slim_associations(copy.deepcopy(self.docs), self.slim, relationship_type)
+            self.assertGreater(len(results), 0)
+            self.assertEqual(json.dumps(results), json.dumps(expected))
+
+    def test_slim_associations_with_closure_index(self):
+        """Test that the is_a/part_of closures can come from the closure index instead of the documents."""
+        index = OntologyClosureIndex.from_golr_docs(
+            {"id": term, "isa_partof_closure": isa_partof} for term, (isa_partof, _) in self.closures.items()
+        )
+        expected = ontobio_slim(copy.deepcopy(self.docs), self.slim, self.subjects, "involved_in")
+        docs = copy.deepcopy(self.docs)
+        for doc in docs:
+            del doc["isa_partof_closure"]
+        results = slim_associations(docs, self.slim, "involved_in", index)
+        self.assertEqual(json.dumps(results), json.dumps(expected))
+
+    def test_slim_associations_format(self):
+        """Test the subject, slim and association fields of the results."""
+        results = slim_associations(copy.deepcopy(self.docs), self.slim)
+        for result in results:
+            self.assertIn(result["slim"], self.slim)
+            self.assertFalse(result["subject"].startswith("MGI:MGI:"))
+            for association in result["assocs"]:
+                self.assertEqual(association["subject"]["id"], result["subject"])
+                self.assertIn(result["slim"], association["slim"])
+                self.assertNotIn("object_closure", association)
+
+
+if __name__ == "__main__":
+    unittest.main()